@@ -7,13 +7,28 @@ This is the main entry point for the backend server.
 """
 
 import os
-from flask import Flask, send_from_directory
+import click
+from flask import Flask, Response, send_from_directory
 from flask_cors import CORS
 
 # Import route blueprints
 from routes.report import report_bp
 from routes.template import template_bp
 from routes.export import export_bp
+from routes.blob import blob_bp
+
+from services.autosave import AutosaveWriter
+from services.batch_export import prepare_batch, stream_batch
+from services.blob_store import BlobStore
+from services.catalog import DraftCatalog, TemplateCatalog
+from services.export_jobs import ExportJobManager
+from services.image_processing import ImageProcessor
+from services.metrics import CONTENT_TYPE, Metrics
+from services.render_cache import RenderCache
+from services.renderer import PdfRenderer, renderer_version
+from services.report_html import ReportHtmlRenderer, load_report_template
+from services.response_cache import FileResponseCache
+from services.storage import STORAGE_FORMATS, migrate_directory
 
 
 def create_app():
@@ -28,20 +43,131 @@ def create_app():
     app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
     
     # Data storage directory
-    app.config['DATA_DIR'] = os.path.join(os.path.dirname(__file__), 'data')
+    app.config['DATA_DIR'] = os.environ.get('DATA_DIR') or os.path.join(os.path.dirname(__file__), 'data')
     app.config['DRAFTS_DIR'] = os.path.join(app.config['DATA_DIR'], 'drafts')
     app.config['TEMPLATES_DIR'] = os.path.join(app.config['DATA_DIR'], 'templates')
     app.config['UPLOADS_DIR'] = os.path.join(app.config['DATA_DIR'], 'uploads')
+    app.config['BLOBS_DIR'] = os.path.join(app.config['UPLOADS_DIR'], 'blobs')
+    app.config['IMAGE_CACHE_DIR'] = os.path.join(app.config['UPLOADS_DIR'], 'variants')
+    app.config['EXPORTS_DIR'] = os.path.join(app.config['DATA_DIR'], 'exports')
+    app.config['RENDER_CACHE_DIR'] = os.path.join(app.config['DATA_DIR'], 'render_cache')
+    app.config['FONT_CACHE_DIR'] = os.path.join(app.config['DATA_DIR'], 'font_cache')
+    app.config['DRAFT_INDEX_PATH'] = os.path.join(app.config['DATA_DIR'], 'draft_index.sqlite3')
+    app.config['TEMPLATE_INDEX_PATH'] = os.path.join(app.config['DATA_DIR'], 'template_index.sqlite3')
+    
+    # On-disk format of drafts and templates: json-pretty, json, gzip or zstd
+    app.config['STORAGE_FORMAT'] = os.environ.get('STORAGE_FORMAT', 'json')
+    
+    # Number of default/applied template responses kept serialized in memory
+    app.config['TEMPLATE_CACHE_SIZE'] = int(os.environ.get('TEMPLATE_CACHE_SIZE', '32'))
+    
+    # Background PDF export: worker processes, queue bound, result lifetime (s)
+    app.config['EXPORT_WORKERS'] = int(os.environ.get('EXPORT_WORKERS', min(4, os.cpu_count() or 1)))
+    app.config['EXPORT_MAX_PENDING'] = int(os.environ.get('EXPORT_MAX_PENDING', '16'))
+    app.config['EXPORT_JOB_TTL'] = int(os.environ.get('EXPORT_JOB_TTL', '600'))
+    
+    # Load WeasyPrint, fonts and stylesheets at start-up instead of on first export
+    app.config['RENDERER_WARMUP'] = os.environ.get('RENDERER_WARMUP', '0') == '1'
+    # Font files (.ttf/.otf/.ttc) registered for exports; empty falls back to system fonts
+    app.config['FONTS_DIR'] = os.environ.get('FONTS_DIR') or os.path.join(os.path.dirname(__file__), 'fonts')
+    # Size cap of the rendered PDF cache
+    app.config['RENDER_CACHE_MAX_BYTES'] = int(os.environ.get('RENDER_CACHE_MAX_MB', '256')) * 1024 * 1024
+    
+    # Uploaded report images: print resolution, default printed box (mm), thumbnail size
+    app.config['IMAGE_PRINT_DPI'] = int(os.environ.get('IMAGE_PRINT_DPI', '200'))
+    app.config['IMAGE_BOX_MM'] = (
+        float(os.environ.get('IMAGE_BOX_WIDTH_MM', '60')),
+        float(os.environ.get('IMAGE_BOX_HEIGHT_MM', '60'))
+    )
+    app.config['IMAGE_THUMBNAIL_PX'] = int(os.environ.get('IMAGE_THUMBNAIL_PX', '320'))
+    
+    # Seconds between disk flushes of the same autosaved draft (0 = write-through)
+    app.config['AUTOSAVE_FLUSH_INTERVAL'] = float(os.environ.get('AUTOSAVE_FLUSH_INTERVAL', '2.0'))
+    # Number of recently used drafts kept parsed in memory for delta updates
+    app.config['DRAFT_CACHE_SIZE'] = int(os.environ.get('DRAFT_CACHE_SIZE', '32'))
     
     # Create directories if they don't exist
     for dir_path in [app.config['DATA_DIR'], app.config['DRAFTS_DIR'], 
                      app.config['TEMPLATES_DIR'], app.config['UPLOADS_DIR']]:
         os.makedirs(dir_path, exist_ok=True)
     
+    # Metadata indexes used by the draft and custom template listings
+    app.extensions['draft_catalog'] = DraftCatalog(
+        app.config['DRAFT_INDEX_PATH'], app.config['DRAFTS_DIR']
+    )
+    app.extensions['template_catalog'] = TemplateCatalog(
+        app.config['TEMPLATE_INDEX_PATH'], app.config['TEMPLATES_DIR']
+    )
+    
+    # Pre-serialized default and applied templates
+    app.extensions['template_cache'] = FileResponseCache(app.config['TEMPLATE_CACHE_SIZE'])
+    
+    # Coalescing writer for drafts and autosaves
+    app.extensions['autosave_writer'] = AutosaveWriter(
+        app.config['DRAFTS_DIR'],
+        app.extensions['draft_catalog'],
+        interval=app.config['AUTOSAVE_FLUSH_INTERVAL'],
+        cache_size=app.config['DRAFT_CACHE_SIZE'],
+        storage_format=app.config['STORAGE_FORMAT']
+    )
+    
+    # Content-addressed image storage
+    app.extensions['blob_store'] = BlobStore(app.config['BLOBS_DIR'])
+    
+    # Downsampled print images and editor thumbnails
+    app.extensions['image_processor'] = ImageProcessor(
+        app.extensions['blob_store'],
+        app.config['IMAGE_CACHE_DIR'],
+        dpi=app.config['IMAGE_PRINT_DPI'],
+        box_mm=app.config['IMAGE_BOX_MM'],
+        thumbnail_px=app.config['IMAGE_THUMBNAIL_PX']
+    )
+    
+    # Shared PDF renderer
+    renderer = PdfRenderer(
+        app.config['BLOBS_DIR'],
+        fonts_dir=app.config['FONTS_DIR'],
+        font_cache_dir=app.config['FONT_CACHE_DIR']
+    )
+    app.extensions['renderer'] = renderer
+    if app.config['RENDERER_WARMUP']:
+        try:
+            renderer.warm_up()
+            app.logger.info(f"PDF renderer warmed up in {renderer.stats['warmupMs']} ms")
+        except Exception as e:
+            app.logger.warning(f"PDF renderer warm-up failed: {e}")
+    
+    # Report HTML rendered from draft JSON (templates compiled once here)
+    app.extensions['report_html'] = ReportHtmlRenderer()
+    
+    # Rendered PDFs, reused for identical preview/export requests
+    app.extensions['render_cache'] = RenderCache(
+        app.config['RENDER_CACHE_DIR'],
+        app.config['RENDER_CACHE_MAX_BYTES'],
+        renderer_version()
+    )
+    
+    # Asynchronous PDF export jobs
+    app.extensions['export_jobs'] = ExportJobManager(
+        app.config['EXPORTS_DIR'],
+        max_workers=app.config['EXPORT_WORKERS'],
+        max_pending=app.config['EXPORT_MAX_PENDING'],
+        ttl=app.config['EXPORT_JOB_TTL'],
+        blobs_dir=app.config['BLOBS_DIR'],
+        fonts_dir=app.config['FONTS_DIR'],
+        font_cache_dir=app.config['FONT_CACHE_DIR']
+    )
+    
+    # Route latency and export phase metrics, served at /api/metrics
+    metrics = Metrics()
+    metrics.init_app(app)
+    app.extensions['metrics'] = metrics
+    
     # Register blueprints
     app.register_blueprint(report_bp, url_prefix='/api/report')
     app.register_blueprint(template_bp, url_prefix='/api/template')
     app.register_blueprint(export_bp, url_prefix='/api/export')
+    app.register_blueprint(blob_bp, url_prefix='/api/blobs')
     
     # Serve frontend static files
     @app.route('/')
@@ -59,9 +185,104 @@ def create_app():
     def health_check():
         return {'status': 'ok', 'version': '1.0.0'}
     
+    # Prometheus scrape endpoint: route latency and export phase metrics
+    @app.route('/api/metrics')
+    def metrics_endpoint():
+        return Response(app.extensions['metrics'].render(), content_type=CONTENT_TYPE)
+    
+    # CLI: flask --app app rebuild-draft-index
+    @app.cli.command('rebuild-draft-index')
+    def rebuild_draft_index():
+        """Rebuild the draft catalog after drafts were edited by hand."""
+        count = app.extensions['draft_catalog'].rebuild()
+        click.echo(f'Indexed {count} draft(s) from {app.config["DRAFTS_DIR"]}')
+    
+    # CLI: flask --app app rebuild-template-index
+    @app.cli.command('rebuild-template-index')
+    def rebuild_template_index():
+        """Rebuild the custom template catalog after templates were edited by hand."""
+        count = app.extensions['template_catalog'].rebuild()
+        click.echo(f'Indexed {count} custom template(s) from {app.config["TEMPLATES_DIR"]}')
+    
+    # CLI: flask --app app clear-render-cache
+    @app.cli.command('clear-render-cache')
+    def clear_render_cache():
+        """Delete all cached PDF renders."""
+        cache = app.extensions['render_cache']
+        entries = cache.stats()['entries']
+        cache.clear()
+        click.echo(f"Removed {entries} cached render(s)")
+    
+    # CLI: flask --app app export-batch <draft id>... -o reports.zip
+    @app.cli.command('export-batch')
+    @click.argument('draft_ids', nargs=-1, required=True)
+    @click.option('--output', '-o', default='reports.zip', show_default=True,
+                  help='ZIP file to write.')
+    @click.option('--html-dir', default=None,
+                  help='Directory with pre-rendered HTML as <draft id>.html; '
+                       'other drafts are rendered from their JSON.')
+    @click.option('--template-id', default=None,
+                  help='Custom template to render with (defaults to the applied template).')
+    @click.option('--base-url', default='http://localhost/', show_default=True,
+                  help='Base URL for relative links in the HTML.')
+    def export_batch(draft_ids, output, html_dir, template_id, base_url):
+        """Render drafts to PDF in parallel and write them to a ZIP."""
+        html_by_id = {}
+        for draft_id in draft_ids:
+            html_path = os.path.join(html_dir, f'{draft_id}.html') if html_dir else None
+            if html_path and os.path.exists(html_path):
+                with open(html_path, 'r', encoding='utf-8') as f:
+                    html_by_id[draft_id] = f.read()
+        
+        def render_html(draft):
+            template = load_report_template(
+                app.config['TEMPLATES_DIR'], draft.get('templateType') or 'general', template_id
+            )
+            return app.extensions['report_html'].render(draft, template)
+        
+        items = prepare_batch(draft_ids, app.config['DRAFTS_DIR'], html_by_id, render_html)
+        chunks = stream_batch(
+            app.extensions['export_jobs'],
+            items,
+            base_url=base_url,
+            blobs_dir=app.config['BLOBS_DIR']
+        )
+        with open(output, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+        
+        for item in items:
+            status = 'ok' if item['error'] is None else f"FAILED: {item['error']}"
+            click.echo(f"{item['id']}: {status}")
+        failed = sum(1 for item in items if item['error'] is not None)
+        click.echo(f"Wrote {len(items) - failed} PDF(s) to {output}, {failed} failed")
+    
+    # CLI: flask --app app migrate-storage --format gzip
+    @app.cli.command('migrate-storage')
+    @click.option('--format', 'fmt', type=click.Choice(STORAGE_FORMATS),
+                  default=None, help='Target format (defaults to STORAGE_FORMAT).')
+    @click.option('--dry-run', is_flag=True, help='Only measure, do not rewrite files.')
+    def migrate_storage(fmt, dry_run):
+        """Convert stored drafts and templates to another on-disk format.
+
+        Stop the server first so no writes race with the migration.
+        """
+        fmt = fmt or app.config['STORAGE_FORMAT']
+        for label, directory in [('drafts', app.config['DRAFTS_DIR']),
+                                 ('templates', app.config['TEMPLATES_DIR'])]:
+            stats = migrate_directory(directory, fmt, dry_run=dry_run)
+            click.echo(
+                f"{label}: {stats['files']} file(s), {stats['converted']} converted, "
+                f"{stats['errors']} error(s); "
+                f"{stats['bytesBefore']:,} -> {stats['bytesAfter']:,} bytes; "
+                f"parse {stats['parseMsBefore']} -> {stats['parseMsAfter']} ms/file"
+            )
+    
     return app
 
 
 if __name__ == '__main__':
     app = create_app()
+    # Only the serving process cleans up export results of earlier runs
+    app.extensions['export_jobs'].remove_orphans()
     app.run(debug=True, host='127.0.0.1', port=5000)
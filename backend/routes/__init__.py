@@ -7,5 +7,6 @@ Routes package initialization
 from .report import report_bp
 from .template import template_bp
 from .export import export_bp
+from .blob import blob_bp
 
-__all__ = ['report_bp', 'template_bp', 'export_bp']
+__all__ = ['report_bp', 'template_bp', 'export_bp', 'blob_bp']
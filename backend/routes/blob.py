@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Blob Routes - API endpoints for content-addressed image blobs
+
+Serves images stored by the upload endpoints. Blobs are immutable, so
+responses can be cached by the browser indefinitely.
+"""
+
+import os
+from flask import Blueprint, jsonify, send_file
+
+from services.blob_store import DIGEST_PATTERN, get_blob_store
+
+blob_bp = Blueprint('blob', __name__)
+
+# One year; a digest always refers to the same bytes
+BLOB_MAX_AGE = 365 * 24 * 3600
+
+
+@blob_bp.route('/<digest>', methods=['GET'])
+def get_blob(digest):
+    """Stream a stored blob."""
+    if not DIGEST_PATTERN.match(digest):
+        return jsonify({'error': 'Invalid blob id'}), 400
+    
+    store = get_blob_store()
+    filepath = store.path(digest)
+    
+    if not os.path.exists(filepath):
+        return jsonify({'error': 'Blob not found'}), 404
+    
+    try:
+        response = send_file(
+            filepath,
+            mimetype=store.mimetype(digest),
+            conditional=True,
+            etag=digest,
+            max_age=BLOB_MAX_AGE
+        )
+        response.cache_control.immutable = True
+        response.cache_control.public = True
+        return response
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
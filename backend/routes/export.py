@@ -6,83 +6,269 @@ Export Routes - API endpoints for PDF export operations
 Handles PDF generation from report content.
 """
 
+import importlib.util
 import os
-import tempfile
+import re
+import time
 from datetime import datetime
-from flask import Blueprint, request, jsonify, send_file, current_app
+from flask import Blueprint, Response, request, jsonify, send_file, current_app, stream_with_context
+
+from services.autosave import FlushError, get_autosave_writer
+from services.batch_export import DRAFT_ID_PATTERN, pdf_filename, prepare_batch, stream_batch
+from services.blob_store import blob_url, sniff_mimetype
+from services.export_jobs import QueueFullError, get_export_jobs
+from services.image_processing import get_image_processor
+from services.metrics import get_metrics, server_timing
+from services.page_preview import can_merge, merge_pdfs, split_pages
+from services.render_cache import get_render_cache
+from services.renderer import get_renderer
+from services.report_html import UnsupportedTemplateError, get_report_html_renderer, load_report_template
+from services.storage import read_document
 
 export_bp = Blueprint('export', __name__)
 
+RENDER_KEY_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+
+class ExportSourceError(Exception):
+    """Raised when the draft or template of a server-side render is unusable."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _load_export_draft(draft_id):
+    """Load a draft, including autosaved state not yet written to disk."""
+    if not isinstance(draft_id, str) or not DRAFT_ID_PATTERN.match(draft_id):
+        raise ExportSourceError('Invalid draft id')
+    draft = get_autosave_writer().cached(draft_id)
+    if draft is not None:
+        return draft
+    filepath = os.path.join(current_app.config['DRAFTS_DIR'], f'{draft_id}.json')
+    if not os.path.exists(filepath):
+        raise ExportSourceError('Draft not found', 404)
+    return read_document(filepath)
+
+
+def _render_draft_html(draft, template_id=None):
+    """Render the report HTML of a draft with a custom or the applied template."""
+    try:
+        template = load_report_template(
+            current_app.config['TEMPLATES_DIR'],
+            draft.get('templateType') or 'general',
+            template_id
+        )
+        return get_report_html_renderer().render(draft, template)
+    except FileNotFoundError as e:
+        raise ExportSourceError(str(e), 404)
+    except UnsupportedTemplateError as e:
+        raise ExportSourceError(str(e))
+
+
+def _export_html(data):
+    """
+    Return the HTML of an export request and the title of the report.
+    
+    The HTML is taken from 'html' if present, otherwise rendered on the
+    server from 'draftId' or an inline 'draft', with the custom template
+    'templateId' (defaults to the applied template of the draft's type).
+    
+    Raises:
+        ExportSourceError: If no usable source is given
+    """
+    if 'html' in data:
+        return data['html'], data.get('title', 'Report')
+    if 'draftId' in data:
+        draft = _load_export_draft(data['draftId'])
+    elif isinstance(data.get('draft'), dict):
+        draft = data['draft']
+    else:
+        raise ExportSourceError('No HTML content provided')
+    html_content = _render_draft_html(draft, data.get('templateId'))
+    return html_content, data.get('title') or draft.get('title') or 'Report'
+
+
+def _render_cached(html_content, stylesheet, phases=None):
+    """
+    Render HTML through the render cache.
+    
+    Args:
+        html_content: The HTML document
+        stylesheet: Key of the renderer's stylesheets
+        phases: Optional dictionary that receives the renderer's phase
+            timings (see PdfRenderer.render)
+    
+    Returns:
+        Tuple of (the cached PDF opened for reading, whether it had to be
+        rendered)
+    """
+    cache = get_render_cache()
+    key = cache.key(html_content, stylesheet, request.host_url)
+    pdf_file = cache.lookup(key)
+    if pdf_file is not None:
+        return pdf_file, False
+    
+    tmp_path = cache.reserve()
+    try:
+        # Blob references are read straight from the blob store
+        get_renderer().render(
+            html_content,
+            tmp_path,
+            stylesheet=stylesheet,
+            base_url=request.host_url,
+            phases=phases
+        )
+    except BaseException:
+        cache.release(tmp_path)
+        raise
+    return cache.store(key, tmp_path), True
+
+
+def _ms(start):
+    return round((time.perf_counter() - start) * 1000, 2)
+
+
+def _send_pdf(pdf_file, **kwargs):
+    """
+    Send a PDF opened from the render cache, with Range and ETag support.
+    
+    The render key (the file name) is the ETag. Keyword arguments are passed
+    to send_file.
+    """
+    stat = os.fstat(pdf_file.fileno())
+    response = send_file(
+        pdf_file,
+        mimetype='application/pdf',
+        etag=os.path.basename(pdf_file.name)[:-len('.pdf')],
+        conditional=False,
+        **kwargs
+    )
+    response.content_length = stat.st_size
+    response.last_modified = stat.st_mtime
+    try:
+        return response.make_conditional(request, accept_ranges=True, complete_length=stat.st_size)
+    except Exception:
+        pdf_file.close()
+        raise
+
+
+def _timed_render(endpoint, html_content, stylesheet, phases, incremental=False):
+    """
+    Render through the cache and record the export's phases and byte counts.
+    
+    Args:
+        endpoint: Endpoint name the metrics are recorded under
+        html_content: The HTML document
+        stylesheet: Key of the renderer's stylesheets
+        phases: Phase timings (ms) measured so far; completed in place
+        incremental: Render page by page (previews, see _render_incremental)
+    
+    Returns:
+        Tuple of (the cached PDF opened for reading, page count or None,
+        pages rendered)
+    """
+    step = time.perf_counter()
+    render_phases = {}
+    if incremental:
+        pdf_file, pages, rendered = _render_incremental(html_content, render_phases)
+    else:
+        pdf_file, rendered = _render_cached(html_content, stylesheet, render_phases)
+        pages, rendered = None, int(rendered)
+    image_bytes = render_phases.pop('imageBytes', 0)
+    font_bytes = render_phases.pop('fontBytes', 0)
+    if rendered:
+        phases.update(render_phases)
+    else:
+        phases['cache'] = _ms(step)
+    get_metrics().observe_export(endpoint, phases, {
+        'html': len(html_content.encode('utf-8')),
+        'images': image_bytes,
+        'fonts': font_bytes,
+        'pdf': os.fstat(pdf_file.fileno()).st_size
+    }, cache_hit=not rendered)
+    return pdf_file, pages, rendered
+
+
+def _render_incremental(html_content, phases=None):
+    """
+    Render a preview page by page, re-rendering only pages that changed.
+    
+    Falls back to a full render if the HTML cannot be split into pages or
+    pypdf is not installed.
+    
+    Args:
+        html_content: The HTML document
+        phases: Optional dictionary that receives the renderer's phase
+            timings, summed over the pages rendered
+    
+    Returns:
+        Tuple of (the cached PDF opened for reading, page count, pages
+        rendered)
+    """
+    cache = get_render_cache()
+    key = cache.key(html_content, 'preview', request.host_url, variant='pages')
+    pdf_file = cache.lookup(key)
+    if pdf_file is not None:
+        return pdf_file, None, 0
+    
+    pages = split_pages(html_content) if can_merge() else None
+    if pages is None:
+        pdf_file, rendered = _render_cached(html_content, 'preview', phases)
+        return pdf_file, 1, int(rendered)
+    
+    # Page files stay open until merged, so evictions cannot remove them
+    page_files = []
+    rendered = 0
+    tmp_path = cache.reserve()
+    try:
+        for page_html in pages:
+            page_phases = {}
+            page_file, page_rendered = _render_cached(page_html, 'preview', page_phases)
+            page_files.append(page_file)
+            rendered += page_rendered
+            if phases is not None:
+                for phase, value in page_phases.items():
+                    phases[phase] = round(phases.get(phase, 0) + value, 2)
+        merge_pdfs(page_files, tmp_path)
+    except BaseException:
+        cache.release(tmp_path)
+        raise
+    finally:
+        for page_file in page_files:
+            page_file.close()
+    return cache.store(key, tmp_path), len(pages), rendered
+
 
 @export_bp.route('/pdf', methods=['POST'])
 def export_pdf():
     """
     Export report content to PDF.
     
-    Expects JSON payload with:
+    Expects JSON payload with either:
     - html: The HTML content to convert
-    - title: Report title for filename
-    - templateType: The template type used
+    or, to render the report on the server:
+    - draftId: Id of a saved draft, or draft: The draft JSON itself
+    - templateId: Custom template to render with (defaults to the applied
+      template of the draft's type)
+    
+    and optionally:
+    - title: Report title for filename (defaults to the draft title)
     """
     data = request.get_json()
     
-    if not data or 'html' not in data:
-        return jsonify({'error': 'No HTML content provided'}), 400
-    
-    html_content = data['html']
-    title = data.get('title', 'Report')
-    
-    # Generate filename with date
-    date_str = datetime.now().strftime('%Y%m%d')
-    safe_title = "".join(c for c in title if c.isalnum() or c in (' ', '-', '_')).strip()
-    filename = f"{safe_title}_{date_str}.pdf"
+    step = time.perf_counter()
+    try:
+        html_content, title = _export_html(data or {})
+    except ExportSourceError as e:
+        return jsonify({'error': str(e)}), e.status
+    phases = {'source': _ms(step)}
+    filename = pdf_filename(title)
     
     try:
-        # Try to use weasyprint for PDF generation
-        from weasyprint import HTML, CSS
-        
-        # Create PDF in temporary file
-        with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as tmp_file:
-            tmp_path = tmp_file.name
-        
-        # Base CSS for PDF
-        base_css = CSS(string='''
-            @page {
-                size: A4;
-                margin: 0;
-            }
-            body {
-                font-family: "Microsoft YaHei", "SimSun", sans-serif;
-                margin: 0;
-                padding: 0;
-            }
-            .page {
-                page-break-after: always;
-            }
-            .page:last-child {
-                page-break-after: auto;
-            }
-        ''')
-        
-        # Generate PDF
-        HTML(string=html_content).write_pdf(tmp_path, stylesheets=[base_css])
-        
-        # Send file
-        response = send_file(
-            tmp_path,
-            mimetype='application/pdf',
-            as_attachment=True,
-            download_name=filename
-        )
-        
-        # Clean up temp file after sending
-        @response.call_on_close
-        def cleanup():
-            try:
-                os.unlink(tmp_path)
-            except:
-                pass
-        
+        pdf_file, _, _ = _timed_render('export_pdf', html_content, 'export', phases)
+        response = _send_pdf(pdf_file, as_attachment=True, download_name=filename)
+        response.headers['Server-Timing'] = server_timing(phases)
         return response
         
     except ImportError:
@@ -102,41 +288,38 @@ def export_pdf():
 def preview_pdf():
     """
     Generate PDF preview (returns PDF data as base64).
+    
+    Accepts the same sources as /pdf. Kept for older clients;
+    /preview/pdf returns the PDF itself.
     """
     data = request.get_json()
     
-    if not data or 'html' not in data:
-        return jsonify({'error': 'No HTML content provided'}), 400
-    
-    html_content = data['html']
+    step = time.perf_counter()
+    try:
+        html_content, _ = _export_html(data or {})
+    except ExportSourceError as e:
+        return jsonify({'error': str(e)}), e.status
+    phases = {'source': _ms(step)}
     
     try:
         import base64
-        from weasyprint import HTML, CSS
-        
-        # Base CSS for PDF
-        base_css = CSS(string='''
-            @page {
-                size: A4;
-                margin: 0;
-            }
-            body {
-                font-family: "Microsoft YaHei", "SimSun", sans-serif;
-                margin: 0;
-                padding: 0;
-            }
-        ''')
         
         # Generate PDF to bytes
-        pdf_bytes = HTML(string=html_content).write_pdf(stylesheets=[base_css])
+        pdf_file, _, _ = _timed_render('preview_pdf', html_content, 'preview', phases)
+        with pdf_file:
+            pdf_bytes = pdf_file.read()
         
         # Convert to base64
+        step = time.perf_counter()
         pdf_base64 = base64.b64encode(pdf_bytes).decode('utf-8')
+        phases['encode'] = _ms(step)
         
-        return jsonify({
+        response = jsonify({
             'success': True,
             'pdfData': f'data:application/pdf;base64,{pdf_base64}'
         })
+        response.headers['Server-Timing'] = server_timing(phases)
+        return response
         
     except ImportError:
         return jsonify({
@@ -148,14 +331,236 @@ def preview_pdf():
         return jsonify({'error': str(e)}), 500
 
 
+@export_bp.route('/preview/pdf', methods=['POST'])
+def preview_pdf_stream():
+    """
+    Generate a PDF preview and stream it as application/pdf.
+    
+    Expects the same JSON payload as /preview, plus:
+    - incremental: Render each page separately and only re-render pages
+      whose HTML changed (reported in X-Preview-Pages and
+      X-Preview-Rendered-Pages)
+    
+    The file is streamed from the render cache in chunks; the
+    Content-Location header names a GET URL (/preview/<key>) that embedded
+    viewers can fetch with Range requests.
+    """
+    data = request.get_json()
+    
+    step = time.perf_counter()
+    try:
+        html_content, _ = _export_html(data or {})
+    except ExportSourceError as e:
+        return jsonify({'error': str(e)}), e.status
+    phases = {'source': _ms(step)}
+    
+    try:
+        pdf_file, pages, rendered = _timed_render(
+            'preview_pdf_stream', html_content, 'preview', phases,
+            incremental=bool(data.get('incremental'))
+        )
+        key = os.path.basename(pdf_file.name)[:-len('.pdf')]
+        response = _send_pdf(pdf_file)
+        response.headers['Content-Location'] = f"{request.script_root}/api/export/preview/{key}"
+        if pages is not None:
+            response.headers['X-Preview-Pages'] = str(pages)
+        response.headers['X-Preview-Rendered-Pages'] = str(rendered)
+        response.headers['Server-Timing'] = server_timing(phases)
+        return response
+        
+    except ImportError:
+        return jsonify({
+            'fallback': True,
+            'message': 'Server-side PDF generation not available'
+        })
+    except Exception as e:
+        current_app.logger.error(f"PDF preview error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
+@export_bp.route('/preview/<key>', methods=['GET'])
+def get_preview(key):
+    """
+    Serve a rendered preview from the render cache.
+    
+    Supports Range and If-None-Match. Returns 404 once the preview has been
+    evicted; POST /preview/pdf renders it again.
+    """
+    if not RENDER_KEY_PATTERN.match(key):
+        return jsonify({'error': 'Invalid preview key'}), 400
+    
+    pdf_file = get_render_cache().lookup(key)
+    if pdf_file is None:
+        return jsonify({'error': 'Preview not found'}), 404
+    
+    response = _send_pdf(pdf_file, max_age=3600)
+    # Keys are content hashes, so a response never changes
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.immutable = True
+    return response
+
+
+@export_bp.route('/stats', methods=['GET'])
+def renderer_stats():
+    """Report renderer warm-up and latency figures, font subsets and render cache counters."""
+    renderer = get_renderer()
+    return jsonify({
+        'renderer': renderer.stats,
+        'fonts': renderer.fonts.describe() if renderer.fonts else [],
+        'renderCache': get_render_cache().stats()
+    })
+
+
+@export_bp.route('/jobs', methods=['POST'])
+def create_export_job():
+    """
+    Queue a PDF export to run in the background.
+    
+    Expects the same JSON payload as /pdf. Returns 202 with a job id;
+    poll GET /jobs/<id> and download from GET /jobs/<id>/pdf when done.
+    """
+    data = request.get_json()
+    
+    try:
+        html_content, title = _export_html(data or {})
+    except ExportSourceError as e:
+        return jsonify({'error': str(e)}), e.status
+    filename = pdf_filename(title)
+    
+    if importlib.util.find_spec('weasyprint') is None:
+        return jsonify({
+            'fallback': True,
+            'message': 'Server-side PDF generation not available. Use client-side generation.',
+            'html': html_content,
+            'filename': filename
+        })
+    
+    try:
+        job = get_export_jobs().submit(
+            html_content,
+            filename,
+            base_url=request.host_url,
+            blobs_dir=current_app.config['BLOBS_DIR']
+        )
+    except QueueFullError as e:
+        return jsonify({'error': str(e)}), 503
+    except Exception as e:
+        current_app.logger.error(f"Export job error: {e}")
+        return jsonify({'error': str(e)}), 500
+    
+    job['statusUrl'] = f"{request.script_root}/api/export/jobs/{job['jobId']}"
+    return jsonify(job), 202
+
+
+@export_bp.route('/jobs/<job_id>', methods=['GET'])
+def get_export_job(job_id):
+    """Get the status of an export job."""
+    jobs = get_export_jobs()
+    job = jobs.get(job_id)
+    
+    if job is None:
+        return jsonify({'error': 'Export job not found or expired'}), 404
+    
+    result = jobs.describe(job)
+    if result['status'] == 'done':
+        result['downloadUrl'] = f"{request.script_root}/api/export/jobs/{job_id}/pdf"
+    return jsonify(result)
+
+
+@export_bp.route('/jobs/<job_id>/pdf', methods=['GET'])
+def download_export_job(job_id):
+    """Download the PDF of a finished export job."""
+    jobs = get_export_jobs()
+    job = jobs.get(job_id)
+    
+    if job is None:
+        return jsonify({'error': 'Export job not found or expired'}), 404
+    
+    status = jobs.status(job)
+    if status != 'done':
+        return jsonify({'error': f'Export job is {status}', 'status': status}), 409
+    
+    return send_file(
+        job['path'],
+        mimetype='application/pdf',
+        as_attachment=True,
+        download_name=job['filename']
+    )
+
+
+@export_bp.route('/batch', methods=['POST'])
+def export_batch():
+    """
+    Export several drafts as one ZIP of PDFs.
+    
+    Expects JSON payload with:
+    - draftIds: Ids of the drafts to export
+    - html: Optional rendered report HTML keyed by draft id; drafts without
+      it are rendered on the server
+    - templateId: Custom template for server-side rendering (defaults to
+      the applied template of each draft's type)
+    
+    The drafts are rendered in parallel and the ZIP is streamed as each PDF
+    finishes. Drafts that cannot be exported are listed with their error in
+    manifest.json at the end of the archive.
+    """
+    data = request.get_json()
+    
+    draft_ids = (data or {}).get('draftIds')
+    if not draft_ids or not isinstance(draft_ids, list):
+        return jsonify({'error': 'No draft ids provided'}), 400
+    
+    try:
+        # Drafts are read from disk; write out pending autosaves first
+        try:
+            get_autosave_writer().flush()
+        except FlushError as e:
+            # Other drafts' failures stay queued and must not fail this batch
+            unsaved = sorted(set(e.file_ids) & set(map(str, draft_ids)))
+            if unsaved:
+                return jsonify({'error': f"Could not save draft(s): {', '.join(unsaved)}"}), 500
+            current_app.logger.warning(str(e))
+        template_id = data.get('templateId')
+        items = prepare_batch(
+            draft_ids,
+            current_app.config['DRAFTS_DIR'],
+            data.get('html'),
+            render_html=lambda draft: _render_draft_html(draft, template_id)
+        )
+        jobs = get_export_jobs()
+    except Exception as e:
+        current_app.logger.error(f"Batch export error: {e}")
+        return jsonify({'error': str(e)}), 500
+    
+    chunks = stream_batch(
+        jobs,
+        items,
+        base_url=request.host_url,
+        blobs_dir=current_app.config['BLOBS_DIR']
+    )
+    filename = f"reports_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+    return Response(
+        stream_with_context(chunks),
+        mimetype='application/zip',
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
+
 @export_bp.route('/upload-image', methods=['POST'])
 def upload_report_image():
     """
     Upload an image for use in the report.
-    Returns the image as a data URL for embedding in the report.
-    """
-    import base64
     
+    Each image is downsampled to the print resolution of its box and
+    re-encoded, and a small thumbnail is made for the editor. Both are
+    stored in the blob store and returned as short reference URLs
+    (/api/blobs/<sha256>).
+    
+    Optional form fields:
+    - boxWidthMm, boxHeightMm: Printed size of the image box (defaults to
+      IMAGE_BOX_MM)
+    """
     if 'file' not in request.files:
         # Check for multiple files
         if 'files[]' not in request.files:
@@ -164,6 +569,20 @@ def upload_report_image():
     else:
         files = [request.files['file']]
     
+    box_mm = None
+    if 'boxWidthMm' in request.form or 'boxHeightMm' in request.form:
+        default_width, default_height = current_app.config['IMAGE_BOX_MM']
+        try:
+            box_mm = (
+                float(request.form.get('boxWidthMm', default_width)),
+                float(request.form.get('boxHeightMm', default_height))
+            )
+        except ValueError:
+            return jsonify({'error': 'Invalid image box size'}), 400
+        if not all(0 < side <= 1000 for side in box_mm):
+            return jsonify({'error': 'Invalid image box size'}), 400
+    
+    processor = get_image_processor()
     results = []
     
     for file in files:
@@ -178,27 +597,27 @@ def upload_report_image():
             continue
         
         try:
-            # Read and convert to base64
             file_content = file.read()
-            base64_data = base64.b64encode(file_content).decode('utf-8')
+            if sniff_mimetype(file_content[:12]) is None:
+                current_app.logger.error(f"Image upload error: {file.filename} is not a supported image")
+                continue
             
-            # Determine MIME type
-            mime_types = {
-                'png': 'image/png',
-                'jpg': 'image/jpeg',
-                'jpeg': 'image/jpeg',
-                'gif': 'image/gif',
-                'bmp': 'image/bmp',
-                'webp': 'image/webp'
-            }
-            mime_type = mime_types.get(ext, 'image/png')
+            # Variants are stored once per content hash
+            image = processor.process(file_content, box_mm)
+            url = blob_url(image['blobId'])
             
             results.append({
                 'filename': file.filename,
-                'dataUrl': f'data:{mime_type};base64,{base64_data}'
+                'blobId': image['blobId'],
+                'url': url,
+                'thumbnailUrl': blob_url(image['thumbnailId']),
+                'width': image['width'],
+                'height': image['height'],
+                # Kept for existing clients, which use it as the image source
+                'dataUrl': url
             })
         except Exception as e:
-            current_app.logger.error(f"Image upload error: {e}")
+            current_app.logger.error(f"Image upload error: {file.filename}: {e}")
     
     if not results:
         return jsonify({'error': 'No valid images uploaded'}), 400
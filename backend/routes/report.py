@@ -6,56 +6,87 @@ Report Routes - API endpoints for report operations
 Handles report CRUD operations, draft management, and state persistence.
 """
 
-import json
+import hashlib
 import os
+import threading
 import uuid
 from datetime import datetime
 from flask import Blueprint, request, jsonify, current_app
 
+from services.autosave import get_autosave_writer
+from services.catalog import get_draft_catalog
+from services.conditional import conditional_response, if_match_failed
+from services.json_patch import JsonPatchError, apply_patch
+from services.storage import read_document
+
 report_bp = Blueprint('report', __name__)
 
 
+# Top-level draft fields that PATCH operations may touch
+PATCHABLE_FIELDS = {'title', 'templateType', 'content'}
+
+# Serializes read-modify-write cycles so version checks cannot interleave
+_draft_lock = threading.Lock()
+
+
+def _patch_field(path):
+    """Return the top-level draft field a JSON Pointer refers to."""
+    if not isinstance(path, str) or not path.startswith('/'):
+        return None
+    return path[1:].split('/', 1)[0]
+
+
+def draft_etag(draft):
+    """Strong ETag of a draft, derived from its version and last update."""
+    key = f"{draft.get('id')}:{draft.get('version', 0)}:{draft.get('updatedAt')}"
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
+
+
+def _load_draft(file_id):
+    """Load a draft, preferring in-memory state over the file on disk.
+
+    The returned dictionary may be shared with the autosave writer and must
+    not be modified in place.
+
+    Returns:
+        The draft dictionary, or None if it does not exist
+    """
+    writer = get_autosave_writer()
+    draft = writer.cached(file_id)
+    if draft is not None:
+        return draft
+    filepath = os.path.join(current_app.config['DRAFTS_DIR'], f'{file_id}.json')
+    if not os.path.exists(filepath):
+        return None
+    draft = read_document(filepath)
+    writer.remember(file_id, draft)
+    return draft
+
+
 @report_bp.route('/drafts', methods=['GET'])
 def list_drafts():
-    """List all saved report drafts."""
-    drafts_dir = current_app.config['DRAFTS_DIR']
-    drafts = []
-    
-    if os.path.exists(drafts_dir):
-        for filename in os.listdir(drafts_dir):
-            if filename.endswith('.json'):
-                filepath = os.path.join(drafts_dir, filename)
-                try:
-                    with open(filepath, 'r', encoding='utf-8') as f:
-                        draft = json.load(f)
-                        drafts.append({
-                            'id': draft.get('id'),
-                            'title': draft.get('title', 'Untitled'),
-                            'templateType': draft.get('templateType', 'general'),
-                            'updatedAt': draft.get('updatedAt'),
-                            'createdAt': draft.get('createdAt')
-                        })
-                except Exception as e:
-                    current_app.logger.error(f"Error reading draft {filename}: {e}")
-    
-    # Sort by updated date, newest first
-    drafts.sort(key=lambda x: x.get('updatedAt', ''), reverse=True)
+    """
+    List all saved report drafts.
+    
+    Served from the draft catalog, with the drafts that were saved or
+    patched but not flushed yet shown in their latest state.
+    """
+    try:
+        drafts = get_draft_catalog().list(get_autosave_writer().unflushed())
+    except Exception as e:
+        current_app.logger.error(f"Error reading draft catalog: {e}")
+        return jsonify({'error': str(e)}), 500
     return jsonify({'drafts': drafts})
 
 
 @report_bp.route('/drafts/<draft_id>', methods=['GET'])
 def get_draft(draft_id):
     """Get a specific draft by ID."""
-    drafts_dir = current_app.config['DRAFTS_DIR']
-    filepath = os.path.join(drafts_dir, f'{draft_id}.json')
-    
-    if not os.path.exists(filepath):
-        return jsonify({'error': 'Draft not found'}), 404
-    
     try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            draft = json.load(f)
-        return jsonify(draft)
+        draft = _load_draft(draft_id)
+        if draft is None:
+            return jsonify({'error': 'Draft not found'}), 404
+        return conditional_response(jsonify(draft), draft_etag(draft))
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -74,15 +105,12 @@ def create_draft():
         'templateType': data.get('templateType', 'general'),
         'content': data.get('content', {}),
         'createdAt': now,
-        'updatedAt': now
+        'updatedAt': now,
+        'version': 1
     }
     
-    drafts_dir = current_app.config['DRAFTS_DIR']
-    filepath = os.path.join(drafts_dir, f'{draft_id}.json')
-    
     try:
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(draft, f, ensure_ascii=False, indent=2)
+        get_autosave_writer().submit(draft_id, draft, immediate=True)
         return jsonify(draft), 201
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -90,33 +118,105 @@ def create_draft():
 
 @report_bp.route('/drafts/<draft_id>', methods=['PUT'])
 def update_draft(draft_id):
-    """Update an existing draft."""
-    drafts_dir = current_app.config['DRAFTS_DIR']
-    filepath = os.path.join(drafts_dir, f'{draft_id}.json')
+    """
+    Update an existing draft.
     
-    if not os.path.exists(filepath):
-        return jsonify({'error': 'Draft not found'}), 404
+    Honors If-Match: returns 412 if the draft changed since the client
+    fetched the ETag it sends.
+    """
+    data = request.get_json()
     
+    try:
+        with _draft_lock:
+            draft = _load_draft(draft_id)
+            if draft is None:
+                return jsonify({'error': 'Draft not found'}), 404
+            if if_match_failed(draft_etag(draft)):
+                return jsonify({
+                    'error': 'Draft has been modified',
+                    'version': draft.get('version', 0)
+                }), 412
+            draft = dict(draft)
+
+            # Update fields
+            if 'title' in data:
+                draft['title'] = data['title']
+            if 'content' in data:
+                draft['content'] = data['content']
+            if 'templateType' in data:
+                draft['templateType'] = data['templateType']
+
+            draft['updatedAt'] = datetime.now().isoformat()
+            draft['version'] = draft.get('version', 0) + 1
+
+            # Supersedes any autosave of this draft still waiting to be flushed
+            get_autosave_writer().submit(draft_id, draft, immediate=True)
+
+        response = jsonify(draft)
+        response.set_etag(draft_etag(draft))
+        return response
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@report_bp.route('/drafts/<draft_id>', methods=['PATCH'])
+def patch_draft(draft_id):
+    """
+    Apply a delta update to a draft.
+    
+    Expects JSON payload with:
+    - version: The draft version the operations were made against
+    - operations: JSON Patch (RFC 6902) operations, with paths such as
+      /content/testResults/3/result or /title
+    
+    Returns 409 with the current version if the draft changed in between.
+    """
     data = request.get_json()
     
+    if not data or 'version' not in data or 'operations' not in data:
+        return jsonify({'error': 'version and operations are required'}), 400
+    
+    operations = data['operations']
+    if not isinstance(operations, list):
+        return jsonify({'error': 'operations must be a list'}), 400
+    for operation in operations:
+        if not isinstance(operation, dict):
+            return jsonify({'error': f'Invalid operation: {operation!r}'}), 400
+        for key in ('path', 'from'):
+            if key in operation and _patch_field(operation[key]) not in PATCHABLE_FIELDS:
+                return jsonify({'error': f'Path not allowed: {operation[key]}'}), 400
+    
     try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            draft = json.load(f)
-        
-        # Update fields
-        if 'title' in data:
-            draft['title'] = data['title']
-        if 'content' in data:
-            draft['content'] = data['content']
-        if 'templateType' in data:
-            draft['templateType'] = data['templateType']
-        
-        draft['updatedAt'] = datetime.now().isoformat()
-        
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(draft, f, ensure_ascii=False, indent=2)
+        with _draft_lock:
+            draft = _load_draft(draft_id)
+            if draft is None:
+                return jsonify({'error': 'Draft not found'}), 404
+            
+            current_version = draft.get('version', 0)
+            if data['version'] != current_version:
+                return jsonify({
+                    'error': 'Version conflict',
+                    'version': current_version
+                }), 409
+            
+            try:
+                patched = dict(apply_patch(draft, operations))
+            except JsonPatchError as e:
+                return jsonify({'error': str(e)}), 422
+            
+            patched['updatedAt'] = datetime.now().isoformat()
+            patched['version'] = current_version + 1
+            
+            # Deferred like autosave: only the latest patched state is flushed
+            get_autosave_writer().submit(draft_id, patched)
         
-        return jsonify(draft)
+        response = jsonify({
+            'id': draft_id,
+            'version': patched['version'],
+            'updatedAt': patched['updatedAt']
+        })
+        response.set_etag(draft_etag(patched))
+        return response
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -127,11 +227,15 @@ def delete_draft(draft_id):
     drafts_dir = current_app.config['DRAFTS_DIR']
     filepath = os.path.join(drafts_dir, f'{draft_id}.json')
     
-    if not os.path.exists(filepath):
+    writer = get_autosave_writer()
+    if not os.path.exists(filepath) and writer.pending(draft_id) is None:
         return jsonify({'error': 'Draft not found'}), 404
     
     try:
-        os.remove(filepath)
+        writer.discard(draft_id)
+        if os.path.exists(filepath):
+            os.remove(filepath)
+        get_draft_catalog().remove(draft_id)
         return jsonify({'message': 'Draft deleted successfully'})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -147,9 +251,6 @@ def autosave():
         # Create new draft for autosave
         draft_id = 'autosave_' + data.get('templateType', 'general')
     
-    drafts_dir = current_app.config['DRAFTS_DIR']
-    filepath = os.path.join(drafts_dir, f'{draft_id}.json')
-    
     now = datetime.now().isoformat()
     
     draft = {
@@ -161,20 +262,17 @@ def autosave():
         'isAutosave': True
     }
     
-    # Preserve createdAt if exists
-    if os.path.exists(filepath):
-        try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                existing = json.load(f)
-                draft['createdAt'] = existing.get('createdAt', now)
-        except:
-            draft['createdAt'] = now
-    else:
-        draft['createdAt'] = now
-    
     try:
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(draft, f, ensure_ascii=False, indent=2)
+        writer = get_autosave_writer()
+        # Same read-bump-submit cycle as PATCH, so versions cannot collide
+        with _draft_lock:
+            # Preserve createdAt without re-reading the draft file
+            previous = writer.cached(draft_id) or get_draft_catalog().get(draft_id) or {}
+            draft['createdAt'] = previous.get('createdAt') or now
+            draft['version'] = previous.get('version', 0) + 1
+            
+            # Coalesced: only the latest state is flushed, atomically
+            writer.submit(draft_id, draft)
         return jsonify({'message': 'Auto-saved successfully', 'id': draft_id})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -183,16 +281,13 @@ def autosave():
 @report_bp.route('/autosave/<template_type>', methods=['GET'])
 def get_autosave(template_type):
     """Get auto-saved state for a template type."""
-    drafts_dir = current_app.config['DRAFTS_DIR']
-    filepath = os.path.join(drafts_dir, f'autosave_{template_type}.json')
-    
-    if not os.path.exists(filepath):
-        return jsonify({'exists': False})
-    
     try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            draft = json.load(f)
-        return jsonify({'exists': True, 'draft': draft})
+        draft = _load_draft(f'autosave_{template_type}')
+        if draft is None:
+            return jsonify({'exists': False})
+        return conditional_response(
+            jsonify({'exists': True, 'draft': draft}), draft_etag(draft)
+        )
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -203,11 +298,16 @@ def delete_autosave(template_type):
     drafts_dir = current_app.config['DRAFTS_DIR']
     filepath = os.path.join(drafts_dir, f'autosave_{template_type}.json')
     
-    if not os.path.exists(filepath):
+    writer = get_autosave_writer()
+    file_id = f'autosave_{template_type}'
+    if not os.path.exists(filepath) and writer.pending(file_id) is None:
         return jsonify({'message': 'No autosave found', 'deleted': False})
     
     try:
-        os.remove(filepath)
+        writer.discard(file_id)
+        if os.path.exists(filepath):
+            os.remove(filepath)
+        get_draft_catalog().remove(file_id)
         return jsonify({'message': 'Autosave deleted successfully', 'deleted': True})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
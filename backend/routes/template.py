@@ -6,14 +6,21 @@ Template Routes - API endpoints for template operations
 Handles template CRUD operations, logo/signature management, and template import/export.
 """
 
-import base64
+import io
 import json
 import os
+import threading
 import uuid
 from datetime import datetime
 from flask import Blueprint, request, jsonify, current_app, send_file
 from werkzeug.utils import secure_filename
 
+from services.blob_store import blob_url, get_blob_store, sniff_mimetype
+from services.catalog import get_template_catalog
+from services.conditional import conditional_response, if_match_failed
+from services.response_cache import get_template_cache, json_etag, serialize_json
+from services.storage import dumps_document, read_document, write_document
+
 template_bp = Blueprint('template', __name__)
 
 ALLOWED_IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg'}
@@ -25,72 +32,60 @@ def allowed_file(filename):
            filename.rsplit('.', 1)[1].lower() in ALLOWED_IMAGE_EXTENSIONS
 
 
+# Default templates generated by scripts/parse_pdf.py
+SRC_TEMPLATES_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+    'src', 'templates'
+)
+
+# Map template type to JSON file
+DEFAULT_TEMPLATE_FILES = {
+    'general': 'general_template.json',
+    'general_en': 'general_en_template.json',
+    'huawei': 'huawei_template.json'
+}
+
+
+# Serializes read-modify-write cycles so If-Match checks cannot interleave
+_template_lock = threading.Lock()
+
+
+def _json_response(document):
+    """Send a cached document with its ETag, or 304 if the client has it."""
+    response = current_app.response_class(document.body, mimetype='application/json')
+    return conditional_response(response, document.etag)
+
+
 @template_bp.route('/default/<template_type>', methods=['GET'])
 def get_default_template(template_type):
     """Get the default template configuration for a template type."""
-    # Map template type to JSON file
-    template_files = {
-        'general': 'general_template.json',
-        'general_en': 'general_en_template.json',
-        'huawei': 'huawei_template.json'
-    }
-    
-    if template_type not in template_files:
+    if template_type not in DEFAULT_TEMPLATE_FILES:
         return jsonify({'error': 'Invalid template type'}), 400
     
-    # First check in src/templates directory
-    src_template_path = os.path.join(
-        os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
-        'src', 'templates', template_files[template_type]
-    )
+    cache = get_template_cache()
+    filename = DEFAULT_TEMPLATE_FILES[template_type]
     
-    if os.path.exists(src_template_path):
+    # First check in src/templates directory, then fall back to data/templates
+    for filepath in [os.path.join(SRC_TEMPLATES_DIR, filename),
+                     os.path.join(current_app.config['TEMPLATES_DIR'], filename)]:
         try:
-            with open(src_template_path, 'r', encoding='utf-8') as f:
-                template = json.load(f)
-            return jsonify(template)
+            document = cache.get(filepath)
         except Exception as e:
             return jsonify({'error': str(e)}), 500
+        if document is not None:
+            return _json_response(document)
     
-    # Fallback to data/templates
-    templates_dir = current_app.config['TEMPLATES_DIR']
-    filepath = os.path.join(templates_dir, template_files[template_type])
-    
-    if not os.path.exists(filepath):
-        return jsonify({'error': 'Template not found'}), 404
-    
-    try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            template = json.load(f)
-        return jsonify(template)
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+    return jsonify({'error': 'Template not found'}), 404
 
 
 @template_bp.route('/custom', methods=['GET'])
 def list_custom_templates():
-    """List all custom templates."""
-    templates_dir = current_app.config['TEMPLATES_DIR']
-    templates = []
-    
-    if os.path.exists(templates_dir):
-        for filename in os.listdir(templates_dir):
-            if filename.startswith('custom_') and filename.endswith('.json'):
-                filepath = os.path.join(templates_dir, filename)
-                try:
-                    with open(filepath, 'r', encoding='utf-8') as f:
-                        template = json.load(f)
-                        templates.append({
-                            'id': template.get('id'),
-                            'name': template.get('name', 'Unnamed Template'),
-                            'baseType': template.get('baseType', 'general'),
-                            'updatedAt': template.get('updatedAt'),
-                            'createdAt': template.get('createdAt')
-                        })
-                except Exception as e:
-                    current_app.logger.error(f"Error reading template {filename}: {e}")
-    
-    templates.sort(key=lambda x: x.get('updatedAt', ''), reverse=True)
+    """List all custom templates (served from the template catalog)."""
+    try:
+        templates = get_template_catalog().list()
+    except Exception as e:
+        current_app.logger.error(f"Error reading template catalog: {e}")
+        return jsonify({'error': str(e)}), 500
     return jsonify({'templates': templates})
 
 
@@ -104,9 +99,10 @@ def get_custom_template(template_id):
         return jsonify({'error': 'Template not found'}), 404
     
     try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            template = json.load(f)
-        return jsonify(template)
+        document = get_template_cache().get(filepath)
+        if document is None:
+            return jsonify({'error': 'Template not found'}), 404
+        return _json_response(document)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -115,26 +111,25 @@ def get_custom_template(template_id):
 def get_latest_template(base_type):
     """Get the most recently updated custom template for a base type."""
     templates_dir = current_app.config['TEMPLATES_DIR']
-    templates = []
-    
-    if os.path.exists(templates_dir):
-        for filename in os.listdir(templates_dir):
-            if filename.startswith('custom_') and filename.endswith('.json'):
-                filepath = os.path.join(templates_dir, filename)
-                try:
-                    with open(filepath, 'r', encoding='utf-8') as f:
-                        template = json.load(f)
-                        if template.get('baseType') == base_type:
-                            templates.append(template)
-                except Exception as e:
-                    current_app.logger.error(f"Error reading template {filename}: {e}")
+    catalog = get_template_catalog()
     
-    if not templates:
-        return jsonify(None)
+    # Indexed lookup on (baseType, updatedAt); drop entries whose file vanished
+    while True:
+        template_id = catalog.latest(base_type)
+        if template_id is None:
+            return jsonify(None)
+        
+        filepath = os.path.join(templates_dir, f'custom_{template_id}.json')
+        if os.path.exists(filepath):
+            break
+        catalog.remove(template_id)
     
-    # Sort by updatedAt and return the latest
-    templates.sort(key=lambda x: x.get('updatedAt', ''), reverse=True)
-    return jsonify(templates[0])
+    try:
+        template = read_document(filepath)
+        return jsonify(template)
+    except Exception as e:
+        current_app.logger.error(f"Error reading template {template_id}: {e}")
+        return jsonify({'error': str(e)}), 500
 
 
 @template_bp.route('/applied/<base_type>', methods=['GET'])
@@ -144,13 +139,12 @@ def get_applied_template(base_type):
     applied_file = os.path.join(templates_dir, f'applied_{base_type}.json')
     
     # If applied template file exists, return it
-    if os.path.exists(applied_file):
-        try:
-            with open(applied_file, 'r', encoding='utf-8') as f:
-                template = json.load(f)
-            return jsonify(template)
-        except Exception as e:
-            current_app.logger.error(f"Error reading applied template: {e}")
+    try:
+        document = get_template_cache().get(applied_file)
+        if document is not None:
+            return _json_response(document)
+    except Exception as e:
+        current_app.logger.error(f"Error reading applied template: {e}")
     
     # Fallback: return None (no template has been applied yet)
     return jsonify(None)
@@ -167,16 +161,15 @@ def apply_template_to_report(template_id):
     
     try:
         # Read the source template
-        with open(source_filepath, 'r', encoding='utf-8') as f:
-            template = json.load(f)
+        template = read_document(source_filepath)
         
         base_type = template.get('baseType', 'general')
         applied_file = os.path.join(templates_dir, f'applied_{base_type}.json')
         
         # Copy to applied file
         template['appliedAt'] = datetime.now().isoformat()
-        with open(applied_file, 'w', encoding='utf-8') as f:
-            json.dump(template, f, ensure_ascii=False, indent=2)
+        write_document(applied_file, template, current_app.config['STORAGE_FORMAT'])
+        get_template_cache().invalidate(applied_file)
         
         return jsonify({
             'success': True,
@@ -215,8 +208,8 @@ def create_custom_template():
     filepath = os.path.join(templates_dir, f'custom_{template_id}.json')
     
     try:
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(template, f, ensure_ascii=False, indent=2)
+        write_document(filepath, template, current_app.config['STORAGE_FORMAT'])
+        get_template_catalog().upsert(template, template_id)
         return jsonify(template), 201
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -224,7 +217,12 @@ def create_custom_template():
 
 @template_bp.route('/custom/<template_id>', methods=['PUT'])
 def update_custom_template(template_id):
-    """Update an existing custom template."""
+    """
+    Update an existing custom template.
+    
+    Honors If-Match: returns 412 if the template changed since the client
+    fetched the ETag it sends.
+    """
     templates_dir = current_app.config['TEMPLATES_DIR']
     filepath = os.path.join(templates_dir, f'custom_{template_id}.json')
     
@@ -234,20 +232,32 @@ def update_custom_template(template_id):
     data = request.get_json()
     
     try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            template = json.load(f)
-        
-        # Update fields
-        for key in ['name', 'settings', 'logo', 'signatures', 'departmentSeal', 'templateContentData', 'securityLevel', 'tableColumnWidths', 'fieldFormats']:
-            if key in data:
-                template[key] = data[key]
+        cache = get_template_cache()
+        with _template_lock:
+            current = cache.get(filepath)
+            if current is None:
+                return jsonify({'error': 'Template not found'}), 404
+            if if_match_failed(current.etag):
+                return jsonify({'error': 'Template has been modified'}), 412
+            
+            template = json.loads(current.body)
+            
+            # Update fields
+            for key in ['name', 'settings', 'logo', 'signatures', 'departmentSeal', 'templateContentData', 'securityLevel', 'tableColumnWidths', 'fieldFormats']:
+                if key in data:
+                    template[key] = data[key]
+            
+            template['updatedAt'] = datetime.now().isoformat()
+            
+            write_document(filepath, template, current_app.config['STORAGE_FORMAT'])
+            cache.invalidate(filepath)
+            get_template_catalog().upsert(template, template_id)
         
-        template['updatedAt'] = datetime.now().isoformat()
-        
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(template, f, ensure_ascii=False, indent=2)
-        
-        return jsonify(template)
+        # The new ETag lets the client chain updates without re-fetching
+        body = serialize_json(template)
+        response = current_app.response_class(body, mimetype='application/json')
+        response.set_etag(json_etag(body))
+        return response
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -263,6 +273,8 @@ def delete_custom_template(template_id):
     
     try:
         os.remove(filepath)
+        get_template_cache().invalidate(filepath)
+        get_template_catalog().remove(template_id)
         return jsonify({'message': 'Template deleted successfully'})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -272,20 +284,19 @@ def delete_custom_template(template_id):
 def reset_templates_by_type(base_type):
     """Delete all custom templates of a specific base type to reset to default."""
     templates_dir = current_app.config['TEMPLATES_DIR']
+    catalog = get_template_catalog()
     deleted_count = 0
     
-    if os.path.exists(templates_dir):
-        for filename in os.listdir(templates_dir):
-            if filename.startswith('custom_') and filename.endswith('.json'):
-                filepath = os.path.join(templates_dir, filename)
-                try:
-                    with open(filepath, 'r', encoding='utf-8') as f:
-                        template = json.load(f)
-                        if template.get('baseType') == base_type:
-                            os.remove(filepath)
-                            deleted_count += 1
-                except Exception as e:
-                    current_app.logger.error(f"Error processing template {filename}: {e}")
+    for template_id in catalog.ids_for_base_type(base_type):
+        filepath = os.path.join(templates_dir, f'custom_{template_id}.json')
+        try:
+            if os.path.exists(filepath):
+                os.remove(filepath)
+                deleted_count += 1
+            get_template_cache().invalidate(filepath)
+            catalog.remove(template_id)
+        except Exception as e:
+            current_app.logger.error(f"Error processing template {template_id}: {e}")
     
     return jsonify({
         'message': f'Reset successful. Deleted {deleted_count} custom template(s).',
@@ -309,21 +320,20 @@ def upload_image():
         return jsonify({'error': 'Invalid file type. Allowed: PNG, JPG, JPEG'}), 400
     
     try:
-        # Read file and convert to base64
         file_content = file.read()
-        base64_data = base64.b64encode(file_content).decode('utf-8')
+        if sniff_mimetype(file_content[:12]) not in ('image/png', 'image/jpeg'):
+            return jsonify({'error': 'Invalid file type. Allowed: PNG, JPG, JPEG'}), 400
         
-        # Determine MIME type
-        ext = file.filename.rsplit('.', 1)[1].lower()
-        mime_type = f'image/{ext}' if ext != 'jpg' else 'image/jpeg'
-        
-        # Create data URL
-        data_url = f'data:{mime_type};base64,{base64_data}'
+        # Store once by content hash and reference it by URL
+        digest = get_blob_store().put(file_content)
+        url = blob_url(digest)
         
         return jsonify({
             'success': True,
             'type': image_type,
-            'dataUrl': data_url,
+            'blobId': digest,
+            'url': url,
+            'dataUrl': url,
             'filename': secure_filename(file.filename)
         })
     except Exception as e:
@@ -340,8 +350,17 @@ def export_template(template_id):
         return jsonify({'error': 'Template not found'}), 404
     
     try:
+        # Images are stored as blob references that only resolve on this
+        # install; the exported file carries them inline
+        template, missing = get_blob_store().inline_references(read_document(filepath))
+        if missing:
+            current_app.logger.warning(
+                f"Template {template_id} references missing image(s): {', '.join(missing)}"
+            )
+        # Stored files may be compact or compressed; always export readable JSON
+        payload = dumps_document(template, 'json-pretty')
         return send_file(
-            filepath,
+            io.BytesIO(payload),
             mimetype='application/json',
             as_attachment=True,
             download_name=f'template_{template_id}.json'
@@ -369,9 +388,14 @@ def import_template():
         template_data = json.loads(content)
         
         # Validate required fields
-        if 'settings' not in template_data and 'baseType' not in template_data:
+        if not isinstance(template_data, dict) or \
+                ('settings' not in template_data and 'baseType' not in template_data):
             return jsonify({'error': 'Invalid template format'}), 400
         
+        # Store inline images like uploads; references to blobs of another
+        # install (older exports) cannot be resolved and are reported
+        template_data, missing_images = get_blob_store().store_data_urls(template_data)
+        
         # Create new template with new ID
         template_id = str(uuid.uuid4())
         now = datetime.now().isoformat()
@@ -396,9 +420,15 @@ def import_template():
         templates_dir = current_app.config['TEMPLATES_DIR']
         filepath = os.path.join(templates_dir, f'custom_{template_id}.json')
         
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(template, f, ensure_ascii=False, indent=2)
+        write_document(filepath, template, current_app.config['STORAGE_FORMAT'])
+        get_template_catalog().upsert(template, template_id)
         
+        if missing_images:
+            current_app.logger.warning(
+                f"Imported template {template_id} references missing image(s): "
+                f"{', '.join(missing_images)}"
+            )
+            return jsonify(dict(template, missingImages=missing_images)), 201
         return jsonify(template), 201
     except json.JSONDecodeError:
         return jsonify({'error': 'Invalid JSON format'}), 400
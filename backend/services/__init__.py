@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Services package initialization
+"""
+
+from .autosave import AutosaveWriter, FlushError, get_autosave_writer
+from .batch_export import prepare_batch, stream_batch
+from .blob_store import BlobStore, get_blob_store
+from .catalog import DraftCatalog, TemplateCatalog, get_draft_catalog, get_template_catalog
+from .fonts import FontManager
+from .export_jobs import ExportJobManager, QueueFullError, get_export_jobs
+from .image_processing import ImageProcessor, get_image_processor
+from .json_patch import JsonPatchError, apply_patch
+from .metrics import Metrics, get_metrics
+from .render_cache import RenderCache, get_render_cache
+from .renderer import PdfRenderer, get_renderer
+from .report_html import ReportHtmlRenderer, UnsupportedTemplateError, get_report_html_renderer
+from .response_cache import FileResponseCache, get_template_cache
+from .conditional import conditional_response, if_match_failed
+
+__all__ = [
+    'AutosaveWriter', 'FlushError', 'get_autosave_writer',
+    'prepare_batch', 'stream_batch',
+    'BlobStore', 'get_blob_store',
+    'DraftCatalog', 'get_draft_catalog',
+    'TemplateCatalog', 'get_template_catalog',
+    'FontManager',
+    'ExportJobManager', 'QueueFullError', 'get_export_jobs',
+    'ImageProcessor', 'get_image_processor',
+    'JsonPatchError', 'apply_patch',
+    'Metrics', 'get_metrics',
+    'RenderCache', 'get_render_cache',
+    'PdfRenderer', 'get_renderer',
+    'ReportHtmlRenderer', 'UnsupportedTemplateError', 'get_report_html_renderer',
+    'FileResponseCache', 'get_template_cache',
+    'conditional_response', 'if_match_failed'
+]
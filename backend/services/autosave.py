@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Autosave Service - write-coalescing draft writer
+
+Keeps the latest submitted state of every draft in memory and flushes each
+draft id to disk at most once per AUTOSAVE_FLUSH_INTERVAL seconds. Saves that
+are superseded before their flush are dropped, and every flush is an atomic
+temp-file-plus-rename write. A background flush that fails is retried
+with an exponential backoff (up to MAX_RETRY_DELAY seconds) unless a newer
+state of the draft was submitted in the meantime.
+
+Recently written or loaded drafts are also kept in a small LRU so that
+delta updates can be applied without re-reading and re-parsing the file.
+Cached documents are treated as immutable and must not be modified in place.
+"""
+
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+
+from .storage import write_document
+
+logger = logging.getLogger(__name__)
+
+# Longest wait before retrying a failed background flush (seconds)
+MAX_RETRY_DELAY = 60
+
+
+class FlushError(Exception):
+    """Raised when pending drafts could not be written; they stay queued."""
+
+    def __init__(self, file_ids):
+        super().__init__(f"Could not write {len(file_ids)} draft(s): {', '.join(file_ids)}")
+        self.file_ids = file_ids
+
+
+class AutosaveWriter:
+    """Coalescing, atomic writer for draft documents."""
+
+    def __init__(self, drafts_dir, catalog, interval=2.0, cache_size=32,
+                 storage_format='json'):
+        self.drafts_dir = drafts_dir
+        self.storage_format = storage_format
+        self.catalog = catalog
+        self.interval = interval
+        self.cache_size = cache_size
+        self._recent = OrderedDict()  # file_id -> last state known to be on disk
+        self._pending = {}       # file_id -> latest draft not yet on disk
+        self._due = {}           # file_id -> monotonic time of next flush
+        self._last_flush = {}    # file_id -> monotonic time of last flush
+        self._inflight = {}      # file_id -> state taken by the flusher
+        self._failures = {}      # file_id -> consecutive failed flushes
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._thread = None
+        self._stopped = False
+        self.stats = {'submitted': 0, 'written': 0, 'coalesced': 0, 'failed': 0, 'retries': 0}
+        atexit.register(self.close)
+
+    def filepath(self, file_id):
+        return os.path.join(self.drafts_dir, f'{file_id}.json')
+
+    def submit(self, file_id, draft, immediate=False):
+        """
+        Queue the latest state of a draft.
+
+        Args:
+            file_id: Draft file name without extension
+            draft: Full draft document
+            immediate: Write synchronously instead of waiting for the interval
+        """
+        if immediate or self.interval <= 0:
+            with self._cond:
+                self._pending.pop(file_id, None)
+                self._due.pop(file_id, None)
+                self._inflight.pop(file_id, None)
+            self._write(file_id, draft)
+            return
+
+        with self._cond:
+            self.stats['submitted'] += 1
+            if file_id in self._pending:
+                self.stats['coalesced'] += 1
+            self._pending[file_id] = draft
+            if file_id not in self._due:
+                last = self._last_flush.get(file_id)
+                now = time.monotonic()
+                self._due[file_id] = now if last is None else max(now, last + self.interval)
+            self._start_thread()
+            self._cond.notify()
+
+    def pending(self, file_id):
+        """Return the unflushed state of a draft, or None."""
+        with self._cond:
+            draft = self._pending.get(file_id)
+            return draft if draft is not None else self._inflight.get(file_id)
+
+    def unflushed(self):
+        """Return the drafts submitted but not yet on disk, keyed by file id."""
+        with self._cond:
+            drafts = dict(self._inflight)
+            drafts.update(self._pending)
+            return drafts
+
+    def cached(self, file_id):
+        """Return the newest in-memory state of a draft (pending or recent), or None."""
+        with self._cond:
+            draft = self._pending.get(file_id)
+            if draft is None:
+                draft = self._inflight.get(file_id)
+            if draft is None:
+                draft = self._recent.get(file_id)
+                if draft is not None:
+                    self._recent.move_to_end(file_id)
+            return draft
+
+    def remember(self, file_id, draft):
+        """Keep a draft that was just read from disk in the LRU."""
+        if self.cache_size <= 0:
+            return
+        with self._cond:
+            self._recent[file_id] = draft
+            self._recent.move_to_end(file_id)
+            while len(self._recent) > self.cache_size:
+                self._recent.popitem(last=False)
+
+    def discard(self, file_id):
+        """Drop any unflushed state of a draft, e.g. before deleting its file."""
+        with self._write_lock:
+            with self._cond:
+                self._pending.pop(file_id, None)
+                self._due.pop(file_id, None)
+                self._last_flush.pop(file_id, None)
+                self._inflight.pop(file_id, None)
+                self._failures.pop(file_id, None)
+                self._recent.pop(file_id, None)
+
+    def flush(self):
+        """
+        Write every pending draft now.
+
+        Every draft is attempted; one that fails stays queued for a retry.
+
+        Raises:
+            FlushError: If any draft could not be written
+        """
+        with self._cond:
+            items = list(self._pending.items())
+            self._pending.clear()
+            self._due.clear()
+            # In flight, so cached() keeps returning them while written
+            self._inflight.update(items)
+        failed = []
+        for file_id, draft in items:
+            try:
+                self._write(file_id, draft, background=True)
+            except Exception:
+                failed.append(file_id)
+        if failed:
+            raise FlushError(failed)
+
+    def close(self):
+        """Stop the background thread and flush what is left."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        try:
+            self.flush()
+        except FlushError as e:
+            # Already logged per draft; nothing is left to retry them
+            logger.error(str(e))
+
+    def _start_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(
+                target=self._run, name='autosave-writer', daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    now = time.monotonic()
+                    ready = [fid for fid, due in self._due.items() if due <= now]
+                    if ready:
+                        break
+                    timeout = min(self._due.values()) - now if self._due else None
+                    self._cond.wait(timeout)
+                if self._stopped:
+                    return
+                batch = [(fid, self._pending.pop(fid)) for fid in ready]
+                for fid, draft in batch:
+                    del self._due[fid]
+                    self._inflight[fid] = draft
+            for file_id, draft in batch:
+                try:
+                    self._write(file_id, draft, background=True)
+                except Exception:
+                    # Already logged and queued for a retry; keep the writer
+                    # alive for other drafts
+                    pass
+
+    def _write(self, file_id, draft, background=False):
+        with self._write_lock:
+            if background:
+                with self._cond:
+                    # Discarded (draft deleted) or superseded by a direct write
+                    if self._inflight.get(file_id) is not draft:
+                        return
+            try:
+                write_document(self.filepath(file_id), draft, self.storage_format)
+                self.catalog.upsert(draft, file_id)
+                self.stats['written'] += 1
+                self.remember(file_id, draft)
+                with self._cond:
+                    self._failures.pop(file_id, None)
+            except Exception as e:
+                logger.error(f"Error writing draft {file_id}: {e}")
+                with self._cond:
+                    self.stats['failed'] += 1
+                    if background:
+                        self._retry(file_id, draft)
+                raise
+            finally:
+                with self._cond:
+                    self._last_flush[file_id] = time.monotonic()
+                    if self._inflight.get(file_id) is draft:
+                        del self._inflight[file_id]
+
+    def _retry(self, file_id, draft):
+        """Queue a draft whose background flush failed again, after a backoff."""
+        # Superseded by a direct write or a newer submit: that state wins
+        if self._inflight.get(file_id) is not draft or file_id in self._pending:
+            return
+        failures = self._failures[file_id] = self._failures.get(file_id, 0) + 1
+        delay = min(MAX_RETRY_DELAY, max(self.interval, 1.0) * 2 ** (failures - 1))
+        self._pending[file_id] = draft
+        self._due[file_id] = time.monotonic() + delay
+        self.stats['retries'] += 1
+        self._cond.notify()
+
+
+def get_autosave_writer():
+    """Return the draft writer of the current application."""
+    return current_app.extensions['autosave_writer']
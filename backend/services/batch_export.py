@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Batch Export Service - render many drafts into one streamed ZIP
+
+Drafts are rendered in parallel on the export worker pool, through the
+export job manager so that they count toward EXPORT_MAX_PENDING. A batch
+keeps at most a window of renders (one per worker by default) queued at a
+time and submits the next as each finishes. The ZIP is written to a
+non-seekable stream as each PDF finishes, so the first bytes reach the
+client long before the last draft is rendered. A draft that fails, or
+cannot be queued while the batch has no render in flight, is recorded in
+manifest.json, the last entry of the archive, and does not abort the batch.
+"""
+
+import json
+import os
+import re
+import shutil
+import tempfile
+import zipfile
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+from datetime import datetime
+
+from .export_jobs import QueueFullError
+from .storage import read_document
+
+DRAFT_ID_PATTERN = re.compile(r'^[\w-]+$')
+
+# Bytes copied into the archive between two yields
+CHUNK_SIZE = 64 * 1024
+
+
+def pdf_filename(title):
+    """Build the download filename of a report: <title>_<YYYYMMDD>.pdf."""
+    date_str = datetime.now().strftime('%Y%m%d')
+    safe_title = "".join(c for c in title if c.isalnum() or c in (' ', '-', '_')).strip()
+    return f"{safe_title}_{date_str}.pdf"
+
+
+def prepare_batch(draft_ids, drafts_dir, html_by_id=None, render_html=None):
+    """
+    Load the drafts of a batch and pick their archive names.
+
+    Args:
+        draft_ids: Draft ids in the order requested
+        drafts_dir: Directory holding the draft files
+        html_by_id: Rendered report HTML keyed by draft id
+        render_html: Function rendering the HTML of a draft that has none
+            in html_by_id
+
+    Returns:
+        List of items with id, filename, html and error (set when the draft
+        cannot be exported)
+    """
+    html_by_id = html_by_id or {}
+    items = []
+    used_names = set()
+    for draft_id in draft_ids:
+        item = {'id': draft_id, 'filename': None, 'html': None, 'error': None}
+        items.append(item)
+
+        if not isinstance(draft_id, str) or not DRAFT_ID_PATTERN.match(draft_id):
+            item['error'] = 'Invalid draft id'
+            continue
+        filepath = os.path.join(drafts_dir, f'{draft_id}.json')
+        if not os.path.exists(filepath):
+            item['error'] = 'Draft not found'
+            continue
+        try:
+            draft = read_document(filepath)
+        except Exception as e:
+            item['error'] = f'Error reading draft: {e}'
+            continue
+
+        filename = pdf_filename(draft.get('title') or 'Report')
+        stem, counter = filename[:-len('.pdf')], 2
+        while filename in used_names:
+            filename = f'{stem}_{counter}.pdf'
+            counter += 1
+        used_names.add(filename)
+        item['filename'] = filename
+
+        item['html'] = html_by_id.get(draft_id)
+        if item['html'] is None and render_html is not None:
+            try:
+                item['html'] = render_html(draft)
+            except Exception as e:
+                item['error'] = f'Error rendering draft: {e}'
+                continue
+        if item['html'] is None:
+            item['error'] = 'No HTML provided for draft'
+    return items
+
+
+class _StreamBuffer:
+    """Write-only, non-seekable sink whose contents are drained between yields."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_batch(jobs, items, base_url=None, blobs_dir=None, window=None):
+    """
+    Render batch items in parallel and yield a ZIP archive in chunks.
+
+    Args:
+        jobs: ExportJobManager the renders are submitted to
+        items: Items from prepare_batch
+        base_url: Base URL for relative links in the HTML
+        blobs_dir: Blob store directory used to resolve image references
+        window: Renders queued at a time (default: the number of workers)
+
+    Yields:
+        Bytes of the ZIP archive
+    """
+    work_dir = tempfile.mkdtemp(prefix='batch-export-')
+    waiting = deque((index, item) for index, item in enumerate(items) if item['error'] is None)
+    window = max(1, window or jobs.max_workers)
+    futures = {}
+
+    def submit_next():
+        while waiting and len(futures) < window:
+            index, item = waiting[0]
+            output_path = os.path.join(work_dir, f'{index}.pdf')
+            try:
+                future = jobs.submit_render(item['html'], output_path, base_url, blobs_dir)
+            except QueueFullError as e:
+                if futures:
+                    # Retried when one of this batch's renders finishes
+                    return
+                item['error'] = str(e)
+            else:
+                futures[future] = (item, output_path)
+            waiting.popleft()
+
+    try:
+        submit_next()
+        buffer = _StreamBuffer()
+        # PDFs are already compressed; storing them keeps the stream cheap
+        with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_STORED) as archive:
+            while futures:
+                future = next(iter(wait(futures, return_when=FIRST_COMPLETED).done))
+                item, output_path = futures.pop(future)
+                # Keep the workers busy while this PDF is copied
+                submit_next()
+                try:
+                    item['size'] = future.result()
+                except Exception as e:
+                    item['error'] = str(e)
+                    continue
+
+                with open(output_path, 'rb') as source, archive.open(item['filename'], 'w') as target:
+                    while True:
+                        chunk = source.read(CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        target.write(chunk)
+                        data = buffer.drain()
+                        if data:
+                            yield data
+                os.unlink(output_path)
+                yield buffer.drain()
+
+            manifest = {
+                'generatedAt': datetime.now().isoformat(),
+                'exported': sum(1 for item in items if item['error'] is None),
+                'failed': sum(1 for item in items if item['error'] is not None),
+                'drafts': [
+                    {
+                        'id': item['id'],
+                        'filename': item['filename'] if item['error'] is None else None,
+                        'size': item.get('size'),
+                        'error': item['error']
+                    }
+                    for item in items
+                ]
+            }
+            archive.writestr(
+                'manifest.json',
+                json.dumps(manifest, ensure_ascii=False, indent=2),
+                compress_type=zipfile.ZIP_DEFLATED
+            )
+        yield buffer.drain()
+    finally:
+        # Also runs when the client disconnects mid-stream
+        for future in futures:
+            future.cancel()
+        shutil.rmtree(work_dir, ignore_errors=True)
@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Blob Store Service - content-addressed storage for uploaded images
+
+Images are stored once under UPLOADS_DIR/blobs, keyed by the SHA-256 of their
+bytes, and referenced from drafts and templates by a short URL
+(/api/blobs/<sha256>) instead of an inline base64 data URL.
+"""
+
+import base64
+import binascii
+import hashlib
+import os
+import re
+import tempfile
+from urllib.parse import urlsplit
+from flask import current_app
+
+BLOB_URL_PREFIX = '/api/blobs/'
+
+DIGEST_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+BLOB_URL_PATTERN = re.compile(r'/api/blobs/([0-9a-f]{64})$')
+
+# Inline base64 image, as written into src attributes and CSS url()
+DATA_URL_PATTERN = re.compile(r'data:image/[\w.+-]+;base64,([A-Za-z0-9+/]+=*)')
+
+# Leading bytes used to recognise the stored image format
+IMAGE_SIGNATURES = [
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'BM', 'image/bmp'),
+]
+
+
+def sniff_mimetype(header):
+    """
+    Detect an image MIME type from the first bytes of a file.
+
+    Args:
+        header: At least the first 12 bytes of the file
+
+    Returns:
+        MIME type string, or None if the format is not recognised
+    """
+    for signature, mime_type in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return mime_type
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'image/webp'
+    return None
+
+
+def blob_url(digest):
+    """Return the reference URL of a blob."""
+    return f'{BLOB_URL_PREFIX}{digest}'
+
+
+def parse_blob_url(url):
+    """Return the digest referenced by a blob URL (relative or absolute), or None."""
+    match = BLOB_URL_PATTERN.search(urlsplit(url).path) if url else None
+    return match.group(1) if match else None
+
+
+def _map_strings(value, function):
+    """Apply a function to every string of a JSON value, returning a copy."""
+    if isinstance(value, dict):
+        return {key: _map_strings(item, function) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_map_strings(item, function) for item in value]
+    if isinstance(value, str):
+        return function(value)
+    return value
+
+
+def _blob_reference(text):
+    """Return the digest of a string that is a blob URL, or None."""
+    if not text.startswith((BLOB_URL_PREFIX, 'http://', 'https://')):
+        return None
+    return parse_blob_url(text)
+
+
+class BlobStore:
+    """SHA-256 addressed file store."""
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, digest):
+        """Return the file path of a blob (two-level fan-out by digest prefix)."""
+        if not DIGEST_PATTERN.match(digest):
+            raise ValueError(f'Invalid blob digest: {digest}')
+        return os.path.join(self.root, digest[:2], digest)
+
+    def exists(self, digest):
+        return os.path.exists(self.path(digest))
+
+    def put(self, data):
+        """
+        Store bytes and return their digest.
+
+        Identical content is only written once.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        filepath = self.path(digest)
+        if os.path.exists(filepath):
+            return digest
+
+        directory = os.path.dirname(filepath)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, filepath)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+        return digest
+
+    def mimetype(self, digest):
+        """Return the MIME type of a stored blob."""
+        with open(self.path(digest), 'rb') as f:
+            return sniff_mimetype(f.read(12)) or 'application/octet-stream'
+
+    def inline_references(self, value):
+        """
+        Replace the blob references in a JSON value with data URLs.
+
+        Used for documents that leave this install (template exports), whose
+        blob references would not resolve anywhere else.
+
+        Args:
+            value: JSON value (not modified)
+
+        Returns:
+            Tuple of (copy with data URLs, sorted digests of referenced
+            blobs missing from the store, which are left as references)
+        """
+        data_urls = {}
+        missing = set()
+
+        def inline(text):
+            digest = _blob_reference(text)
+            if digest is None:
+                return text
+            if digest not in data_urls:
+                if not self.exists(digest):
+                    missing.add(digest)
+                    return text
+                with open(self.path(digest), 'rb') as f:
+                    data = f.read()
+                encoded = base64.b64encode(data).decode('ascii')
+                data_urls[digest] = f'data:{self.mimetype(digest)};base64,{encoded}'
+            return data_urls[digest]
+
+        return _map_strings(value, inline), sorted(missing)
+
+    def store_data_urls(self, value):
+        """
+        Move the inline base64 images of a JSON value into the store.
+
+        The reverse of inline_references, for imported documents: every
+        string that is an image data URL becomes the blob reference of its
+        bytes, as if the image had been uploaded.
+
+        Args:
+            value: JSON value (not modified)
+
+        Returns:
+            Tuple of (copy with blob references, sorted digests of blob
+            references that are missing from the store)
+        """
+        missing = set()
+
+        def store(text):
+            match = DATA_URL_PATTERN.fullmatch(text)
+            if match is None:
+                digest = _blob_reference(text)
+                if digest is not None and not self.exists(digest):
+                    missing.add(digest)
+                return text
+            try:
+                data = base64.b64decode(match.group(1), validate=True)
+            except (binascii.Error, ValueError):
+                return text
+            if sniff_mimetype(data[:12]) is None:
+                return text
+            return blob_url(self.put(data))
+
+        return _map_strings(value, store), sorted(missing)
+
+    def url_fetcher(self, fallback):
+        """
+        Build a WeasyPrint URL fetcher that serves blob references from disk.
+
+        Args:
+            fallback: Fetcher used for every other URL
+
+        Returns:
+            URL fetcher function
+        """
+        def fetch(url, *args, **kwargs):
+            digest = parse_blob_url(url)
+            if digest and self.exists(digest):
+                return {
+                    'file_obj': open(self.path(digest), 'rb'),
+                    'mime_type': self.mimetype(digest),
+                    'redirected_url': url
+                }
+            return fallback(url, *args, **kwargs)
+        return fetch
+
+
+def get_blob_store():
+    """Return the blob store of the current application."""
+    return current_app.extensions['blob_store']
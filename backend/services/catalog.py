@@ -0,0 +1,302 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Catalog Service - persistent metadata index for stored documents
+
+Keeps the small fields needed by list endpoints (id, title, type, timestamps)
+in a SQLite database so listings never have to open and parse full documents,
+which may carry megabytes of embedded image data.
+
+Writes to the index (upserts, removals and rebuilds) are serialized by the
+catalog's lock, so a rebuild cannot drop an entry written while it scans.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from flask import current_app
+
+from .storage import read_document
+
+logger = logging.getLogger(__name__)
+
+
+class _Catalog:
+    """SQLite-backed index of the documents of one directory."""
+
+    # Overridden by subclasses
+    TABLE = None
+    SCHEMA = None
+    SCHEMA_VERSION = None
+
+    def __init__(self, db_path, directory):
+        self.db_path = db_path
+        self.directory = directory
+        self._lock = threading.Lock()  # serializes writes to the index
+        self._ready = False
+
+    @contextmanager
+    def _connect(self):
+        """Open a connection, commit on success and always close it."""
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        try:
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _ensure_ready(self):
+        """Build the index the first time it is used or when its layout changed."""
+        if self._ready:
+            return
+        with self._lock:
+            if self._ready:
+                return
+            with self._connect() as conn:
+                conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+                schema = conn.execute(
+                    'SELECT value FROM meta WHERE key = ?', (f'{self.TABLE}_schema',)
+                ).fetchone()
+            if schema is None or schema[0] != self.SCHEMA_VERSION:
+                self._rebuild()
+            # Only now: other threads must not query a table still being built
+            self._ready = True
+
+    def _accepts(self, filename):
+        """Return True if a file of the directory belongs to this catalog."""
+        return filename.endswith('.json')
+
+    def _file_id(self, filename):
+        return filename[:-len('.json')]
+
+    def _row(self, file_id, document):
+        raise NotImplementedError
+
+    def _insert(self, conn, rows):
+        placeholders = ', '.join('?' * len(rows[0]))
+        conn.executemany(
+            f'INSERT OR REPLACE INTO {self.TABLE} VALUES ({placeholders})', rows
+        )
+
+    def upsert(self, document, file_id=None):
+        """Insert or refresh the catalog entry of a document."""
+        self._ensure_ready()
+        file_id = file_id or document.get('id')
+        with self._lock, self._connect() as conn:
+            self._insert(conn, [self._row(file_id, document)])
+
+    def remove(self, file_id):
+        """Drop the catalog entry of a deleted document."""
+        self._ensure_ready()
+        with self._lock, self._connect() as conn:
+            conn.execute(f'DELETE FROM {self.TABLE} WHERE file_id = ?', (file_id,))
+
+    def rebuild(self):
+        """
+        Re-scan the directory and replace the whole index.
+
+        Use this after files have been added, edited or removed by hand.
+
+        Returns:
+            Number of documents indexed
+        """
+        with self._lock:
+            count = self._rebuild()
+            self._ready = True
+        return count
+
+    def _rebuild(self):
+        """Replace the index with a scan of the directory (called with the lock held)."""
+        rows = []
+        if os.path.exists(self.directory):
+            for filename in os.listdir(self.directory):
+                if not self._accepts(filename):
+                    continue
+                filepath = os.path.join(self.directory, filename)
+                try:
+                    document = read_document(filepath)
+                    rows.append(self._row(self._file_id(filename), document))
+                except Exception as e:
+                    logger.error(f"Error reading {filename}: {e}")
+
+        with self._connect() as conn:
+            conn.execute(f'DROP TABLE IF EXISTS {self.TABLE}')
+            conn.executescript(self.SCHEMA)
+            conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+            if rows:
+                self._insert(conn, rows)
+            conn.execute(
+                'INSERT OR REPLACE INTO meta VALUES (?, ?)',
+                (f'{self.TABLE}_schema', self.SCHEMA_VERSION)
+            )
+        return len(rows)
+
+
+class DraftCatalog(_Catalog):
+    """Metadata index of the drafts stored in DRAFTS_DIR."""
+
+    TABLE = 'drafts'
+
+    # Bump when the table layout changes; older indexes are rebuilt
+    SCHEMA_VERSION = '2'
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS drafts (
+            file_id TEXT PRIMARY KEY,
+            id TEXT,
+            title TEXT,
+            template_type TEXT,
+            created_at TEXT,
+            updated_at TEXT,
+            is_autosave INTEGER NOT NULL DEFAULT 0,
+            version INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS idx_drafts_updated_at ON drafts (updated_at);
+    '''
+
+    def _row(self, file_id, draft):
+        return (
+            file_id,
+            draft.get('id'),
+            draft.get('title', 'Untitled'),
+            draft.get('templateType', 'general'),
+            draft.get('createdAt'),
+            draft.get('updatedAt'),
+            1 if draft.get('isAutosave') else 0,
+            draft.get('version', 0)
+        )
+
+    def get(self, file_id):
+        """Return the createdAt and version of a draft, or None if it is unknown."""
+        self._ensure_ready()
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT created_at, version FROM drafts WHERE file_id = ?', (file_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {'createdAt': row[0], 'version': row[1]}
+
+    def list(self, unsaved=None):
+        """
+        Return draft summaries, newest first.
+
+        Args:
+            unsaved: Drafts accepted but not written yet, keyed by file id;
+                they replace their indexed entries or are added to the list
+
+        Returns:
+            List of draft summaries
+        """
+        self._ensure_ready()
+        with self._connect() as conn:
+            rows = conn.execute(
+                'SELECT file_id, id, title, template_type, created_at, updated_at '
+                'FROM drafts ORDER BY updated_at DESC'
+            ).fetchall()
+        if unsaved:
+            by_file_id = {row[0]: row for row in rows}
+            for file_id, draft in unsaved.items():
+                by_file_id[file_id] = self._row(file_id, draft)
+            # Same order as the query: missing timestamps last
+            rows = sorted(by_file_id.values(), key=lambda row: row[5] or '', reverse=True)
+        return [
+            {
+                'id': row[1],
+                'title': row[2],
+                'templateType': row[3],
+                'updatedAt': row[5],
+                'createdAt': row[4]
+            }
+            for row in rows
+        ]
+
+
+class TemplateCatalog(_Catalog):
+    """Metadata index of the custom templates (custom_*.json) in TEMPLATES_DIR."""
+
+    TABLE = 'templates'
+
+    SCHEMA_VERSION = '1'
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS templates (
+            file_id TEXT PRIMARY KEY,
+            id TEXT,
+            name TEXT,
+            base_type TEXT,
+            created_at TEXT,
+            updated_at TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_templates_base_type_updated_at
+            ON templates (base_type, updated_at);
+        CREATE INDEX IF NOT EXISTS idx_templates_updated_at ON templates (updated_at);
+    '''
+
+    def _accepts(self, filename):
+        return filename.startswith('custom_') and filename.endswith('.json')
+
+    def _file_id(self, filename):
+        return filename[len('custom_'):-len('.json')]
+
+    def _row(self, file_id, template):
+        return (
+            file_id,
+            template.get('id'),
+            template.get('name', 'Unnamed Template'),
+            # Raw value: templates without a baseType never match a lookup
+            template.get('baseType'),
+            template.get('createdAt'),
+            template.get('updatedAt')
+        )
+
+    def list(self):
+        """Return custom template summaries, newest first."""
+        self._ensure_ready()
+        with self._connect() as conn:
+            rows = conn.execute(
+                'SELECT id, name, base_type, updated_at, created_at '
+                'FROM templates ORDER BY updated_at DESC'
+            ).fetchall()
+        return [
+            {
+                'id': row[0],
+                'name': row[1],
+                'baseType': row[2] or 'general',
+                'updatedAt': row[3],
+                'createdAt': row[4]
+            }
+            for row in rows
+        ]
+
+    def latest(self, base_type):
+        """Return the file id of the most recently updated template of a base type, or None."""
+        self._ensure_ready()
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT file_id FROM templates WHERE base_type = ? '
+                'ORDER BY updated_at DESC LIMIT 1',
+                (base_type,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def ids_for_base_type(self, base_type):
+        """Return the file ids of all templates of a base type."""
+        self._ensure_ready()
+        with self._connect() as conn:
+            rows = conn.execute(
+                'SELECT file_id FROM templates WHERE base_type = ?', (base_type,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+
+def get_draft_catalog():
+    """Return the draft catalog of the current application."""
+    return current_app.extensions['draft_catalog']
+
+
+def get_template_catalog():
+    """Return the custom template catalog of the current application."""
+    return current_app.extensions['template_catalog']
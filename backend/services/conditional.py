@@ -0,0 +1,24 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Conditional Request Helpers - ETag, If-None-Match and If-Match handling
+"""
+
+from flask import request
+
+
+def conditional_response(response, etag):
+    """
+    Attach a strong ETag and turn the response into a 304 when the client's
+    If-None-Match already names it.
+    """
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
+
+def if_match_failed(etag):
+    """
+    Return True if the request carries If-Match and none of its tags is the
+    current ETag, i.e. the client is about to overwrite a newer version.
+    """
+    return bool(request.if_match) and not request.if_match.contains(etag)
@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Export Jobs Service - asynchronous PDF rendering in a process pool
+
+Renders run in a bounded ProcessPoolExecutor so a long export never blocks a
+request thread and several exports can run in parallel. Finished PDFs are
+kept in EXPORTS_DIR for EXPORT_JOB_TTL seconds and then removed.
+
+Jobs live in memory, so results left behind by an earlier run are deleted by
+remove_orphans() once they are older than the TTL. Only the serving process
+calls it: CLI commands and test apps share EXPORTS_DIR with a live server
+whose results must stay.
+"""
+
+import atexit
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from flask import current_app
+
+from .renderer import init_worker, render_pdf_file
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """Raised when too many export jobs are already waiting."""
+
+
+class ExportJobManager:
+    """Tracks export jobs and the worker pool that renders them."""
+
+    def __init__(self, output_dir, max_workers=2, max_pending=16, ttl=600, blobs_dir=None,
+                 fonts_dir=None, font_cache_dir=None):
+        self.output_dir = output_dir
+        self.blobs_dir = blobs_dir
+        self.fonts_dir = fonts_dir
+        self.font_cache_dir = font_cache_dir
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self._jobs = {}
+        self._renders = 0  # batch renders queued or running
+        self._lock = threading.Lock()
+        self._executor = None
+        self._sweeper = None
+        os.makedirs(output_dir, exist_ok=True)
+        atexit.register(self.shutdown)
+
+    def remove_orphans(self):
+        """
+        Delete results of earlier runs that are older than the TTL.
+
+        Returns:
+            Number of deleted files
+        """
+        cutoff = time.time() - self.ttl
+        removed = 0
+        for filename in os.listdir(self.output_dir):
+            if not filename.endswith('.pdf'):
+                continue
+            path = os.path.join(self.output_dir, filename)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.unlink(path)
+                    removed += 1
+            except OSError:
+                pass
+        return removed
+
+    @property
+    def executor(self):
+        """The worker pool, created on first use."""
+        with self._lock:
+            if self._executor is None:
+                # spawn: forking a threaded web server is unsafe, and it is
+                # what Windows uses anyway
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=init_worker,
+                    initargs=(self.blobs_dir, self.fonts_dir, self.font_cache_dir)
+                )
+                self._sweeper = threading.Thread(
+                    target=self._sweep_loop, name='export-job-sweeper', daemon=True
+                )
+                self._sweeper.start()
+            return self._executor
+
+    def submit(self, html_content, filename, base_url=None, blobs_dir=None):
+        """
+        Queue a render.
+
+        Returns:
+            The public view of the new job
+
+        Raises:
+            QueueFullError: If max_pending jobs are already queued or running
+        """
+        with self._lock:
+            if self._active() >= self.max_pending:
+                raise QueueFullError('Too many export jobs in progress')
+
+            job_id = uuid.uuid4().hex
+            job = {
+                'id': job_id,
+                'filename': filename,
+                'path': os.path.join(self.output_dir, f'{job_id}.pdf'),
+                'createdAt': datetime.now().isoformat(),
+                'finishedAt': None,
+                'expiresAt': None,
+                'size': None,
+                'error': None,
+                'future': None
+            }
+            self._jobs[job_id] = job
+
+        try:
+            future = self.executor.submit(
+                render_pdf_file, html_content, job['path'], base_url, blobs_dir
+            )
+        except Exception:
+            # Broken pool or unpicklable arguments: the job would stay queued
+            with self._lock:
+                self._jobs.pop(job_id, None)
+            raise
+        job['future'] = future
+        future.add_done_callback(lambda f, job_id=job_id: self._finished(job_id, f))
+        return self.describe(job)
+
+    def submit_render(self, html_content, output_path, base_url=None, blobs_dir=None):
+        """
+        Queue a render whose file the caller collects, as batch exports do.
+
+        The render counts toward max_pending like a job but is not tracked
+        as one.
+
+        Returns:
+            Future of the PDF size in bytes
+
+        Raises:
+            QueueFullError: If max_pending jobs and renders are already queued
+                or running
+        """
+        with self._lock:
+            if self._active() >= self.max_pending:
+                raise QueueFullError('Too many export jobs in progress')
+            self._renders += 1
+        try:
+            future = self.executor.submit(
+                render_pdf_file, html_content, output_path, base_url, blobs_dir
+            )
+        except Exception:
+            with self._lock:
+                self._renders -= 1
+            raise
+        future.add_done_callback(self._render_finished)
+        return future
+
+    def _render_finished(self, future):
+        with self._lock:
+            self._renders -= 1
+
+    def _active(self):
+        """Jobs and batch renders queued or running (called with the lock held)."""
+        return self._renders + sum(1 for job in self._jobs.values() if job['future'] is not None
+                                   and not job['future'].done())
+
+    def _finished(self, job_id, future):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job['finishedAt'] = datetime.now().isoformat()
+            job['expiresAt'] = time.time() + self.ttl
+            if future.cancelled():
+                job['error'] = 'Cancelled'
+                return
+            error = future.exception()
+            if error is not None:
+                job['error'] = str(error)
+                logger.error(f"Export job {job_id} failed: {error}")
+            else:
+                job['size'] = future.result()
+
+    @staticmethod
+    def status(job):
+        future = job['future']
+        if future is None:
+            return 'queued'
+        if future.cancelled():
+            return 'cancelled'
+        if not future.done():
+            return 'running' if future.running() else 'queued'
+        return 'failed' if job['error'] else 'done'
+
+    def describe(self, job):
+        """Return the JSON-serializable view of a job."""
+        return {
+            'jobId': job['id'],
+            'status': self.status(job),
+            'filename': job['filename'],
+            'createdAt': job['createdAt'],
+            'finishedAt': job['finishedAt'],
+            'size': job['size'],
+            'error': job['error']
+        }
+
+    def get(self, job_id):
+        """Return a job, or None if it is unknown or expired."""
+        self.sweep()
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def sweep(self):
+        """Forget expired jobs and delete their files."""
+        now = time.time()
+        with self._lock:
+            expired = [job for job in self._jobs.values()
+                       if job['expiresAt'] is not None and job['expiresAt'] <= now]
+            for job in expired:
+                del self._jobs[job['id']]
+        for job in expired:
+            try:
+                if os.path.exists(job['path']):
+                    os.unlink(job['path'])
+            except OSError as e:
+                logger.error(f"Error removing export {job['id']}: {e}")
+
+    def _sweep_loop(self):
+        interval = max(1, min(60, self.ttl / 2))
+        while True:
+            time.sleep(interval)
+            self.sweep()
+
+    def shutdown(self):
+        """Stop the worker pool."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+def get_export_jobs():
+    """Return the export job manager of the current application."""
+    return current_app.extensions['export_jobs']
@@ -0,0 +1,406 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Font Service - explicit font registration and cached glyph subsets
+
+CJK fonts such as Microsoft YaHei and SimSun are tens of megabytes. Left to
+fontconfig, every export discovers them on the system, loads the whole file
+and subsets it while writing the PDF. The FontManager instead registers the
+font files under FONTS_DIR (.ttf, .otf, .ttc) by their family names and
+serves WeasyPrint a subset holding only the glyphs the reports use, through
+@font-face rules.
+
+Subsets are stored under FONT_CACHE_DIR, keyed by the font's content hash
+and its set of code points, next to a manifest naming each face's current
+subset so that restarts and the export worker processes share them. A
+subset only grows: when a document needs characters it lacks, a new subset
+is built for the union, so after a few exports the same small file serves
+every report. The PDF still embeds only the glyphs each document uses.
+Subsets are built under a lock of their face, so renders that need other
+faces (or whose characters are already covered) do not wait, and the
+subset a new one supersedes is deleted once no render is loading it.
+
+Without fontTools (installed with WeasyPrint) or bundled fonts, exports
+fall back to fontconfig discovery; no fonts ship in FONTS_DIR, so this is
+opt-in.
+
+The statistics describe the subsets, not a measured saving: WeasyPrint
+subsets embedded fonts either way. fontBytesTrimmed is how much smaller the
+subsets are than the font files WeasyPrint would otherwise load, and
+subsetBuildMsReused the build time of the cached subsets an export reused
+instead of building them. scripts/bench_export.py --compare-fonts measures
+the time and PDF bytes saved per export against renders without subsets.
+"""
+
+import hashlib
+import html
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+FONT_EXTENSIONS = ('.ttf', '.otf', '.ttc')
+
+# Characters always kept in a subset: ASCII, CJK punctuation, full-width forms
+BASE_CODEPOINTS = frozenset(
+    list(range(0x20, 0x7f)) + list(range(0x3000, 0x3040)) + list(range(0xff00, 0xff66))
+)
+
+# Markup is stripped before collecting the characters of a document
+TAG_PATTERN = re.compile(r'<(script|style)\b.*?</\1>|<[^>]*>', re.DOTALL | re.IGNORECASE)
+
+# OpenType name ids of the family name and the typographic family name
+FAMILY_NAME_IDS = (1, 16)
+
+
+def _ms(start):
+    return round((time.perf_counter() - start) * 1000, 2)
+
+
+def document_codepoints(html_content):
+    """Return the set of code points in the text of an HTML document."""
+    text = html.unescape(TAG_PATTERN.sub(' ', html_content))
+    return {ord(c) for c in set(text) if not c.isspace()}
+
+
+def _unlink(path):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class FontFace:
+    """One face of a registered font file and its current subset."""
+
+    def __init__(self, path, font_number, families, weight, style, codepoints, digest):
+        self.path = path
+        self.font_number = font_number
+        self.families = families
+        self.weight = weight
+        self.style = style
+        self.codepoints = codepoints  # all code points the face can render
+        self.digest = digest
+        self.size = os.path.getsize(path)
+        self.subset_codepoints = frozenset()
+        self.subset_path = None
+        self.subset_size = 0
+        self.subset_ms = 0.0
+        self.lock = threading.Lock()  # held while the subset is checked or built
+
+    @property
+    def key(self):
+        return f'{self.digest[:16]}-{self.font_number}'
+
+
+class FontManager:
+    """Registered fonts with per-face glyph subsets cached across renders."""
+
+    def __init__(self, fonts_dir, cache_dir):
+        self.fonts_dir = fonts_dir
+        self.cache_dir = cache_dir
+        self.faces = []
+        self._lock = threading.Lock()  # statistics, CSS cache and pins
+        self._css_cache = {}  # subset paths -> @font-face CSS
+        self._pins = {}  # subset path -> renders loading it
+        self._retired = set()  # superseded subsets deleted when unpinned
+        self.stats = {
+            'fonts': 0,
+            'registerMs': None,
+            'exports': 0,
+            'subsetsBuilt': 0,
+            'subsetHits': 0,
+            'subsetMs': 0.0,
+            'subsetBuildMsReused': 0.0,
+            'fontBytesTrimmed': 0,
+            'lastExport': None
+        }
+
+    @property
+    def active(self):
+        return bool(self.faces)
+
+    def register(self):
+        """
+        Read the font files under fonts_dir; a no-op if there are none.
+
+        Returns:
+            Number of registered faces
+        """
+        try:
+            from fontTools.ttLib import TTCollection, TTFont
+        except ImportError:
+            logger.info('fontTools is not installed; fonts are left to fontconfig')
+            return 0
+        if not self.fonts_dir or not os.path.isdir(self.fonts_dir):
+            logger.info(f'Font directory {self.fonts_dir} not found; fonts are left to fontconfig')
+            return 0
+
+        started = time.perf_counter()
+        faces = []
+        for path in sorted(Path(self.fonts_dir).iterdir()):
+            if path.suffix.lower() not in FONT_EXTENSIONS:
+                continue
+            try:
+                digest = _file_digest(path)
+                if path.suffix.lower() == '.ttc':
+                    fonts = TTCollection(str(path), lazy=True).fonts
+                else:
+                    fonts = [TTFont(str(path), lazy=True)]
+                for font_number, font in enumerate(fonts):
+                    faces.append(self._face(str(path), font_number, font, digest))
+            except Exception as e:
+                logger.warning(f'Skipping font {path.name}: {e}')
+        os.makedirs(self.cache_dir, exist_ok=True)
+        for face in faces:
+            self._load_manifest(face)
+        self.faces = faces
+        if not faces:
+            logger.info(f'No font files in {self.fonts_dir}; fonts are left to fontconfig')
+        self.stats['fonts'] = len(faces)
+        self.stats['registerMs'] = _ms(started)
+        return len(faces)
+
+    @staticmethod
+    def _face(path, font_number, font, digest):
+        names = font['name']
+        families = []
+        for record in names.names:
+            if record.nameID in FAMILY_NAME_IDS:
+                try:
+                    family = record.toUnicode()
+                except UnicodeDecodeError:
+                    continue
+                if family and family not in families:
+                    families.append(family)
+        os2 = font['OS/2'] if 'OS/2' in font else None
+        weight = os2.usWeightClass if os2 else 400
+        style = 'italic' if os2 and os2.fsSelection & 1 else 'normal'
+        codepoints = frozenset(font.getBestCmap() or {})
+        return FontFace(path, font_number, families, weight, style, codepoints, digest)
+
+    def _manifest_path(self, face):
+        return os.path.join(self.cache_dir, f'{face.key}.json')
+
+    def _load_manifest(self, face):
+        """Adopt the face's current subset from the cache, if it is larger."""
+        try:
+            with open(self._manifest_path(face), 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            codepoints = frozenset(manifest['codepoints'])
+            filepath = os.path.join(self.cache_dir, manifest['file'])
+            size = os.path.getsize(filepath)
+        except (OSError, ValueError, KeyError, TypeError):
+            return
+        if len(codepoints) > len(face.subset_codepoints):
+            face.subset_codepoints = codepoints
+            face.subset_path = filepath
+            face.subset_size = size
+            face.subset_ms = manifest.get('buildMs') or 0.0
+
+    def _write_manifest(self, face):
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix='.', suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({
+                'file': os.path.basename(face.subset_path),
+                'codepoints': sorted(face.subset_codepoints),
+                'buildMs': face.subset_ms
+            }, f)
+        os.replace(tmp_path, self._manifest_path(face))
+
+    def _build_subset(self, face, codepoints):
+        """
+        Write (or reuse) the subset of a face for a set of code points.
+
+        Called with the face's lock held. The subset it supersedes is deleted.
+        """
+        from fontTools import subset
+
+        key = hashlib.sha256(','.join(map(str, sorted(codepoints))).encode('ascii')).hexdigest()[:16]
+        filepath = os.path.join(self.cache_dir, f'{face.key}-{key}.ttf')
+        started = time.perf_counter()
+        built = False
+        if not os.path.exists(filepath):
+            options = subset.Options()
+            options.font_number = face.font_number
+            options.layout_features = ['*']
+            options.name_IDs = ['*']
+            options.name_languages = ['*']
+            options.notdef_outline = True
+            options.hinting = False
+            font = subset.load_font(face.path, options, lazy=False)
+            subsetter = subset.Subsetter(options)
+            subsetter.populate(unicodes=codepoints)
+            subsetter.subset(font)
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix='.', suffix='.tmp')
+            os.close(fd)
+            try:
+                subset.save_font(font, tmp_path, options)
+                os.replace(tmp_path, filepath)
+            except BaseException:
+                try:
+                    os.unlink(tmp_path)
+                except OSError:
+                    pass
+                raise
+            built = True
+        previous = face.subset_path
+        face.subset_codepoints = frozenset(codepoints)
+        face.subset_path = filepath
+        face.subset_size = os.path.getsize(filepath)
+        if built:
+            face.subset_ms = _ms(started)
+            self._write_manifest(face)
+        if previous is not None and previous != filepath:
+            self._retire(previous)
+        return built
+
+    def _retire(self, path):
+        """Delete a superseded subset, or mark it for deletion while it is pinned."""
+        with self._lock:
+            if self._pins.get(path):
+                self._retired.add(path)
+                return
+        _unlink(path)
+
+    def _pin(self, path):
+        with self._lock:
+            self._pins[path] = self._pins.get(path, 0) + 1
+
+    def _unpin(self, paths):
+        retired = []
+        with self._lock:
+            for path in paths:
+                self._pins[path] -= 1
+                if not self._pins[path]:
+                    del self._pins[path]
+                    if path in self._retired:
+                        self._retired.discard(path)
+                        retired.append(path)
+        for path in retired:
+            _unlink(path)
+
+    @contextmanager
+    def subsets(self, html_content):
+        """
+        Make sure the subsets cover a document and yield their @font-face CSS.
+
+        The subset files stay in place until the block exits, so load the
+        rules (parse the CSS) inside it.
+
+        Yields:
+            Tuple of (CSS string, or None when no fonts are registered;
+            per-export metrics)
+        """
+        if not self.faces:
+            yield None, None
+            return
+        started = time.perf_counter()
+        needed = document_codepoints(html_content)
+        built, hits = 0, 0
+        reused_ms = 0.0
+        subsets = []  # (path, size) of each face's subset, pinned
+        try:
+            for face in self.faces:
+                wanted = (needed | BASE_CODEPOINTS) & face.codepoints
+                with face.lock:
+                    if not self._covers(face, wanted):
+                        # Another worker may have grown the subset in the meantime
+                        self._load_manifest(face)
+                    if self._covers(face, wanted):
+                        hits += 1
+                        reused_ms += face.subset_ms
+                    elif self._build_subset(face, face.subset_codepoints | wanted):
+                        built += 1
+                    else:
+                        hits += 1
+                        reused_ms += face.subset_ms
+                    self._pin(face.subset_path)
+                    subsets.append((face.subset_path, face.subset_size))
+            paths = tuple(path for path, _ in subsets)
+            subset_ms = _ms(started)
+
+            # Properties of the subsets, not savings measured against a render
+            # without them (see the module docstring)
+            font_bytes = sum(face.size for face in self.faces)
+            subset_bytes = sum(size for _, size in subsets)
+            metrics = {
+                'faces': len(self.faces),
+                'subsetsBuilt': built,
+                'subsetHits': hits,
+                'subsetMs': subset_ms,
+                'fontBytes': font_bytes,
+                'subsetBytes': subset_bytes,
+                'fontBytesTrimmed': font_bytes - subset_bytes,
+                'subsetBuildMsReused': round(reused_ms, 2)
+            }
+            with self._lock:
+                css = self._css_cache.get(paths)
+                if css is None:
+                    css = self._css_cache[paths] = self._font_face_css(paths)
+                self._record(metrics)
+            yield css, metrics
+        finally:
+            self._unpin(path for path, _ in subsets)
+
+    @staticmethod
+    def _covers(face, codepoints):
+        """Whether the face's current subset exists and holds the code points."""
+        return (face.subset_path is not None and codepoints <= face.subset_codepoints
+                and os.path.exists(face.subset_path))
+
+    def _record(self, metrics):
+        """Add an export's metrics to the statistics (called with the lock held)."""
+        stats = self.stats
+        stats['exports'] += 1
+        stats['subsetsBuilt'] += metrics['subsetsBuilt']
+        stats['subsetHits'] += metrics['subsetHits']
+        stats['subsetMs'] = round(stats['subsetMs'] + metrics['subsetMs'], 2)
+        stats['subsetBuildMsReused'] = round(
+            stats['subsetBuildMsReused'] + metrics['subsetBuildMsReused'], 2
+        )
+        stats['fontBytesTrimmed'] = metrics['fontBytesTrimmed']
+        stats['lastExport'] = metrics
+
+    def _font_face_css(self, paths):
+        rules = []
+        for face, path in zip(self.faces, paths):
+            url = Path(path).resolve().as_uri()
+            for family in face.families:
+                family = family.replace('\\', '\\\\').replace('"', '\\"')
+                rules.append(
+                    f'@font-face {{ font-family: "{family}"; src: url("{url}"); '
+                    f'font-weight: {face.weight}; font-style: {face.style}; }}'
+                )
+        return '\n'.join(rules)
+
+    def describe(self):
+        """Return the registered faces and the size of their subsets."""
+        return [
+            {
+                'file': os.path.basename(face.path),
+                'fontNumber': face.font_number,
+                'families': face.families,
+                'weight': face.weight,
+                'style': face.style,
+                'bytes': face.size,
+                'subsetBytes': face.subset_size,
+                'subsetGlyphs': len(face.subset_codepoints)
+            }
+            for face in self.faces
+        ]
@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Image Processing Service - normalization and thumbnails for uploaded images
+
+Each upload is decoded once, rotated upright from its EXIF orientation and
+downsampled to fit the target box at the print DPI (IMAGE_PRINT_DPI), then
+re-encoded: JPEG for opaque images, PNG when transparency is used (seals,
+signatures). A small thumbnail for the editor is made from the same decoded
+image. Both variants go into the blob store.
+
+The variant digests of a source image are remembered under IMAGE_CACHE_DIR,
+keyed by the SHA-256 of the uploaded bytes and the processing settings, so
+uploading the same photo again does not decode it again.
+
+Without Pillow the upload is stored unchanged and serves as its own
+thumbnail.
+"""
+
+import hashlib
+import io
+import json
+import logging
+import os
+import tempfile
+from flask import current_app
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:  # Optional dependency
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Bump when the same source and settings would produce different variants
+PROCESSING_VERSION = '1'
+
+MM_PER_INCH = 25.4
+
+JPEG_QUALITY = 85
+THUMBNAIL_QUALITY = 75
+
+
+def box_pixels(box_mm, dpi):
+    """Return the pixel size (width, height) of a box in millimetres at a DPI."""
+    return tuple(max(1, round(side / MM_PER_INCH * dpi)) for side in box_mm)
+
+
+def _has_alpha(img):
+    """Return True if the image has transparent pixels."""
+    if img.mode in ('RGBA', 'LA'):
+        return img.getchannel('A').getextrema()[0] < 255
+    if img.mode == 'P' and 'transparency' in img.info:
+        return True
+    return False
+
+
+def _encode(img, fmt, quality):
+    """Encode an image to bytes."""
+    buffer = io.BytesIO()
+    if fmt == 'JPEG':
+        img.convert('RGB').save(buffer, 'JPEG', quality=quality, optimize=True, progressive=True)
+    elif fmt == 'WEBP':
+        img.save(buffer, 'WEBP', quality=quality, method=4)
+    else:
+        img.save(buffer, 'PNG', optimize=True)
+    return buffer.getvalue()
+
+
+class ImageProcessor:
+    """Downsample uploads for print and make editor thumbnails."""
+
+    def __init__(self, blob_store, cache_dir, dpi=200, box_mm=(60, 60), thumbnail_px=320):
+        """
+        Args:
+            blob_store: BlobStore receiving the variants
+            cache_dir: Directory of the source digest -> variants records
+            dpi: Print resolution the images are downsampled to
+            box_mm: Default (width, height) of the printed image box in mm
+            thumbnail_px: Longest side of editor thumbnails in pixels
+        """
+        self.blob_store = blob_store
+        self.cache_dir = cache_dir
+        self.dpi = dpi
+        self.box_mm = tuple(box_mm)
+        self.thumbnail_px = thumbnail_px
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _record_path(self, source_digest, box_mm):
+        settings = f'{PROCESSING_VERSION}:{self.dpi}:{box_mm[0]}x{box_mm[1]}:{self.thumbnail_px}'
+        suffix = hashlib.sha256(settings.encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.cache_dir, source_digest[:2], f'{source_digest}-{suffix}.json')
+
+    def _load_record(self, filepath):
+        """Return a cached record whose blobs still exist, or None."""
+        try:
+            with open(filepath, 'r', encoding='utf-8') as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not all(self.blob_store.exists(record[k]) for k in ('blobId', 'thumbnailId')):
+            return None
+        return record
+
+    def _save_record(self, filepath, record):
+        directory = os.path.dirname(filepath)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(record, f)
+            os.replace(tmp_path, filepath)
+        except OSError as e:
+            logger.warning(f"Could not cache image variants: {e}")
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+
+    def process(self, data, box_mm=None):
+        """
+        Store the print and thumbnail variants of an uploaded image.
+
+        Args:
+            data: Uploaded image bytes
+            box_mm: (width, height) of the printed image box in mm; defaults
+                to the configured box
+
+        Returns:
+            Dictionary with blobId, thumbnailId, width, height, sourceId and
+            cached (True if the variants were already known)
+
+        Raises:
+            ValueError: If the bytes cannot be decoded as an image
+        """
+        box_mm = tuple(box_mm or self.box_mm)
+        source_digest = hashlib.sha256(data).hexdigest()
+        record_path = self._record_path(source_digest, box_mm)
+
+        record = self._load_record(record_path)
+        if record is not None:
+            return dict(record, cached=True)
+
+        if Image is None:
+            digest = self.blob_store.put(data)
+            return {
+                'sourceId': source_digest,
+                'blobId': digest,
+                'thumbnailId': digest,
+                'width': None,
+                'height': None,
+                'cached': False
+            }
+
+        record = self._process(data, box_mm)
+        record['sourceId'] = source_digest
+        self._save_record(record_path, record)
+        return dict(record, cached=False)
+
+    def _process(self, data, box_mm):
+        target = box_pixels(box_mm, self.dpi)
+        longest = max(target)
+        try:
+            img = Image.open(io.BytesIO(data))
+            source_format = img.format
+            source_size = img.size
+            # Let the JPEG decoder scale down by a power of two while decoding
+            img.draft('RGB', (longest * 2, longest * 2))
+            img.load()
+        except (OSError, ValueError, Image.DecompressionBombError) as e:
+            raise ValueError(f'Cannot decode image: {e}') from e
+
+        rotated = img.getexif().get(0x0112, 1) != 1  # EXIF Orientation
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ('RGB', 'RGBA', 'L', 'LA', 'P'):
+            img = img.convert('RGBA' if 'A' in img.getbands() else 'RGB')
+
+        transparent = _has_alpha(img)
+        if img.mode == 'P':
+            img = img.convert('RGBA' if transparent else 'RGB')
+
+        if img.width > target[0] or img.height > target[1]:
+            img.thumbnail(target, Image.LANCZOS)
+
+        print_format = 'PNG' if transparent else 'JPEG'
+        print_bytes = _encode(img, print_format, JPEG_QUALITY)
+        # A small, already compressed upload is kept if re-encoding does not help
+        if (not rotated and img.size == source_size and source_format in ('JPEG', 'PNG')
+                and len(data) <= len(print_bytes)):
+            print_bytes = data
+
+        thumbnail = img.copy()
+        thumbnail.thumbnail((self.thumbnail_px, self.thumbnail_px), Image.LANCZOS)
+        if features.check('webp'):
+            thumbnail_format = 'WEBP'
+        else:
+            thumbnail_format = 'PNG' if transparent else 'JPEG'
+        thumbnail_bytes = _encode(thumbnail, thumbnail_format, THUMBNAIL_QUALITY)
+
+        return {
+            'blobId': self.blob_store.put(print_bytes),
+            'thumbnailId': self.blob_store.put(thumbnail_bytes),
+            'width': img.width,
+            'height': img.height
+        }
+
+
+def get_image_processor():
+    """Return the image processor of the current application."""
+    return current_app.extensions['image_processor']
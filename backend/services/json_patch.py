@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+JSON Patch Service - apply RFC 6902 operations to JSON documents
+
+Supports add, remove, replace, move, copy and test with RFC 6901 JSON Pointer
+paths. Patches are applied by path copying: only the containers along each
+modified path are shallow-copied, so the cost scales with the edit rather than
+the document, and the input document is never mutated (it may be shared with
+the autosave writer while it is being serialized).
+"""
+
+
+class JsonPatchError(ValueError):
+    """Raised when a patch is malformed or cannot be applied."""
+
+
+def parse_pointer(path):
+    """
+    Split a JSON Pointer into its reference tokens.
+
+    Args:
+        path: JSON Pointer string such as '/content/testResults/0/result'
+
+    Returns:
+        List of unescaped tokens
+    """
+    if not isinstance(path, str):
+        raise JsonPatchError(f'Invalid path: {path!r}')
+    if path == '':
+        return []
+    if not path.startswith('/'):
+        raise JsonPatchError(f'Path must start with "/": {path}')
+    return [t.replace('~1', '/').replace('~0', '~') for t in path[1:].split('/')]
+
+
+def _index(container, token, path, allow_end=False):
+    """Resolve a token against a list."""
+    if allow_end and token == '-':
+        return len(container)
+    if not token.isdigit() or (len(token) > 1 and token[0] == '0'):
+        raise JsonPatchError(f'Invalid array index "{token}" in {path}')
+    index = int(token)
+    limit = len(container) + 1 if allow_end else len(container)
+    if index >= limit:
+        raise JsonPatchError(f'Array index out of range in {path}')
+    return index
+
+
+def _child(container, token, path):
+    if isinstance(container, dict):
+        if token not in container:
+            raise JsonPatchError(f'Path not found: {path}')
+        return container[token]
+    if isinstance(container, list):
+        return container[_index(container, token, path)]
+    raise JsonPatchError(f'Path not found: {path}')
+
+
+def resolve(doc, path):
+    """Return the value referenced by a JSON Pointer."""
+    value = doc
+    for token in parse_pointer(path):
+        value = _child(value, token, path)
+    return value
+
+
+def _shallow_copy(value):
+    if isinstance(value, dict):
+        return dict(value)
+    if isinstance(value, list):
+        return list(value)
+    return value
+
+
+def _copy_path(doc, tokens, path):
+    """
+    Copy the containers along a path.
+
+    Returns:
+        (new_root, parent) where parent is the freshly copied container that
+        holds the last token
+    """
+    root = _shallow_copy(doc)
+    parent = root
+    for token in tokens[:-1]:
+        child = _shallow_copy(_child(parent, token, path))
+        if not isinstance(child, (dict, list)):
+            raise JsonPatchError(f'Path not found: {path}')
+        if isinstance(parent, dict):
+            parent[token] = child
+        else:
+            parent[_index(parent, token, path)] = child
+        parent = child
+    return root, parent
+
+
+def _add(doc, path, value):
+    tokens = parse_pointer(path)
+    if not tokens:
+        return value
+    root, parent = _copy_path(doc, tokens, path)
+    token = tokens[-1]
+    if isinstance(parent, dict):
+        parent[token] = value
+    elif isinstance(parent, list):
+        parent.insert(_index(parent, token, path, allow_end=True), value)
+    else:
+        raise JsonPatchError(f'Path not found: {path}')
+    return root
+
+
+def _remove(doc, path):
+    tokens = parse_pointer(path)
+    if not tokens:
+        raise JsonPatchError('Cannot remove the document root')
+    root, parent = _copy_path(doc, tokens, path)
+    token = tokens[-1]
+    if isinstance(parent, dict):
+        if token not in parent:
+            raise JsonPatchError(f'Path not found: {path}')
+        del parent[token]
+    elif isinstance(parent, list):
+        del parent[_index(parent, token, path)]
+    else:
+        raise JsonPatchError(f'Path not found: {path}')
+    return root
+
+
+def _replace(doc, path, value):
+    tokens = parse_pointer(path)
+    if not tokens:
+        return value
+    root, parent = _copy_path(doc, tokens, path)
+    token = tokens[-1]
+    if isinstance(parent, dict):
+        if token not in parent:
+            raise JsonPatchError(f'Path not found: {path}')
+        parent[token] = value
+    elif isinstance(parent, list):
+        parent[_index(parent, token, path)] = value
+    else:
+        raise JsonPatchError(f'Path not found: {path}')
+    return root
+
+
+def apply_patch(doc, operations):
+    """
+    Apply a list of JSON Patch operations.
+
+    Args:
+        doc: Source document (left untouched)
+        operations: List of operation dictionaries
+
+    Returns:
+        The patched document
+    """
+    if not isinstance(operations, list):
+        raise JsonPatchError('Patch must be a list of operations')
+
+    for operation in operations:
+        if not isinstance(operation, dict) or 'op' not in operation or 'path' not in operation:
+            raise JsonPatchError(f'Invalid operation: {operation!r}')
+        op = operation['op']
+        path = operation['path']
+
+        if op in ('add', 'replace', 'test') and 'value' not in operation:
+            raise JsonPatchError(f'Operation "{op}" requires a value')
+        if op in ('move', 'copy') and 'from' not in operation:
+            raise JsonPatchError(f'Operation "{op}" requires "from"')
+
+        if op == 'add':
+            doc = _add(doc, path, operation['value'])
+        elif op == 'remove':
+            doc = _remove(doc, path)
+        elif op == 'replace':
+            doc = _replace(doc, path, operation['value'])
+        elif op == 'move':
+            source = operation['from']
+            if path != source and path.startswith(source + '/'):
+                raise JsonPatchError(f'Cannot move {source} into its own child')
+            value = resolve(doc, source)
+            doc = _add(_remove(doc, source), path, value)
+        elif op == 'copy':
+            doc = _add(doc, path, resolve(doc, operation['from']))
+        elif op == 'test':
+            if resolve(doc, path) != operation['value']:
+                raise JsonPatchError(f'Test failed at {path}')
+        else:
+            raise JsonPatchError(f'Unknown operation: {op}')
+
+    return doc
@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Metrics Service - request latency and export phase metrics
+
+Keeps counters and histograms in memory and renders them in the Prometheus
+text exposition format for /api/metrics. Every blueprint route gets a
+request latency histogram. The PDF export and preview endpoints also record
+how long each phase took (HTML source, HTML parsing, layout, image fetching,
+image decoding, PDF writing) and how many bytes went in and out, so a slow
+export can be attributed to a phase.
+
+Metrics live in the web process only; renders in export worker processes
+are counted by the request that queued them, not by phase.
+"""
+
+import math
+import threading
+import time
+from flask import current_app, g, request
+
+# Histogram buckets in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Output format of /api/metrics
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter with labels."""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f'{self.name}{_format_labels(self.labels, key)} {_format_value(value)}'
+                for key, value in items]
+
+
+class Histogram:
+    """Histogram with cumulative buckets, a sum and a count per label set."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._values = {}  # label values -> [bucket counts, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][index] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, (list(entry[0]), entry[1], entry[2]))
+                           for key, entry in self._values.items())
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labels, key, f'le="{_format_value(bound)}"')
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labels, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(round(total, 6))}')
+            lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+class Metrics:
+    """The application's metrics and the request hooks that record latency."""
+
+    def __init__(self):
+        self.request_duration = Histogram(
+            'http_request_duration_seconds',
+            'Latency of API requests by route, method and status',
+            ('route', 'method', 'status')
+        )
+        # imageFetch is part of layout (URLs are fetched while laying out),
+        # so phases do not add up to the request time. The fetch time and
+        # bytes of a render are summed without a lock: WeasyPrint fetches one
+        # URL at a time per render. imageDecode is not part of write.
+        self.export_phase_duration = Histogram(
+            'export_phase_duration_seconds',
+            'Time spent in each phase of a PDF export or preview',
+            ('endpoint', 'phase')
+        )
+        # images and fonts are only counted for renders that missed the cache
+        self.export_bytes = Counter(
+            'export_bytes_total',
+            'Bytes handled by PDF exports and previews by kind',
+            ('endpoint', 'kind')
+        )
+        self.exports = Counter(
+            'exports_total',
+            'PDF exports and previews by render cache result',
+            ('endpoint', 'cache')
+        )
+        self._metrics = [self.request_duration, self.export_phase_duration,
+                         self.export_bytes, self.exports]
+
+    def init_app(self, app):
+        """Record the latency of every blueprint route of an app."""
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+
+    @staticmethod
+    def _start_request():
+        g.metrics_started = time.perf_counter()
+
+    def _finish_request(self, response):
+        started = g.pop('metrics_started', None)
+        # Streamed responses are measured up to the first byte
+        if started is not None and request.blueprint and request.url_rule is not None:
+            self.request_duration.observe(
+                time.perf_counter() - started,
+                route=request.url_rule.rule,
+                method=request.method,
+                status=response.status_code
+            )
+        return response
+
+    def observe_export(self, endpoint, phases, byte_counts, cache_hit):
+        """
+        Record one export.
+
+        Args:
+            endpoint: Name of the export endpoint
+            phases: Phase name -> duration in milliseconds
+            byte_counts: Kind (html, images, fonts, pdf) -> bytes
+            cache_hit: Whether the PDF came from the render cache
+        """
+        for phase, elapsed_ms in phases.items():
+            self.export_phase_duration.observe(elapsed_ms / 1000, endpoint=endpoint, phase=phase)
+        for kind, count in byte_counts.items():
+            self.export_bytes.inc(count, endpoint=endpoint, kind=kind)
+        self.exports.inc(endpoint=endpoint, cache='hit' if cache_hit else 'miss')
+
+    def render(self):
+        """Return all metrics in the Prometheus text format."""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+def server_timing(phases):
+    """Format phase durations (ms) as a Server-Timing header value."""
+    return ', '.join(f'{phase};dur={elapsed_ms}' for phase, elapsed_ms in phases.items())
+
+
+def get_metrics():
+    """Return the metrics of the current application."""
+    return current_app.extensions['metrics']
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Page Preview Service - incremental per-page preview rendering
+
+The report HTML is a skeleton (head, wrappers) around a sequence of page
+containers. split_pages() cuts it into one standalone document per page,
+each made of the skeleton and a single page, so every page can be rendered
+and cached on its own: after an edit only the pages whose HTML changed miss
+the render cache. merge_pdfs() joins the single-page PDFs back together.
+
+Page numbers must be part of the page HTML (as in the editor output); CSS
+page counters restart in each fragment.
+"""
+
+import re
+from html.parser import HTMLParser
+
+try:
+    from pypdf import PdfWriter
+except ImportError:  # Optional dependency
+    PdfWriter = None
+
+# Classes that mark a page container
+PAGE_CLASSES = {'page', 'a4-page'}
+
+VOID_ELEMENTS = {
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input',
+    'link', 'meta', 'param', 'source', 'track', 'wbr'
+}
+
+
+class _PageScanner(HTMLParser):
+    """Find the source offsets of the outermost page containers."""
+
+    def __init__(self, source):
+        super().__init__(convert_charrefs=False)
+        self.source = source
+        self.line_offsets = [0] + [m.end() for m in re.finditer('\n', source)]
+        self.pages = []  # (start, end) offsets
+        self.stack = []  # open tags inside the current page
+        self.start = None
+        self.balanced = True
+
+    def source_offset(self):
+        line, column = self.getpos()
+        return self.line_offsets[line - 1] + column
+
+    def handle_starttag(self, tag, attrs):
+        if tag in VOID_ELEMENTS:
+            return
+        if self.stack:
+            self.stack.append(tag)
+            return
+        classes = (dict(attrs).get('class') or '').split()
+        if PAGE_CLASSES.intersection(classes):
+            self.start = self.source_offset()
+            self.stack.append(tag)
+
+    def handle_endtag(self, tag):
+        if tag not in self.stack:
+            # Stray end tag
+            return
+        # Close the tag and anything left open inside it (e.g. <p>, <li>)
+        while self.stack.pop() != tag:
+            pass
+        if not self.stack:
+            end = self.source.find('>', self.source_offset())
+            if end < 0:
+                self.balanced = False
+                return
+            self.pages.append((self.start, end + 1))
+
+
+def split_pages(html_content):
+    """
+    Split report HTML into one standalone document per page.
+
+    Args:
+        html_content: The report HTML
+
+    Returns:
+        List of HTML documents, or None if the document has fewer than two
+        page containers or cannot be split reliably
+    """
+    scanner = _PageScanner(html_content)
+    try:
+        scanner.feed(html_content)
+        scanner.close()
+    except Exception:
+        return None
+    if not scanner.balanced or scanner.stack or len(scanner.pages) < 2:
+        return None
+
+    # Markup between pages (e.g. page break markers) is dropped
+    prefix = html_content[:scanner.pages[0][0]]
+    suffix = html_content[scanner.pages[-1][1]:]
+    return [prefix + html_content[start:end] + suffix for start, end in scanner.pages]
+
+
+def can_merge():
+    """Return True if the optional PDF merging dependency is installed."""
+    return PdfWriter is not None
+
+
+def merge_pdfs(paths, output_path):
+    """
+    Concatenate PDF files into one.
+
+    Args:
+        paths: PDF files (paths or binary file objects) in page order
+        output_path: File to write
+    """
+    writer = PdfWriter()
+    for path in paths:
+        writer.append(path)
+    with open(output_path, 'wb') as f:
+        writer.write(f)
+    writer.close()
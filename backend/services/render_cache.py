@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Render Cache Service - on-disk LRU of rendered PDFs
+
+PDFs are stored under RENDER_CACHE_DIR, keyed by the SHA-256 of the renderer
+version, the stylesheet, the base URL and the HTML. Images referenced as
+/api/blobs/<sha256> are content-addressed, so the HTML alone identifies the
+output. The least recently used files are evicted once the total size
+exceeds RENDER_CACHE_MAX_BYTES.
+
+Cached PDFs are handed out as files opened while the cache is locked, so a
+concurrent eviction cannot remove one between lookup and read: an open file
+stays readable after it is unlinked.
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from flask import current_app
+
+from .renderer import STYLESHEETS
+
+logger = logging.getLogger(__name__)
+
+
+class RenderCache:
+    """Size-capped LRU of PDF files keyed by render input."""
+
+    def __init__(self, root, max_bytes, version):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.version = version
+        self._entries = OrderedDict()  # key -> size in bytes
+        self._total = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        os.makedirs(root, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        """Index files left by earlier runs, oldest use first."""
+        found = []
+        for filename in os.listdir(self.root):
+            filepath = os.path.join(self.root, filename)
+            if filename.endswith('.pdf'):
+                stat = os.stat(filepath)
+                found.append((stat.st_mtime, filename[:-len('.pdf')], stat.st_size))
+            elif filename.endswith('.tmp'):
+                # Interrupted render
+                os.unlink(filepath)
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._total += size
+        self._evict()
+
+    def key(self, html_content, stylesheet, base_url=None, variant='full'):
+        """
+        Return the cache key of a render.
+
+        Args:
+            variant: 'full' for a single render, 'pages' for a document merged
+                from per-page renders
+        """
+        digest = hashlib.sha256()
+        parts = (self.version, variant, stylesheet, STYLESHEETS[stylesheet], base_url or '', html_content)
+        for part in parts:
+            digest.update(part.encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.root, f'{key}.pdf')
+
+    def lookup(self, key):
+        """
+        Open a cached PDF.
+
+        A hit refreshes the entry's position (and mtime, which orders the
+        entries again after a restart).
+
+        Returns:
+            The PDF opened for binary reading, which the caller closes, or
+            None on a miss
+        """
+        filepath = self.path(key)
+        with self._lock:
+            if key not in self._entries:
+                self._misses += 1
+                return None
+            try:
+                pdf_file = open(filepath, 'rb')
+            except FileNotFoundError:
+                self._forget(key)
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+        try:
+            os.utime(filepath)
+        except OSError:
+            pass
+        return pdf_file
+
+    def reserve(self):
+        """Return a temporary path inside the cache to render into."""
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix='.', suffix='.tmp')
+        os.close(fd)
+        return tmp_path
+
+    def release(self, tmp_path):
+        """Remove a reserved path that was not stored."""
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+
+    def store(self, key, tmp_path):
+        """
+        Move a rendered file into the cache.
+
+        Returns:
+            The cached PDF opened for binary reading (see lookup)
+        """
+        filepath = self.path(key)
+        size = os.path.getsize(tmp_path)
+        os.replace(tmp_path, filepath)
+        with self._lock:
+            pdf_file = open(filepath, 'rb')
+            self._forget(key)
+            self._entries[key] = size
+            self._total += size
+            self._evict()
+        return pdf_file
+
+    def store_bytes(self, key, data):
+        """Cache PDF bytes and return the cached file, opened (see store)."""
+        tmp_path = self.reserve()
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            return self.store(key, tmp_path)
+        except BaseException:
+            self.release(tmp_path)
+            raise
+
+    def _forget(self, key):
+        size = self._entries.pop(key, None)
+        if size is not None:
+            self._total -= size
+
+    def _evict(self):
+        # The newest entry is kept even if it alone exceeds the cap
+        while self._total > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            self._total -= size
+            self._evictions += 1
+            try:
+                os.unlink(self.path(key))
+            except OSError as e:
+                logger.error(f"Error evicting cached render {key}: {e}")
+
+    def clear(self):
+        """Remove every cached PDF."""
+        with self._lock:
+            keys = list(self._entries)
+            self._entries.clear()
+            self._total = 0
+        for key in keys:
+            try:
+                os.unlink(self.path(key))
+            except OSError:
+                pass
+
+    def stats(self):
+        """Return hit/miss counters and the current size of the cache."""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'hitRate': round(self._hits / lookups, 3) if lookups else None,
+                'evictions': self._evictions,
+                'entries': len(self._entries),
+                'bytes': self._total,
+                'maxBytes': self.max_bytes,
+                'version': self.version
+            }
+
+
+def get_render_cache():
+    """Return the render cache of the current application."""
+    return current_app.extensions['render_cache']
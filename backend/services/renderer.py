@@ -0,0 +1,409 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Renderer Service - HTML to PDF rendering with WeasyPrint
+
+A PdfRenderer imports WeasyPrint, builds the font configuration, parses the
+base stylesheets and sets up the blob URL fetcher once, then reuses them for
+every render. The app keeps one renderer (optionally warmed at start-up) and
+each export worker process builds its own.
+
+Renders in request threads run concurrently. A font configuration (Pango
+font state) and the stylesheets parsed against it are not shared between
+renders running at the same time: each render checks out an idle one and
+returns it afterwards, so the renderer holds as many as the peak number of
+concurrent renders, each built once (tens of milliseconds) and then reused.
+
+With a fonts directory, the font files in it are registered explicitly and
+served as cached glyph subsets (see services/fonts.py) instead of being
+discovered and loaded in full through fontconfig.
+
+The phases of a render are timed separately: fonts, parse, layout (which
+includes fetching images, also reported as imageFetch), imageDecode (raster
+images decoded and re-encoded for the PDF, which WeasyPrint does while
+writing) and write (the rest of writing the PDF).
+"""
+
+import functools
+import importlib.metadata
+import os
+import threading
+import time
+from flask import current_app
+
+from .blob_store import BlobStore
+from .fonts import FontManager
+
+# Base CSS for exported PDFs
+EXPORT_CSS = '''
+    @page {
+        size: A4;
+        margin: 0;
+    }
+    body {
+        font-family: "Microsoft YaHei", "SimSun", sans-serif;
+        margin: 0;
+        padding: 0;
+    }
+    .page {
+        page-break-after: always;
+    }
+    .page:last-child {
+        page-break-after: auto;
+    }
+'''
+
+# Base CSS for previews
+PREVIEW_CSS = '''
+    @page {
+        size: A4;
+        margin: 0;
+    }
+    body {
+        font-family: "Microsoft YaHei", "SimSun", sans-serif;
+        margin: 0;
+        padding: 0;
+    }
+'''
+
+STYLESHEETS = {
+    'export': EXPORT_CSS,
+    'preview': PREVIEW_CSS
+}
+
+# Bump when the same HTML would render differently (invalidates cached PDFs)
+RENDERER_VERSION = '3'
+
+# Rendered during warm-up so font discovery happens before the first export
+WARMUP_HTML = '<div class="page"><p>预热 Warm-up 0123456789</p></div>'
+
+
+# Phase timings of the render running in each thread, for _time_image_decoding
+_decode_timings = threading.local()
+_decode_timer_lock = threading.Lock()
+
+
+def _time_image_decoding():
+    """
+    Add WeasyPrint's image decoding to the imageDecode phase of renders.
+
+    WeasyPrint decodes raster images when write_pdf builds their PDF objects
+    (RasterImage.get_x_object; JPEG data is copied as is). The method is
+    wrapped once per process and adds its time to the render running in the
+    calling thread.
+
+    Returns:
+        True if image decoding is timed, False if this WeasyPrint version
+        has no such method
+    """
+    try:
+        from weasyprint.images import RasterImage
+    except ImportError:
+        return False
+    with _decode_timer_lock:
+        get_x_object = RasterImage.__dict__.get('get_x_object')
+        if get_x_object is None:
+            return False
+        if getattr(get_x_object, 'timed', False):
+            return True
+
+        @functools.wraps(get_x_object)
+        def timed(self, *args, **kwargs):
+            timings = getattr(_decode_timings, 'current', None)
+            if timings is None:
+                return get_x_object(self, *args, **kwargs)
+            step = time.perf_counter()
+            try:
+                return get_x_object(self, *args, **kwargs)
+            finally:
+                timings['imageDecode'] = round(timings['imageDecode'] + _ms(step), 2)
+
+        timed.timed = True
+        RasterImage.get_x_object = timed
+        return True
+
+
+def renderer_version():
+    """Return the version string of the rendering pipeline, WeasyPrint included."""
+    try:
+        weasyprint_version = importlib.metadata.version('weasyprint')
+    except importlib.metadata.PackageNotFoundError:
+        weasyprint_version = 'none'
+    return f'{RENDERER_VERSION}/weasyprint-{weasyprint_version}'
+
+
+def _ms(start):
+    return round((time.perf_counter() - start) * 1000, 2)
+
+
+class PdfRenderer:
+    """WeasyPrint renderer with preloaded fonts, stylesheets and URL fetcher."""
+
+    def __init__(self, blobs_dir=None, fonts_dir=None, font_cache_dir=None):
+        self.blobs_dir = blobs_dir
+        self.fonts = None
+        if fonts_dir:
+            self.fonts = FontManager(
+                fonts_dir, font_cache_dir or os.path.join(fonts_dir, '.subsets')
+            )
+        self._weasyprint = None
+        self._url_fetcher = None
+        self._decode_timed = False
+        self._font_states = []  # idle _FontState objects
+        self._warm_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._font_states_lock = threading.Lock()
+        self.stats = {
+            'warm': False,
+            'warmupMs': None,
+            'warmup': {},
+            'renders': 0,
+            'failures': 0,
+            'firstRenderMs': None,
+            'steadyStateAvgMs': None,
+            'lastRenderMs': None,
+            'fontConfigurations': 0,
+            'fonts': self.fonts.stats if self.fonts else None
+        }
+        self._steady_total_ms = 0.0
+
+    @property
+    def warm(self):
+        return self._weasyprint is not None
+
+    def warm_up(self):
+        """
+        Load WeasyPrint, fonts and stylesheets; a no-op once warm.
+
+        Raises:
+            ImportError: If WeasyPrint is not installed
+        """
+        if self.warm:
+            return
+        with self._warm_lock:
+            if self.warm:
+                return
+            started = time.perf_counter()
+
+            step = time.perf_counter()
+            import weasyprint
+            from weasyprint.text.fonts import FontConfiguration
+            self._decode_timed = _time_image_decoding()
+            import_ms = _ms(step)
+
+            step = time.perf_counter()
+            font_state = _FontState(weasyprint, FontConfiguration)
+            url_fetcher = weasyprint.default_url_fetcher
+            if self.blobs_dir:
+                url_fetcher = BlobStore(self.blobs_dir).url_fetcher(url_fetcher)
+            stylesheets_ms = _ms(step)
+
+            step = time.perf_counter()
+            if self.fonts is not None:
+                self.fonts.register()
+            fonts_ms = _ms(step)
+
+            step = time.perf_counter()
+            weasyprint.HTML(string=WARMUP_HTML, url_fetcher=url_fetcher).write_pdf(
+                stylesheets=[font_state.stylesheets['export']], font_config=font_state.font_config
+            )
+            sample_ms = _ms(step)
+
+            self._font_states.append(font_state)
+            self.stats['fontConfigurations'] = 1
+            self._url_fetcher = url_fetcher
+            self._weasyprint = weasyprint
+            self.stats['warm'] = True
+            self.stats['warmupMs'] = _ms(started)
+            self.stats['warmup'] = {
+                'importMs': import_ms,
+                'stylesheetsMs': stylesheets_ms,
+                'fontsMs': fonts_ms,
+                'sampleRenderMs': sample_ms
+            }
+
+    def render(self, html_content, target=None, stylesheet='export', base_url=None, phases=None):
+        """
+        Render HTML to PDF.
+
+        Args:
+            html_content: The HTML document
+            target: File path or file object to write to; None returns bytes
+            stylesheet: Key of STYLESHEETS to apply
+            base_url: Base URL for relative links such as /api/blobs/<sha256>
+            phases: Optional dictionary that receives the duration (ms) of
+                each phase (fonts, parse, layout, imageFetch, imageDecode,
+                write), the
+                bytes of fetched images (imageBytes) and of the font subsets
+                (fontBytes)
+
+        Returns:
+            PDF bytes if target is None, otherwise None
+
+        Raises:
+            ImportError: If WeasyPrint is not installed
+        """
+        self.warm_up()
+        timings = {}
+        started = time.perf_counter()
+        try:
+            font_state = self._acquire_font_state()
+            try:
+                step = time.perf_counter()
+                stylesheets = [font_state.stylesheets[stylesheet]]
+                if self.fonts is not None and self.fonts.active:
+                    with self.fonts.subsets(html_content) as (font_css, font_metrics):
+                        stylesheets.insert(0, font_state.font_face_stylesheet(font_css))
+                    timings['fontBytes'] = font_metrics['subsetBytes']
+                timings['fonts'] = _ms(step)
+
+                step = time.perf_counter()
+                html = self._weasyprint.HTML(
+                    string=html_content,
+                    base_url=base_url,
+                    url_fetcher=self._timed_fetcher(timings)
+                )
+                timings['parse'] = _ms(step)
+
+                # Images are fetched during layout and decoded while writing
+                step = time.perf_counter()
+                document = html.render(stylesheets=stylesheets, font_config=font_state.font_config)
+                timings['layout'] = _ms(step)
+
+                step = time.perf_counter()
+                if self._decode_timed:
+                    timings['imageDecode'] = 0.0
+                    _decode_timings.current = timings
+                try:
+                    result = document.write_pdf(target)
+                finally:
+                    _decode_timings.current = None
+                # Writing without the image decoding, its own phase
+                timings['write'] = round(_ms(step) - timings.get('imageDecode', 0.0), 2)
+            finally:
+                self._release_font_state(font_state)
+        except Exception:
+            with self._stats_lock:
+                self.stats['failures'] += 1
+            raise
+        self._record(_ms(started))
+        if phases is not None:
+            phases.update(timings)
+        return result
+
+    def _timed_fetcher(self, timings):
+        """Wrap the URL fetcher to add up fetch time and image bytes of a render."""
+        timings['imageFetch'] = 0.0
+        timings['imageBytes'] = 0
+        # Unguarded: WeasyPrint fetches one URL at a time within a render
+
+        def fetch(url, *args, **kwargs):
+            step = time.perf_counter()
+            result = self._url_fetcher(url, *args, **kwargs)
+            timings['imageFetch'] = round(timings['imageFetch'] + _ms(step), 2)
+            if 'string' in result:
+                timings['imageBytes'] += len(result['string'])
+            elif 'file_obj' in result:
+                try:
+                    timings['imageBytes'] += os.fstat(result['file_obj'].fileno()).st_size
+                except (AttributeError, OSError, ValueError):
+                    pass
+            return result
+        return fetch
+
+    def _acquire_font_state(self):
+        """Take an idle font configuration, or build one if all are in use."""
+        with self._font_states_lock:
+            if self._font_states:
+                return self._font_states.pop()
+        from weasyprint.text.fonts import FontConfiguration
+        font_state = _FontState(self._weasyprint, FontConfiguration)
+        with self._stats_lock:
+            self.stats['fontConfigurations'] += 1
+        return font_state
+
+    def _release_font_state(self, font_state):
+        with self._font_states_lock:
+            self._font_states.append(font_state)
+
+    def _record(self, elapsed_ms):
+        with self._stats_lock:
+            stats = self.stats
+            stats['renders'] += 1
+            stats['lastRenderMs'] = elapsed_ms
+            if stats['firstRenderMs'] is None:
+                stats['firstRenderMs'] = elapsed_ms
+            else:
+                self._steady_total_ms += elapsed_ms
+                stats['steadyStateAvgMs'] = round(self._steady_total_ms / (stats['renders'] - 1), 2)
+
+
+class _FontState:
+    """A font configuration and the stylesheets parsed against it."""
+
+    def __init__(self, weasyprint, font_configuration):
+        self.weasyprint = weasyprint
+        self.font_config = font_configuration()
+        self.stylesheets = {
+            name: weasyprint.CSS(string=css, font_config=self.font_config)
+            for name, css in STYLESHEETS.items()
+        }
+        self._font_stylesheet = (None, None)  # (@font-face CSS, parsed stylesheet)
+
+    def font_face_stylesheet(self, font_css):
+        """Return the parsed @font-face rules, reparsed only when a subset grew."""
+        css, stylesheet = self._font_stylesheet
+        if css != font_css:
+            stylesheet = self.weasyprint.CSS(string=font_css, font_config=self.font_config)
+            self._font_stylesheet = (font_css, stylesheet)
+        return stylesheet
+
+
+# One renderer per blob directory in each process (used by export workers)
+_process_renderers = {}
+
+# Options of this process's renderers, set by init_worker in export workers
+_process_options = {'fonts_dir': None, 'font_cache_dir': None}
+
+
+def process_renderer(blobs_dir=None):
+    """Return this process's renderer for a blob directory."""
+    renderer = _process_renderers.get(blobs_dir)
+    if renderer is None:
+        renderer = _process_renderers.setdefault(
+            blobs_dir, PdfRenderer(blobs_dir, **_process_options)
+        )
+    return renderer
+
+
+def init_worker(blobs_dir=None, fonts_dir=None, font_cache_dir=None):
+    """Process pool initializer: warm the worker's renderer before its first job."""
+    _process_options.update(fonts_dir=fonts_dir, font_cache_dir=font_cache_dir)
+    try:
+        process_renderer(blobs_dir).warm_up()
+    except Exception:
+        # Reported by the first job that needs the renderer
+        pass
+
+
+def render_pdf(html_content, target=None, stylesheet='export', base_url=None, blobs_dir=None):
+    """Render HTML to PDF with this process's renderer (see PdfRenderer.render)."""
+    return process_renderer(blobs_dir).render(
+        html_content, target, stylesheet=stylesheet, base_url=base_url
+    )
+
+
+def render_pdf_file(html_content, output_path, base_url=None, blobs_dir=None):
+    """
+    Render HTML to a PDF file (process pool entry point).
+
+    Returns:
+        Size of the written file in bytes
+    """
+    render_pdf(html_content, output_path, base_url=base_url, blobs_dir=blobs_dir)
+    return os.path.getsize(output_path)
+
+
+def get_renderer():
+    """Return the PDF renderer of the current application."""
+    return current_app.extensions['renderer']
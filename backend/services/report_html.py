@@ -0,0 +1,314 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Report HTML Service - render report HTML from draft JSON on the server
+
+Mirrors the report editor views (frontend/src/views/report/*.vue) as Jinja
+templates under backend/templates/report, so an export only needs a draft
+(or its id) and a template instead of the serialized editor DOM. The
+templates are compiled once when the renderer is created.
+
+Pagination follows usePagination.js with the editor's default section
+heights; without a DOM to measure, multi-line text is estimated by its line
+count.
+"""
+
+import math
+import os
+import re
+from flask import current_app
+from jinja2 import ChainableUndefined, Environment, FileSystemLoader
+from markupsafe import Markup, escape
+
+from .storage import read_document
+
+TEMPLATES_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'templates', 'report'
+)
+
+# Report template type -> Jinja template. The English and Huawei editors are
+# still placeholders in the frontend, so they have no server template yet.
+REPORT_TEMPLATES = {
+    'general': 'general.html'
+}
+
+SECURITY_LEVELS = ['绝密', '机密', '内部公开', '外部公开']
+
+# Page geometry and section heights in CSS px, as in usePagination.js and
+# GeneralTemplate.vue
+USABLE_CONTENT_HEIGHT = 1123 - 38 - 57 - 75 - 60 - 25
+SECTION_HEADER_HEIGHT = 28
+TABLE_HEADER_HEIGHT = 32
+ROW_HEIGHT = 36
+IMAGE_ROW_HEIGHT = 260
+MIN_SPLIT_HEIGHT = SECTION_HEADER_HEIGHT + TABLE_HEADER_HEIGHT + ROW_HEIGHT + 20
+LINE_HEIGHT = 16
+
+SECTION_HEIGHTS = {
+    'reportInfo': 80,
+    'sampleInfo': 175,
+    'equipmentInfo': 75,
+    'testConditionsHeader': 30,
+    'testStandard': 70,
+    'judgmentStandard': 70,
+    'judgmentResult': 65
+}
+
+# Text fields whose line count grows a section
+MULTILINE_FIELDS = {
+    'sampleInfo': 'testPurpose',
+    'testStandard': 'testStandard',
+    'judgmentStandard': 'judgmentStandard',
+    'judgmentResult': 'judgmentResult'
+}
+
+TEMPLATE_ID_PATTERN = re.compile(r'^[\w-]+$')
+
+FORMAT_PROPERTIES = [
+    ('fontFamily', 'font-family'),
+    ('fontSize', 'font-size'),
+    ('color', 'color'),
+    ('fontWeight', 'font-weight'),
+    ('fontStyle', 'font-style'),
+    ('textDecoration', 'text-decoration'),
+    ('textAlign', 'text-align'),
+]
+
+
+class UnsupportedTemplateError(ValueError):
+    """Raised for report template types without a server-side template."""
+
+
+def text_html(text):
+    """Escape text and keep its line breaks, like textToHtml in the editor."""
+    if not text:
+        return Markup('')
+    return Markup('<br>').join(escape(line) for line in str(text).split('\n'))
+
+
+def _text_lines(text):
+    return max(1, len(str(text).split('\n'))) if text else 1
+
+
+def _section_height(section, fields):
+    height = SECTION_HEIGHTS[section]
+    field = MULTILINE_FIELDS.get(section)
+    if field:
+        height += (_text_lines(fields.get(field)) - 1) * LINE_HEIGHT
+    return height
+
+
+def _split_rows(region, available, row_height, header_height, repeat_header):
+    """Split a row region into parts; the first part fills `available`."""
+    parts = []
+    start, count = 0, region['count']
+    first = max(0, math.floor((available - header_height) / row_height))
+    if first > 0:
+        end = min(first, count)
+        parts.append(dict(region, start=start, end=end,
+                          height=(end - start) * row_height + header_height))
+        start = end
+    per_page = max(1, math.floor((USABLE_CONTENT_HEIGHT - repeat_header) / row_height))
+    while start < count:
+        end = min(start + per_page, count)
+        parts.append(dict(region, start=start, end=end, continuation=True,
+                          height=(end - start) * row_height + repeat_header))
+        start = end
+    return parts
+
+
+def paginate(fields, result_count, image_count):
+    """
+    Distribute the report sections over A4 pages.
+
+    Returns:
+        List of pages, each a list of regions with type, start, end and
+        continuation
+    """
+    regions = []
+    for section in ('reportInfo', 'sampleInfo', 'equipmentInfo', 'testConditionsHeader',
+                    'testStandard', 'judgmentStandard'):
+        regions.append({'type': section, 'height': _section_height(section, fields)})
+    regions.append({
+        'type': 'testResults', 'count': result_count, 'splittable': True,
+        'height': SECTION_HEADER_HEIGHT + TABLE_HEADER_HEIGHT + result_count * ROW_HEIGHT + 45
+    })
+    regions.append({'type': 'judgmentResult', 'height': _section_height('judgmentResult', fields)})
+    regions.append({
+        'type': 'testImages', 'count': image_count, 'splittable': True,
+        'height': SECTION_HEADER_HEIGHT + 50 + image_count * IMAGE_ROW_HEIGHT
+    })
+
+    pages = []
+    current, remaining = [], USABLE_CONTENT_HEIGHT
+
+    def new_page():
+        nonlocal current, remaining
+        if current:
+            pages.append(current)
+        current, remaining = [], USABLE_CONTENT_HEIGHT
+
+    for region in regions:
+        region = dict(region, start=0, end=region.get('count'), continuation=False)
+        if region['height'] <= remaining:
+            current.append(region)
+            remaining -= region['height']
+            continue
+        if not region.get('splittable'):
+            new_page()
+            current.append(region)
+            remaining -= region['height']
+            continue
+
+        if remaining < MIN_SPLIT_HEIGHT and region['height'] <= USABLE_CONTENT_HEIGHT:
+            new_page()
+        if region['type'] == 'testResults':
+            header = SECTION_HEADER_HEIGHT + TABLE_HEADER_HEIGHT
+            parts = _split_rows(region, remaining, ROW_HEIGHT, header, header)
+        else:
+            parts = _split_rows(region, remaining, IMAGE_ROW_HEIGHT,
+                                SECTION_HEADER_HEIGHT, SECTION_HEADER_HEIGHT)
+        for index, part in enumerate(parts):
+            if index > 0 or part['height'] > remaining:
+                new_page()
+            current.append(part)
+            remaining -= part['height']
+
+    if current:
+        pages.append(current)
+    return pages
+
+
+def image_layout(count):
+    """Return the (columns, rows) grid of an image box, as in ImageUploader.vue."""
+    if count <= 1:
+        return 1, 1
+    if count == 2:
+        return 2, 1
+    if count <= 4:
+        return 2, 2
+    return 3, 3
+
+
+def load_report_template(templates_dir, template_type, template_id=None):
+    """
+    Load the template settings a report is rendered with.
+
+    Args:
+        templates_dir: Directory of the custom and applied templates
+        template_type: Report template type, used for the applied template
+        template_id: Custom template id; defaults to the applied template
+
+    Returns:
+        Template dictionary ({} if no template has been applied)
+
+    Raises:
+        FileNotFoundError: If template_id names a missing template
+    """
+    if template_id:
+        if not TEMPLATE_ID_PATTERN.match(template_id):
+            raise FileNotFoundError(f'Template not found: {template_id}')
+        filepath = os.path.join(templates_dir, f'custom_{template_id}.json')
+        if not os.path.exists(filepath):
+            raise FileNotFoundError(f'Template not found: {template_id}')
+        return read_document(filepath)
+    filepath = os.path.join(templates_dir, f'applied_{template_type}.json')
+    if os.path.exists(filepath):
+        return read_document(filepath)
+    return {}
+
+
+class ReportHtmlRenderer:
+    """Precompiled Jinja templates that turn draft JSON into report HTML."""
+
+    def __init__(self, templates_dir=TEMPLATES_DIR):
+        self.env = Environment(
+            loader=FileSystemLoader(templates_dir),
+            autoescape=True,
+            auto_reload=False,
+            trim_blocks=True,
+            lstrip_blocks=True,
+            undefined=ChainableUndefined
+        )
+        self.env.filters['text_html'] = text_html
+        self.templates = {
+            template_type: self.env.get_template(name)
+            for template_type, name in REPORT_TEMPLATES.items()
+        }
+
+    def supports(self, template_type):
+        return template_type in self.templates
+
+    def render(self, draft, template=None):
+        """
+        Render the HTML of a draft.
+
+        Args:
+            draft: Draft dictionary (title, templateType, content)
+            template: Template settings (logo, signatures, seal, labels,
+                column widths, field formats)
+
+        Returns:
+            Complete HTML document with one .a4-page element per page
+
+        Raises:
+            UnsupportedTemplateError: If the template type has no server template
+        """
+        template_type = draft.get('templateType') or 'general'
+        if template_type not in self.templates:
+            raise UnsupportedTemplateError(
+                f'Server-side rendering is not available for template type: {template_type}'
+            )
+        template = template or {}
+        content = draft.get('content') or {}
+        fields = content.get('fields') or {}
+        result_rows = content.get('testResultRows') or []
+        image_rows = content.get('testImageRows') or []
+
+        # Draft formats are the template's after editing; they take precedence
+        formats = dict(template.get('fieldFormats') or {})
+        formats.update(content.get('fieldFormats') or {})
+        labels = template.get('templateContentData') or {}
+        column_widths = template.get('tableColumnWidths') or {}
+
+        def field_style(field_id, default=None):
+            style = dict(default or {})
+            for key, prop in FORMAT_PROPERTIES:
+                value = (formats.get(field_id) or {}).get(key)
+                if value:
+                    style[prop] = f'{value}px' if key == 'fontSize' else value
+            return '; '.join(f'{prop}: {value}' for prop, value in style.items())
+
+        def label(key, default):
+            return text_html(labels.get(key) or default)
+
+        def column_style(table, index):
+            widths = column_widths.get(table) or []
+            if index < len(widths) and widths[index] and widths[index] > 0:
+                return f'width: {widths[index]}px'
+            return ''
+
+        def align(field_id):
+            return (formats.get(field_id) or {}).get('textAlign') or 'center'
+
+        pages = paginate(fields, len(result_rows), len(image_rows))
+        return self.templates[template_type].render(
+            title=draft.get('title') or '',
+            fields=fields,
+            result_rows=result_rows,
+            image_rows=image_rows,
+            pages=pages,
+            template=template,
+            security_level=fields.get('securityLevel') or template.get('securityLevel') or '内部公开',
+            security_levels=SECURITY_LEVELS,
+            field_style=field_style,
+            label=label,
+            column_style=column_style,
+            align=align,
+            image_layout=image_layout
+        )
+
+
+def get_report_html_renderer():
+    """Return the report HTML renderer of the current application."""
+    return current_app.extensions['report_html']
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Response Cache Service - in-process cache of serialized JSON documents
+
+Caches the response bytes of frequently read documents (default and applied
+templates) keyed by file path. An entry is valid while the file's mtime and
+size are unchanged; writers can also invalidate a path explicitly. Hits skip
+both the disk read and JSON encoding, and carry a strong ETag computed once
+from the serialized bytes.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict, namedtuple
+from flask import current_app
+
+from .storage import read_document
+
+CachedDocument = namedtuple('CachedDocument', ['body', 'etag'])
+
+
+def serialize_json(document):
+    """Serialize a document to the compact UTF-8 JSON used in responses."""
+    return json.dumps(document, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def json_etag(body):
+    """Return the strong ETag (without quotes) of serialized response bytes."""
+    return hashlib.sha256(body).hexdigest()[:32]
+
+
+class FileResponseCache:
+    """Bounded LRU of pre-serialized JSON responses keyed by file path."""
+
+    def __init__(self, max_entries=32):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # path -> (mtime_ns, size, CachedDocument)
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0}
+
+    def get(self, filepath):
+        """
+        Return the serialized JSON of a document.
+
+        Args:
+            filepath: Path of a document readable by read_document
+
+        Returns:
+            CachedDocument with the JSON bytes and their ETag, or None if
+            the file does not exist
+        """
+        try:
+            stat = os.stat(filepath)
+        except FileNotFoundError:
+            self.invalidate(filepath)
+            return None
+
+        with self._lock:
+            entry = self._entries.get(filepath)
+            if entry and entry[0] == stat.st_mtime_ns and entry[1] == stat.st_size:
+                self._entries.move_to_end(filepath)
+                self.stats['hits'] += 1
+                return entry[2]
+            self.stats['misses'] += 1
+
+        # Stat before reading: a concurrent write changes mtime/size and the
+        # next lookup re-reads, so stale bytes are never served for long
+        body = serialize_json(read_document(filepath))
+        document = CachedDocument(body, json_etag(body))
+
+        with self._lock:
+            self._entries[filepath] = (stat.st_mtime_ns, stat.st_size, document)
+            self._entries.move_to_end(filepath)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return document
+
+    def invalidate(self, filepath):
+        """Forget a cached path, e.g. right after writing it."""
+        with self._lock:
+            self._entries.pop(filepath, None)
+
+
+def get_template_cache():
+    """Return the template response cache of the current application."""
+    return current_app.extensions['template_cache']
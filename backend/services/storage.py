@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Storage Service - helpers for reading and writing JSON documents on disk
+
+Documents can be stored in several formats, selected by STORAGE_FORMAT:
+
+- json-pretty: indented JSON (the historical format)
+- json: compact JSON without insignificant whitespace
+- gzip: gzip-framed compact JSON
+- zstd: zstd-framed compact JSON (requires the optional 'zstandard' package)
+
+Readers detect the format from the leading bytes of the file, so files in
+different formats can coexist and be migrated gradually.
+"""
+
+import gzip
+import json
+import logging
+import os
+import tempfile
+import time
+
+try:
+    import zstandard
+except ImportError:  # Optional dependency
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+STORAGE_FORMATS = ('json-pretty', 'json', 'gzip', 'zstd')
+
+
+def detect_format(raw):
+    """Return the storage format of raw file bytes."""
+    if raw.startswith(GZIP_MAGIC):
+        return 'gzip'
+    if raw.startswith(ZSTD_MAGIC):
+        return 'zstd'
+    return 'json'
+
+
+def dumps_document(data, fmt='json'):
+    """
+    Serialize a document to bytes.
+
+    Args:
+        data: JSON-serializable document
+        fmt: One of STORAGE_FORMATS
+
+    Returns:
+        Encoded bytes
+    """
+    if fmt == 'json-pretty':
+        return json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8')
+
+    raw = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    if fmt == 'json':
+        return raw
+    if fmt == 'gzip':
+        # mtime=0 keeps the output deterministic for identical documents
+        return gzip.compress(raw, compresslevel=6, mtime=0)
+    if fmt == 'zstd':
+        if zstandard is None:
+            raise RuntimeError('zstd storage requires the zstandard package')
+        return zstandard.ZstdCompressor(level=3).compress(raw)
+    raise ValueError(f'Unknown storage format: {fmt}')
+
+
+def loads_document(raw):
+    """Parse document bytes in any supported storage format."""
+    fmt = detect_format(raw)
+    if fmt == 'gzip':
+        raw = gzip.decompress(raw)
+    elif fmt == 'zstd':
+        if zstandard is None:
+            raise RuntimeError('Reading zstd documents requires the zstandard package')
+        raw = zstandard.ZstdDecompressor().decompressobj().decompress(raw)
+    return json.loads(raw.decode('utf-8'))
+
+
+def read_document(filepath):
+    """Load a document from disk, whatever its storage format."""
+    with open(filepath, 'rb') as f:
+        return loads_document(f.read())
+
+
+def write_document(filepath, data, fmt='json'):
+    """
+    Write a document so readers never observe a half-written file.
+
+    The document is written to a temporary file in the same directory and
+    then renamed over the target, which is atomic on both POSIX and Windows.
+    """
+    payload = dumps_document(data, fmt)
+    directory = os.path.dirname(filepath) or '.'
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def migrate_directory(directory, fmt, dry_run=False):
+    """
+    Convert every JSON document of a directory to another storage format.
+
+    Args:
+        directory: Directory holding *.json documents
+        fmt: Target storage format
+        dry_run: Measure only, do not rewrite files
+
+    Returns:
+        Dictionary with file count, bytes before/after and the average
+        parse time per document before/after, in milliseconds
+    """
+    stats = {
+        'files': 0, 'converted': 0, 'errors': 0,
+        'bytesBefore': 0, 'bytesAfter': 0,
+        'parseMsBefore': 0.0, 'parseMsAfter': 0.0
+    }
+    if not os.path.isdir(directory):
+        return stats
+
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith('.json'):
+            continue
+        filepath = os.path.join(directory, filename)
+        try:
+            with open(filepath, 'rb') as f:
+                raw = f.read()
+            start = time.perf_counter()
+            data = loads_document(raw)
+            stats['parseMsBefore'] += (time.perf_counter() - start) * 1000
+
+            payload = dumps_document(data, fmt)
+            stats['files'] += 1
+            stats['bytesBefore'] += len(raw)
+            stats['bytesAfter'] += len(payload)
+
+            start = time.perf_counter()
+            loads_document(payload)
+            stats['parseMsAfter'] += (time.perf_counter() - start) * 1000
+
+            if not dry_run and payload != raw:
+                write_document(filepath, data, fmt)
+                stats['converted'] += 1
+        except Exception as e:
+            logger.error(f"Error migrating {filepath}: {e}")
+            stats['errors'] += 1
+
+    if stats['files']:
+        stats['parseMsBefore'] = round(stats['parseMsBefore'] / stats['files'], 3)
+        stats['parseMsAfter'] = round(stats['parseMsAfter'] / stats['files'], 3)
+    return stats
@@ -0,0 +1,437 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+PDF Export Benchmark for Reliability Test Report Automation Tool
+
+Generates synthetic reports and exports them through the Flask app's
+/api/export/pdf and /api/export/preview endpoints (the code paths behind
+export_pdf and preview_pdf), recording wall time, peak RSS and output size
+for every case. Each (case, endpoint) pair runs in a fresh process against a
+temporary DATA_DIR, so peak RSS is per case and the real data is untouched;
+the render cache is cleared before every repetition.
+
+Usage:
+    python scripts/bench_export.py                       # run, write bench_results.json
+    python scripts/bench_export.py --cases small medium  # run a subset
+    python scripts/bench_export.py --save-baseline       # store results as the baseline
+    python scripts/bench_export.py --baseline bench/export_baseline.json --threshold 0.2
+    FONTS_DIR=/path/to/fonts python scripts/bench_export.py --compare-fonts -o fonts.json
+
+Exits with status 1 if any case is slower or larger than the baseline by
+more than the threshold. Reports record the machine and the renderer they
+were measured with, and cases are only compared against a baseline recorded
+with the same renderer.
+
+The English and Huawei report views are still placeholders, so the en-labels
+and huawei-labels cases render the general layout with the labels of those
+templates (layout and labels in their records); they do not measure layouts
+of their own.
+
+Every case uses a template with a logo, a department seal and signature
+images as inline data URLs, like templates saved by the editor.
+
+With --compare-fonts, every case also runs with an empty font directory
+(fonts left to fontconfig), and the time and PDF bytes the cached font
+subsets of FONTS_DIR save per export are reported as fontSubsetSavings.
+"""
+
+import argparse
+import base64
+import importlib.metadata
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / 'backend'
+DEFAULT_BASELINE = Path(__file__).resolve().parent.parent / 'bench' / 'export_baseline.json'
+
+ENDPOINTS = {
+    'pdf': '/api/export/pdf',
+    'preview': '/api/export/preview'
+}
+
+# name -> (template type, test result rows, images)
+CASES = {
+    'small': ('general', 3, 0),
+    'medium': ('general', 50, 24),
+    'large': ('general', 200, 90),
+    'xlarge': ('general', 500, 200),
+    'report-30': ('general', 260, 150),
+    # General layout with the labels of the other templates (see the docstring)
+    'en-labels-small': ('general_en', 3, 0),
+    'en-labels-medium': ('general_en', 50, 24),
+    'huawei-labels-small': ('huawei', 3, 0),
+    'huawei-labels-medium': ('huawei', 50, 24),
+}
+
+# Template labels of the report types without a server-side layout of their own
+TEMPLATE_LABELS = {
+    'general': {},
+    'general_en': {
+        'companyName': 'Shenzhen Sunwin Intelligent Co., Ltd.',
+        'reportTitle': 'Reliability Test Report',
+        'reportNumberLabel': 'Report No.: ',
+        'sampleInfoHeader': 'Sample Information',
+        'equipmentInfoHeader': 'Equipment Information',
+        'testConditionsHeader': 'Test Conditions',
+        'testResultsHeader': 'Test Results',
+        'testImagesHeader': 'Test Pictures',
+    },
+    'huawei': {
+        'companyName': '深圳市欣威智能有限公司',
+        'reportTitle': '华为可靠性实验报告',
+        'recordCode': '记录代码：HW-REL-01/A0',
+    },
+}
+
+# Distinct photos per case; boxes beyond this reuse them, like a real report
+DISTINCT_IMAGES = 12
+IMAGE_SIZE = (1600, 1200)
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    divisor = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return round(peak / divisor, 1)
+
+
+def _synthetic_image(index):
+    """Return the JPEG bytes of a photo-like test image."""
+    from PIL import Image, ImageDraw
+
+    img = Image.effect_noise(IMAGE_SIZE, 40 + index).convert('RGB')
+    draw = ImageDraw.Draw(img)
+    draw.rectangle([100 + index * 20, 100, 900, 800], fill=(40 * index % 255, 120, 200))
+    buffer = io.BytesIO()
+    img.save(buffer, 'JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def _data_url(data, mime_type):
+    return f'data:{mime_type};base64,{base64.b64encode(data).decode("ascii")}'
+
+
+def _template_images():
+    """Return logo, seal and signature settings with PNG data URLs."""
+    from PIL import Image, ImageDraw
+
+    def png(size, color, text):
+        img = Image.new('RGBA', size, (255, 255, 255, 0))
+        draw = ImageDraw.Draw(img)
+        draw.ellipse([4, 4, size[0] - 4, size[1] - 4], outline=color, width=6)
+        draw.text((size[0] // 4, size[1] // 2 - 6), text, fill=color)
+        buffer = io.BytesIO()
+        img.save(buffer, 'PNG')
+        return _data_url(buffer.getvalue(), 'image/png')
+
+    return {
+        'logo': {'dataUrl': png((400, 160), (0, 80, 160, 255), 'LOGO'), 'size': 100},
+        'departmentSeal': {'dataUrl': png((300, 300), (200, 0, 0, 255), 'SEAL'), 'size': 120},
+        'signatures': {
+            role: {'dataUrl': png((240, 80), (0, 0, 0, 255), role), 'size': 30}
+            for role in ('tester', 'reviewer', 'approver')
+        }
+    }
+
+
+def _synthetic_draft(template_type, result_rows, images, image_urls):
+    """Build a draft with the given number of result rows and images."""
+    fields = {
+        'reportNumber': 'BENCH-0001',
+        'testProject': '高温高湿存储试验',
+        'testConclusion': 'PASS',
+        'customer': '基准客户',
+        'productName': '智能终端',
+        'testPurpose': '验证产品在高温高湿环境下的可靠性',
+        'testStandard': 'GB/T 2423.3-2016 温度 40℃，湿度 93%RH，持续 96h',
+        'judgmentStandard': '外观无异常，功能正常',
+        'judgmentResult': '所有样品外观、功能检查均符合要求',
+        'tester': '张三',
+    }
+    rows = [
+        {
+            'id': i + 1,
+            'appearance': '无异常',
+            'function': '正常',
+            'other': '—',
+            'conclusion': 'PASS',
+            'note': f'样品 {i + 1}'
+        }
+        for i in range(result_rows)
+    ]
+    image_rows = []
+    remaining, counter = images, 0
+    while remaining > 0:
+        row = {'id': len(image_rows) + 1, 'before': [], 'during': [], 'after': []}
+        for position in ('before', 'during', 'after'):
+            if remaining > 0:
+                row[position].append({
+                    'filename': f'bench_{counter}.jpg',
+                    'dataUrl': image_urls[counter % len(image_urls)]
+                })
+                counter += 1
+                remaining -= 1
+        image_rows.append(row)
+    return {
+        'title': f'Benchmark {template_type} {result_rows}x{images}',
+        'templateType': 'general',
+        'content': {
+            'fields': fields,
+            'fieldFormats': {},
+            'testResultRows': rows,
+            'testImageRows': image_rows
+        }
+    }
+
+
+def run_case(name, endpoint, repeat, font_subsets=True):
+    """Run one case against one endpoint in this process and return its record."""
+    template_type, result_rows, images = CASES[name]
+
+    with tempfile.TemporaryDirectory(prefix='bench-export-') as data_dir:
+        os.environ['DATA_DIR'] = data_dir
+        os.environ['AUTOSAVE_FLUSH_INTERVAL'] = '0'
+        if not font_subsets:
+            os.environ['FONTS_DIR'] = os.path.join(data_dir, 'no-fonts')
+        sys.path.insert(0, str(BACKEND_DIR))
+        from app import create_app
+
+        app = create_app()
+        client = app.test_client()
+
+        image_urls = []
+        for index in range(min(images, DISTINCT_IMAGES)):
+            response = client.post('/api/export/upload-image', data={
+                'file': (io.BytesIO(_synthetic_image(index)), f'bench_{index}.jpg')
+            }, content_type='multipart/form-data')
+            image_urls.append(response.get_json()['images'][0]['url'])
+
+        template_id = f'bench-{template_type}'
+        template = {
+            'id': template_id,
+            'baseType': 'general',
+            'templateContentData': dict(TEMPLATE_LABELS[template_type], placeholders={}),
+            **_template_images()
+        }
+        with open(os.path.join(app.config['TEMPLATES_DIR'], f'custom_{template_id}.json'), 'w',
+                  encoding='utf-8') as f:
+            json.dump(template, f, ensure_ascii=False)
+
+        draft = _synthetic_draft(template_type, result_rows, images, image_urls)
+        draft_id = client.post('/api/report/drafts', json=draft).get_json()['id']
+        payload = {'draftId': draft_id, 'templateId': template_id}
+
+        html_timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            html = app.extensions['report_html'].render(draft, template)
+            html_timings.append((time.perf_counter() - start) * 1000)
+
+        cache = app.extensions['render_cache']
+        timings, output_bytes, error = [], None, None
+        for _ in range(repeat):
+            cache.clear()
+            start = time.perf_counter()
+            response = client.post(ENDPOINTS[endpoint], json=payload)
+            body = response.get_data()
+            timings.append((time.perf_counter() - start) * 1000)
+
+            # /preview answers with the PDF as a base64 data URL in JSON
+            result = response.get_json(silent=True) if response.is_json else None
+            if response.status_code != 200 or (result is not None and 'pdfData' not in result):
+                result = result or {}
+                error = result.get('error') or result.get('message') or f'HTTP {response.status_code}'
+                break
+            output_bytes = len(body)
+
+    return {
+        'case': name,
+        'endpoint': endpoint,
+        'layout': 'general',
+        'labels': template_type,
+        'resultRows': result_rows,
+        'images': images,
+        'pages': html.count('class="a4-page"'),
+        'htmlBytes': len(html.encode('utf-8')),
+        'htmlMs': round(statistics.median(html_timings), 2),
+        'wallMs': round(statistics.median(timings), 2) if timings and error is None else None,
+        'wallMsMin': round(min(timings), 2) if timings and error is None else None,
+        'repeat': repeat,
+        'outputBytes': output_bytes,
+        'fontSubsets': font_subsets,
+        'fonts': app.extensions['renderer'].stats['fonts'],
+        'peakRssMb': _peak_rss_mb(),
+        'error': error
+    }
+
+
+def _run_in_subprocess(name, endpoint, repeat, font_subsets=True):
+    command = [sys.executable, __file__, '--run-case', name, '--endpoint', endpoint,
+               '--repeat', str(repeat)]
+    if not font_subsets:
+        command.append('--no-font-subsets')
+    completed = subprocess.run(command, capture_output=True, text=True)
+    if completed.returncode != 0:
+        return {'case': name, 'endpoint': endpoint, 'error': completed.stderr.strip()[-2000:]}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def _compare_fonts(result, without):
+    """Record the time and PDF bytes the font subsets saved against a run without them."""
+    if without.get('error') or not (result['fonts'] or {}).get('fonts'):
+        error = without.get('error') or 'no fonts registered from FONTS_DIR'
+        result['fontSubsetSavings'] = {'error': error}
+        print(f"{'':31} font subsets: {error.splitlines()[-1]}")
+        return
+    savings = {
+        'wallMs': round(without['wallMs'] - result['wallMs'], 2),
+        'outputBytes': without['outputBytes'] - result['outputBytes'],
+        'wallMsWithout': without['wallMs'],
+        'outputBytesWithout': without['outputBytes']
+    }
+    result['fontSubsetSavings'] = savings
+    print(f"{'':31} font subsets save {savings['wallMs']:10.1f} ms "
+          f"{savings['outputBytes']:>12,} bytes per export")
+
+
+def machine_info():
+    """Describe the machine and the PDF renderer a run is measured with."""
+    try:
+        import weasyprint  # noqa: F401
+        renderer = f"weasyprint {importlib.metadata.version('weasyprint')}"
+    except Exception as e:
+        # Not installed, or its native libraries (Pango) are missing
+        renderer = f"unavailable ({type(e).__name__}: {str(e).splitlines()[0] if str(e) else ''})"
+    try:
+        memory_mb = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') // (1024 * 1024)
+    except (AttributeError, ValueError, OSError):  # Windows
+        memory_mb = None
+    return {
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'processor': platform.processor() or None,
+        'cpus': os.cpu_count(),
+        'memoryMb': memory_mb,
+        'python': platform.python_version(),
+        'renderer': renderer
+    }
+
+
+def compare(results, baseline, threshold, machine=None):
+    """
+    Compare results with a baseline.
+
+    Wall time, peak RSS and output size are compared for the cases both
+    runs rendered, and only if both used the same renderer.
+
+    Returns:
+        List of regression descriptions
+    """
+    previous = {(r['case'], r['endpoint']): r for r in baseline.get('results', [])}
+    same_renderer = (machine or {}).get('renderer') == baseline.get('machine', {}).get('renderer')
+    regressions = []
+    for result in results:
+        base = previous.get((result['case'], result['endpoint']))
+        if not base or not same_renderer or result.get('error') or base.get('error'):
+            continue
+        for metric in ('wallMs', 'peakRssMb', 'outputBytes'):
+            old, new = base.get(metric), result.get(metric)
+            if old and new and new > old * (1 + threshold):
+                regressions.append(
+                    f"{result['case']}/{result['endpoint']}: {metric} {old} -> {new} "
+                    f"(+{(new / old - 1) * 100:.0f}%)"
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark PDF export on synthetic reports')
+    parser.add_argument('--cases', nargs='+', choices=sorted(CASES), default=None,
+                        help='Cases to run (default: all)')
+    parser.add_argument('--endpoints', nargs='+', choices=sorted(ENDPOINTS), default=sorted(ENDPOINTS))
+    parser.add_argument('--repeat', type=int, default=3, help='Renders per case (median is reported)')
+    parser.add_argument('--output', '-o', default='bench_results.json')
+    parser.add_argument('--baseline', default=str(DEFAULT_BASELINE))
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Allowed relative increase over the baseline')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='Write the results to the baseline file')
+    parser.add_argument('--compare-fonts', action='store_true',
+                        help='Also run every case without font subsets and report the savings')
+    parser.add_argument('--no-font-subsets', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--run-case', help=argparse.SUPPRESS)
+    parser.add_argument('--endpoint', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        record = run_case(args.run_case, args.endpoint, args.repeat, not args.no_font_subsets)
+        print(json.dumps(record, ensure_ascii=False))
+        return 0
+
+    results = []
+    for name in args.cases or list(CASES):
+        for endpoint in args.endpoints:
+            result = _run_in_subprocess(name, endpoint, args.repeat)
+            results.append(result)
+            if result.get('error'):
+                print(f"{name:22} {endpoint:8} ERROR {result['error'].splitlines()[-1]}")
+                continue
+            print(f"{name:22} {endpoint:8} {result['pages']:3} page(s) "
+                  f"{result['wallMs']:10.1f} ms {result['peakRssMb'] or 0:8.1f} MB "
+                  f"{result['outputBytes']:>12,} bytes")
+            if args.compare_fonts:
+                _compare_fonts(result, _run_in_subprocess(name, endpoint, args.repeat, font_subsets=False))
+
+    report = {
+        'generatedAt': datetime.now().isoformat(),
+        'machine': machine_info(),
+        'repeat': args.repeat,
+        'compareFonts': args.compare_fonts,
+        'results': results
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f'Results written to {args.output}')
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f'Baseline saved to {args.baseline}')
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f'No baseline at {args.baseline}; run with --save-baseline to create one')
+        return 0
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    baseline_renderer = baseline.get('machine', {}).get('renderer')
+    if baseline_renderer != report['machine']['renderer']:
+        print(f"Baseline renderer: {baseline_renderer}; this run: {report['machine']['renderer']}. "
+              f"Nothing to compare; re-record with --save-baseline")
+    regressions = compare(results, baseline, args.threshold, report['machine'])
+    for regression in regressions:
+        print(f'REGRESSION {regression}')
+    if not regressions:
+        print(f'No regressions over {args.threshold:.0%} against {args.baseline}')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
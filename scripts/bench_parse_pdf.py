@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Character Clustering Benchmark for parse_pdf.py
+
+Times the per-character grouping (group_chars) against the NumPy one
+(group_chars_vectorized) on the PDFs in 'Reference document', and checks
+that both produce identical elements on every page. Characters are loaded
+before timing, so only the grouping is measured.
+
+Usage:
+    python scripts/bench_parse_pdf.py                     # all reference PDFs
+    python scripts/bench_parse_pdf.py path/to/a.pdf ...   # other PDFs
+    python scripts/bench_parse_pdf.py --repeat 20 -o parse_bench.json
+
+Exits with status 1 if the two paths disagree on any page.
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import pdfplumber
+
+from parse_pdf import blocks_to_elements, group_chars, group_chars_vectorized, np
+
+REFERENCE_DIR = Path(__file__).resolve().parent.parent / 'Reference document'
+
+
+def _best_ms(function, chars, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(chars)
+        timings.append((time.perf_counter() - start) * 1000)
+    return min(timings)
+
+
+def bench_file(pdf_path, repeat):
+    """Benchmark both groupings on every page of a PDF and return its record."""
+    record = {'file': Path(pdf_path).name, 'pages': 0, 'chars': 0, 'elements': 0,
+              'loopMs': 0.0, 'vectorizedMs': 0.0, 'identical': True}
+    with pdfplumber.open(pdf_path) as pdf:
+        for page_num, page in enumerate(pdf.pages):
+            chars = page.chars
+            expected = blocks_to_elements(group_chars(chars), page_num)
+            actual = blocks_to_elements(group_chars_vectorized(chars), page_num)
+            if json.dumps(expected, ensure_ascii=False) != json.dumps(actual, ensure_ascii=False):
+                record['identical'] = False
+            record['pages'] += 1
+            record['chars'] += len(chars)
+            record['elements'] += len(expected)
+            record['loopMs'] += _best_ms(group_chars, chars, repeat)
+            record['vectorizedMs'] += _best_ms(group_chars_vectorized, chars, repeat)
+            page.flush_cache()
+    record['loopMs'] = round(record['loopMs'], 3)
+    record['vectorizedMs'] = round(record['vectorizedMs'], 3)
+    record['speedup'] = round(record['loopMs'] / record['vectorizedMs'], 2) if record['vectorizedMs'] else None
+    return record
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare character grouping in parse_pdf.py')
+    parser.add_argument('pdfs', nargs='*', help='PDF files (default: the reference documents)')
+    parser.add_argument('--repeat', type=int, default=10, help='Runs per page (best is reported)')
+    parser.add_argument('--output', '-o', help='Write the results to a JSON file')
+    args = parser.parse_args()
+
+    if np is None:
+        print('NumPy is not installed; there is no vectorized path to compare')
+        return 1
+
+    pdfs = args.pdfs or sorted(str(path) for path in REFERENCE_DIR.glob('*.pdf'))
+    results = []
+    for pdf_path in pdfs:
+        record = bench_file(pdf_path, args.repeat)
+        results.append(record)
+        status = 'identical' if record['identical'] else 'MISMATCH'
+        print(f"{record['file']:24} {record['pages']:3} page(s) {record['chars']:7} chars "
+              f"{record['loopMs']:9.2f} ms loop {record['vectorizedMs']:9.2f} ms vectorized "
+              f"x{record['speedup']} {status}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'repeat': args.repeat, 'results': results}, f, ensure_ascii=False, indent=2)
+        print(f'Results written to {args.output}')
+    return 0 if all(record['identical'] for record in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,329 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Batch Template Extraction for Reliability Test Report Automation Tool
+
+Runs parse_pdf.py over a directory or glob of reference PDFs and writes one
+template JSON per input. A manifest in the output directory records the
+SHA-256 of each input, PARSER_VERSION and the section header vocabulary it
+was parsed with; inputs that match their entry and whose template still
+exists are skipped. The rest are parsed in parallel, one file per worker
+process, and a summary of the time spent (hashing, parsing, wall time,
+time saved by the cache) is printed at the end.
+
+The reference documents of the built-in template types are written under
+the names the backend serves (general_template.json, general_en_template.json,
+huawei_template.json) with their vocabularies; any other PDF becomes
+<name>.json with the general vocabulary. src/templates (the default output
+directory) only receives the templates the app loads: other PDFs are
+skipped unless another directory is given with -o.
+
+Usage:
+    python scripts/extract_templates.py                        # Reference document -> src/templates
+    python scripts/extract_templates.py "Reference document/电子章盖章参考.pdf" -o out/
+    python scripts/extract_templates.py "reports/*.pdf" -o out/
+    python scripts/extract_templates.py reports/ --workers 4 --force
+    python scripts/extract_templates.py big/ -o out/ --stream  # bounded memory per file
+
+Exits with status 1 if any file fails to parse.
+"""
+
+import argparse
+import contextlib
+import glob
+import hashlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from parse_pdf import PARSER_VERSION, SECTION_VOCABULARIES, parse_pdf, parse_pdf_stream
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+REFERENCE_DIR = PROJECT_ROOT / 'Reference document'
+TEMPLATES_DIR = PROJECT_ROOT / 'src' / 'templates'
+
+# Reference document -> (template file, template type), as served by
+# backend/routes/template.py
+REFERENCE_TEMPLATES = {
+    '通用.pdf': ('general_template.json', 'general'),
+    '通用（英文）.pdf': ('general_en_template.json', 'general_en'),
+    'T客户.pdf': ('huawei_template.json', 'huawei')
+}
+
+# Cache manifest, kept in the output directory
+MANIFEST_NAME = '.template_cache.json'
+
+
+def _ms(start):
+    return round((time.perf_counter() - start) * 1000, 2)
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _vocabulary_digest(headers):
+    encoded = json.dumps(list(headers), ensure_ascii=False).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()[:16]
+
+
+def find_pdfs(patterns):
+    """
+    Expand directories, glob patterns and file paths into PDF paths.
+
+    Directories contribute the PDFs directly inside them. Paths are returned
+    sorted, each once.
+    """
+    found = {}
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            paths = [str(path) for path in Path(pattern).iterdir()]
+        elif glob.has_magic(pattern):
+            paths = glob.glob(pattern, recursive=True)
+        else:
+            paths = [pattern]
+        for path in paths:
+            if path.lower().endswith('.pdf') and os.path.isfile(path):
+                found.setdefault(os.path.realpath(path), path)
+    return sorted(found.values())
+
+
+def is_app_template(pdf_path):
+    """Whether a PDF is the reference document of a template the backend serves."""
+    return os.path.basename(pdf_path) in REFERENCE_TEMPLATES
+
+
+def plan_output(pdf_path, template_type=None):
+    """Return the (template file name, template type) of an input PDF."""
+    name = os.path.basename(pdf_path)
+    filename, default_type = REFERENCE_TEMPLATES.get(name, (Path(name).stem + '.json', 'general'))
+    return filename, template_type or default_type
+
+
+def load_manifest(path):
+    """Read the cache manifest; a missing or unreadable one is empty."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if isinstance(manifest.get('templates'), dict):
+            return manifest
+    except (OSError, ValueError, AttributeError):
+        pass
+    return {'templates': {}}
+
+
+def save_manifest(path, manifest):
+    directory = os.path.dirname(path) or '.'
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.', suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _extract_template(pdf_path, output_path, headers, stream):
+    """
+    Parse one PDF into a template (worker process entry point).
+
+    Returns:
+        Tuple of (element count, parse time in ms)
+    """
+    started = time.perf_counter()
+    # parse_pdf reports every page; keep the batch output readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        if stream:
+            elements = parse_pdf_stream(pdf_path, output_path, headers=headers)['elements']
+        else:
+            elements = len(parse_pdf(pdf_path, output_path, headers=headers)['allElements'])
+    return elements, _ms(started)
+
+
+def extract_templates(pdf_paths, output_dir, workers=None, template_type=None, force=False,
+                      stream=False):
+    """
+    Extract templates from PDFs, skipping those the cache manifest covers.
+
+    Args:
+        pdf_paths: Input PDF paths
+        output_dir: Directory of the template JSON files and the manifest
+        workers: Worker processes (default: one per CPU, at most one per file)
+        template_type: Section header vocabulary for every input (default:
+            per REFERENCE_TEMPLATES, else general)
+        force: Parse every input, whatever the manifest says
+        stream: Parse with parse_pdf_stream (bounded memory)
+
+    Returns:
+        Summary dictionary (files, timings and a record per input)
+
+    Raises:
+        ValueError: If two inputs would write the same template file
+    """
+    started = time.perf_counter()
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    manifest = load_manifest(manifest_path)
+    cached = manifest['templates']
+
+    # Plan: hash every input and compare it with its manifest entry
+    step = time.perf_counter()
+    records, pending, outputs = [], [], {}
+    for pdf_path in pdf_paths:
+        filename, file_type = plan_output(pdf_path, template_type)
+        if filename in outputs:
+            raise ValueError(f'{pdf_path} and {outputs[filename]} would both write {filename}')
+        outputs[filename] = pdf_path
+        headers = SECTION_VOCABULARIES[file_type]
+        record = {
+            'source': pdf_path,
+            'output': filename,
+            'templateType': file_type,
+            'sha256': _file_digest(pdf_path),
+            'parserVersion': PARSER_VERSION,
+            'vocabulary': _vocabulary_digest(headers)
+        }
+        entry = cached.get(filename) or {}
+        hit = (not force
+               and all(entry.get(key) == record[key] for key in ('sha256', 'parserVersion', 'vocabulary'))
+               and os.path.exists(os.path.join(output_dir, filename)))
+        if hit:
+            record.update(status='cached', elements=entry.get('elements'), parseMs=entry.get('parseMs'))
+        else:
+            record['status'] = 'pending'
+            pending.append((record, headers))
+        records.append(record)
+    hash_ms = _ms(step)
+
+    # Parse the files that changed, one per worker process
+    step = time.perf_counter()
+    workers = max(1, min(workers or os.cpu_count() or 1, len(pending) or 1))
+
+    def finish(record, result=None, error=None):
+        if error is not None:
+            record.update(status='failed', error=str(error))
+            cached.pop(record['output'], None)
+            return
+        record['elements'], record['parseMs'] = result
+        record['status'] = 'parsed'
+        cached[record['output']] = {
+            key: record[key] for key in ('source', 'templateType', 'sha256', 'parserVersion',
+                                         'vocabulary', 'elements', 'parseMs')
+        }
+
+    try:
+        if workers == 1:
+            for record, headers in pending:
+                try:
+                    result = _extract_template(record['source'], os.path.join(output_dir, record['output']),
+                                               headers, stream)
+                except Exception as e:
+                    finish(record, error=e)
+                else:
+                    finish(record, result)
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = {
+                    executor.submit(_extract_template, record['source'],
+                                    os.path.join(output_dir, record['output']), headers, stream): record
+                    for record, headers in pending
+                }
+                for future in as_completed(futures):
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        finish(futures[future], error=e)
+                    else:
+                        finish(futures[future], result)
+    finally:
+        # Keep the templates finished so far even if the batch is interrupted
+        save_manifest(manifest_path, manifest)
+    parse_wall_ms = _ms(step)
+
+    def total(status):
+        return round(sum(r['parseMs'] or 0 for r in records if r['status'] == status), 2)
+
+    return {
+        'files': len(records),
+        'parsed': sum(1 for r in records if r['status'] == 'parsed'),
+        'cached': sum(1 for r in records if r['status'] == 'cached'),
+        'failed': sum(1 for r in records if r['status'] == 'failed'),
+        'workers': workers,
+        'hashMs': hash_ms,
+        'parseMs': total('parsed'),
+        'parseWallMs': parse_wall_ms,
+        'savedMs': total('cached'),
+        'wallMs': _ms(started),
+        'manifest': manifest_path,
+        'results': records
+    }
+
+
+def print_summary(summary):
+    for record in summary['results']:
+        if record['status'] == 'failed':
+            detail = record['error']
+        else:
+            parse_ms = record['parseMs']
+            detail = f"{record['elements']} elements, " + (f'{parse_ms:.1f} ms' if parse_ms is not None else '? ms')
+        print(f"{record['status']:7} {record['source']} -> {record['output']} ({detail})")
+    print(f"\n{summary['files']} file(s): {summary['parsed']} parsed, {summary['cached']} cached, "
+          f"{summary['failed']} failed")
+    print(f"  Hashing: {summary['hashMs']:.1f} ms")
+    print(f"  Parsing: {summary['parseMs']:.1f} ms of work in {summary['parseWallMs']:.1f} ms "
+          f"with {summary['workers']} worker(s)")
+    print(f"  Saved by the cache: {summary['savedMs']:.1f} ms")
+    print(f"  Total: {summary['wallMs']:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Extract templates from reference PDFs, skipping '
+                                                 'files that have not changed')
+    parser.add_argument('inputs', nargs='*', help='PDF files, directories or glob patterns '
+                                                  '(default: Reference document)')
+    parser.add_argument('--output-dir', '-o', default=str(TEMPLATES_DIR),
+                        help='Directory of the template JSON files (default: src/templates)')
+    parser.add_argument('--workers', type=int, help='Worker processes (default: one per CPU)')
+    parser.add_argument('--template-type', choices=sorted(SECTION_VOCABULARIES),
+                        help='Section header vocabulary for every input (default: per reference '
+                             'document, else general)')
+    parser.add_argument('--force', action='store_true', help='Ignore the cache manifest')
+    parser.add_argument('--stream', action='store_true', help='Parse with bounded memory per file')
+    parser.add_argument('--json', metavar='FILE', help='Also write the summary to a JSON file')
+    args = parser.parse_args()
+
+    pdf_paths = find_pdfs(args.inputs or [str(REFERENCE_DIR)])
+    if os.path.realpath(args.output_dir) == os.path.realpath(TEMPLATES_DIR):
+        # Keep src/templates to what backend/routes/template.py serves
+        for pdf_path in pdf_paths:
+            if not is_app_template(pdf_path):
+                print(f'Skipped {pdf_path}: not a template the app loads (use -o DIR to extract it)')
+        pdf_paths = [pdf_path for pdf_path in pdf_paths if is_app_template(pdf_path)]
+    if not pdf_paths:
+        print('No PDF files found')
+        return 1
+
+    try:
+        summary = extract_templates(pdf_paths, args.output_dir, workers=args.workers,
+                                    template_type=args.template_type, force=args.force,
+                                    stream=args.stream)
+    except ValueError as e:
+        print(f'Error: {e}')
+        return 1
+    print_summary(summary)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        print(f'Summary written to {args.json}')
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
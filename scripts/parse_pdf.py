@@ -5,13 +5,83 @@ PDF Parser Script for Reliability Test Report Automation Tool
 
 This script extracts text content, positions, colors, and font sizes from the
 '通用.pdf' template file to generate a JSON template for the web application.
+
+Usage:
+    python scripts/parse_pdf.py                              # 通用.pdf -> general_template.json
+    python scripts/parse_pdf.py other.pdf -o other.json      # another reference PDF
+    python scripts/parse_pdf.py large.pdf -o out.json --workers 4
+    python scripts/parse_pdf.py large.pdf -o out.json --stream   # bounded memory
+    python scripts/parse_pdf.py "Reference document/T客户.pdf" -o huawei.json --template-type huawei
 """
 
+import argparse
 import json
 import os
+import tempfile
 import pdfplumber
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from operator import itemgetter
 from pathlib import Path
 
+try:
+    import numpy as np
+except ImportError:  # Optional dependency
+    np = None
+
+# Bump when the same PDF would give a different template (invalidates the
+# templates cached by scripts/extract_templates.py)
+PARSER_VERSION = '1'
+
+# Characters join a block while on its line, in its style and close enough
+LINE_TOLERANCE = 3  # Max distance from the block's top
+SIZE_TOLERANCE = 0.5  # Max font size difference from the block's first char
+HORIZONTAL_GAP = 15  # Max gap between characters in same block
+
+# Character attributes loaded into arrays by the vectorized grouping
+_CHAR_ATTRIBUTES = itemgetter('top', 'x0', 'x1', 'size')
+
+# Thresholds for header/footer detection (in points)
+HEADER_HEIGHT = 80  # Top 80 points is header
+FOOTER_HEIGHT = 120  # Bottom 120 points is footer
+
+# Common section headers in the template
+SECTION_HEADERS = [
+    '测试结果信息', '测试图片', '测试条件', '测试结论',
+    '产品信息', '测试目的', '测试标准', '测试设备',
+    'Test Results', 'Test Images', 'Test Conditions'
+]
+
+# Section headers of each template type (see backend/routes/template.py);
+# huawei is the layout of the T客户 reference document. Element texts have
+# no whitespace (blank characters are dropped while grouping), so neither
+# do these headers
+SECTION_VOCABULARIES = {
+    'general': SECTION_HEADERS,
+    'general_en': SECTION_HEADERS + [
+        '样品信息', '设备信息', '测试描述',
+        'Sampleinformation', 'Equipmentinformation', 'TestPurpose',
+        'TestingDescription', 'Testresultinformation', 'TestPicture'
+    ],
+    'huawei': [
+        '测试参数', '试验条件', '测试结论', '备注说明', '测试数据记录',
+        '测试设备图片', '测试前检查图片', '测试中图片', '测试后检查图片'
+    ]
+}
+
+# Height of the bands of the per-page y-band grid (in points)
+BAND_HEIGHT = 20
+
+# Keys of a text element, in output order; workers send elements as tuples
+ELEMENT_FIELDS = ('text', 'x', 'y', 'width', 'fontSize', 'fontName', 'color', 'editable', 'page')
+
+# Page ranges handed out per worker, so that uneven pages balance out
+RANGES_PER_WORKER = 4
+
+# Pages read per opening of the PDF in stream mode: pdfplumber's document
+# caches keep growing with every page read from one opened file
+STREAM_PAGE_BATCH = 8
+
 
 def rgb_to_color_name(rgb):
     """
@@ -46,28 +116,40 @@ def rgb_to_color_name(rgb):
     return 'black'
 
 
-def extract_text_elements(page, page_num):
+class _ColorCodes(dict):
+    """Colour -> 1 if blue, 0 otherwise; memoizes rgb_to_color_name."""
+
+    def __missing__(self, color):
+        code = self[color] = int(rgb_to_color_name(color) == 'blue')
+        return code
+
+
+def _round_half_safe(values, ndigits):
     """
-    Extract all text elements from a PDF page with their properties.
+    Round an array like Python's round() does each element.
+    
+    NumPy scales, rounds and divides, which can land on the other side of a
+    tie than Python's correctly rounded result; values within a hair of a
+    tie are rounded with round() instead.
+    """
+    scaled = values * 10 ** ndigits
+    rounded = np.round(values, ndigits)
+    near_tie = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    for index in np.flatnonzero(near_tie):
+        rounded[index] = round(float(values[index]), ndigits)
+    return rounded
+
+
+def group_chars(chars):
+    """
+    Group characters into text blocks, one character at a time.
     
     Args:
-        page: pdfplumber page object
-        page_num: Page number (0-indexed)
+        chars: pdfplumber character dictionaries of a page
         
     Returns:
-        List of text element dictionaries
+        List of block dictionaries (chars, top, x0, fontname, size, color)
     """
-    elements = []
-    chars = page.chars
-    
-    # Group characters by their approximate position to form text blocks
-    current_text = ""
-    current_x = None
-    current_y = None
-    current_size = None
-    current_color = None
-    current_top = None
-    
     # Sort chars by top (y position) then by x position
     sorted_chars = sorted(chars, key=lambda c: (round(c['top'], 1), c['x0']))
     
@@ -91,16 +173,15 @@ def extract_text_elements(page, page_num):
         
         # Check if this char belongs to the current block
         same_line = (current_block['top'] is None or 
-                     abs(char_top - current_block['top']) < 3)
+                     abs(char_top - current_block['top']) < LINE_TOLERANCE)
         same_style = (current_block['size'] is None or 
-                      (abs(char_size - current_block['size']) < 0.5 and
+                      (abs(char_size - current_block['size']) < SIZE_TOLERANCE and
                        rgb_to_color_name(char_color) == rgb_to_color_name(current_block['color'])))
         
         # Check horizontal continuity
-        horizontal_gap = 15  # Max gap between characters in same block
         if current_block['chars']:
             last_char = current_block['chars'][-1]
-            too_far = char['x0'] - last_char['x1'] > horizontal_gap
+            too_far = char['x0'] - last_char['x1'] > HORIZONTAL_GAP
         else:
             too_far = False
         
@@ -129,7 +210,107 @@ def extract_text_elements(page, page_num):
     if current_block['chars']:
         text_blocks.append(current_block)
     
-    # Convert blocks to elements
+    return text_blocks
+
+
+def group_chars_vectorized(chars):
+    """
+    Group characters into text blocks with NumPy array operations.
+    
+    Produces exactly the blocks of group_chars. The character attributes are
+    loaded into arrays once and gaps, line, size and colour changes between
+    neighbouring characters are computed for the whole page; only the
+    characters where something changes are then compared with their block's
+    first character.
+    
+    Args:
+        chars: pdfplumber character dictionaries of a page
+        
+    Returns:
+        List of block dictionaries (chars, top, x0, fontname, size, color)
+    """
+    kept = [c for c in chars if c['text'].strip() != '']
+    count = len(kept)
+    if count == 0:
+        return []
+    try:
+        attributes = np.array(list(map(_CHAR_ATTRIBUTES, kept)), dtype=float)
+    except (KeyError, TypeError, ValueError):
+        # Missing or non-numeric sizes: keep the exact per-character rules
+        return group_chars(chars)
+    if np.isnan(attributes).any():
+        # None converts to NaN without raising (e.g. size=None, which
+        # group_chars treats as 11)
+        return group_chars(chars)
+    
+    # Same order as group_chars: rounded top, then x0 (both sorts are stable)
+    top = _round_half_safe(attributes[:, 0], 1)
+    order = np.lexsort((attributes[:, 1], top))
+    kept = [kept[i] for i in order]
+    attributes = attributes[order]
+    top = top[order]
+    x0, x1 = attributes[:, 1], attributes[:, 2]
+    size = np.where(attributes[:, 3] != 0, _round_half_safe(attributes[:, 3], 1), 11)
+    colors = [c.get('non_stroking_color') or c.get('stroking_color') for c in kept]
+    codes = _ColorCodes()
+    blue = np.array([codes[tuple(color) if isinstance(color, list) else color] for color in colors],
+                    dtype=np.int8)
+    
+    # Only a character that differs from its predecessor (gap, line, size
+    # or colour) can start a block: one identical to the previous character
+    # matches that character's block as well
+    gap = np.empty(count, dtype=bool)
+    gap[0] = False
+    gap[1:] = x0[1:] - x1[:-1] > HORIZONTAL_GAP
+    changed = gap.copy()
+    changed[1:] |= (top[1:] != top[:-1]) | (size[1:] != size[:-1]) | (blue[1:] != blue[:-1])
+    candidates = np.flatnonzero(changed).tolist()
+    
+    # Compare the candidates with the first character of their block, with
+    # the same float arithmetic as group_chars
+    top_values = top.tolist()
+    # Keep the int default of group_chars for characters without a size
+    size_values = [value if raw else 11 for value, raw in zip(size.tolist(), attributes[:, 3].tolist())]
+    blue_values = blue.tolist()
+    gap_values = gap.tolist()
+    starts = [0]
+    anchor = 0
+    for index in candidates:
+        if (gap_values[index]
+                or not abs(top_values[index] - top_values[anchor]) < LINE_TOLERANCE
+                or not abs(size_values[index] - size_values[anchor]) < SIZE_TOLERANCE
+                or blue_values[index] != blue_values[anchor]):
+            starts.append(index)
+            anchor = index
+    starts.append(count)
+    
+    text_blocks = []
+    for start, end in zip(starts, starts[1:]):
+        first = kept[start]
+        text_blocks.append({
+            'chars': kept[start:end],
+            'top': top_values[start],
+            'x0': first['x0'],
+            'fontname': first.get('fontname', ''),
+            'size': size_values[start],
+            'color': colors[start]
+        })
+    
+    return text_blocks
+
+
+def blocks_to_elements(text_blocks, page_num):
+    """
+    Convert text blocks to element dictionaries.
+    
+    Args:
+        text_blocks: Blocks from group_chars or group_chars_vectorized
+        page_num: Page number (0-indexed)
+        
+    Returns:
+        List of text element dictionaries
+    """
+    elements = []
     for block in text_blocks:
         if not block['chars']:
             continue
@@ -157,68 +338,204 @@ def extract_text_elements(page, page_num):
     return elements
 
 
-def identify_sections(elements, page_height):
+def extract_text_elements(page, page_num, vectorized=None):
+    """
+    Extract all text elements from a PDF page with their properties.
+    
+    Args:
+        page: pdfplumber page object
+        page_num: Page number (0-indexed)
+        vectorized: Group characters with NumPy (default: when NumPy is
+            installed); both paths give identical elements
+        
+    Returns:
+        List of text element dictionaries
+    """
+    if vectorized is None:
+        vectorized = np is not None
+    group = group_chars_vectorized if vectorized else group_chars
+    return blocks_to_elements(group(page.chars), page_num)
+
+
+class HeaderMatcher:
+    """
+    Aho-Corasick automaton over a section header vocabulary.
+    
+    Tells whether a text contains any of the headers in a single pass over
+    the text, however many headers there are; the same test as
+    any(header in text for header in headers).
+    """
+    
+    def __init__(self, headers):
+        self.headers = tuple(headers)
+        goto = [{}]  # state -> character -> next state
+        fail = [0]  # state -> state of its longest proper suffix
+        accepts = [False]  # state -> whether a header ends here
+        for header in self.headers:
+            state = 0
+            for char in header:
+                following = goto[state].get(char)
+                if following is None:
+                    following = goto[state][char] = len(goto)
+                    goto.append({})
+                    fail.append(0)
+                    accepts.append(False)
+                state = following
+            accepts[state] = True
+        
+        # Breadth-first, so the failure state of a parent is set first
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, following in goto[state].items():
+                queue.append(following)
+                suffix = fail[state]
+                while suffix and char not in goto[suffix]:
+                    suffix = fail[suffix]
+                fail[following] = goto[suffix].get(char, 0)
+                accepts[following] = accepts[following] or accepts[fail[following]]
+        
+        self._goto = goto
+        self._fail = fail
+        self._accepts = accepts
+    
+    def matches(self, text):
+        """Return whether text contains one of the headers."""
+        goto, fail, accepts = self._goto, self._fail, self._accepts
+        state = 0
+        if accepts[0]:
+            return True  # an empty header is in every text
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if accepts[state]:
+                return True
+        return False
+
+
+_DEFAULT_MATCHER = HeaderMatcher(SECTION_HEADERS)
+
+
+def is_section_header(text, matcher=None):
+    """Return whether a (stripped) element text contains a section header."""
+    return (matcher or _DEFAULT_MATCHER).matches(text)
+
+
+class PageIndex:
+    """
+    Grid of text elements by page and horizontal band of the page.
+    
+    Whole bands above or below a threshold are classified at once; only the
+    band a threshold cuts through is looked at element by element. Sorting
+    by position only sorts within each band.
+    """
+    
+    def __init__(self, elements, band_height=BAND_HEIGHT):
+        self.elements = elements
+        self.band_height = band_height
+        self._pages = {}  # page -> band -> element indices, in element order
+        for index, elem in enumerate(elements):
+            bands = self._pages.setdefault(elem['page'], {})
+            bands.setdefault(self._band(elem['y']), []).append(index)
+    
+    def _band(self, y):
+        return int(y // self.band_height)
+    
+    def classify(self, header_threshold, footer_threshold):
+        """
+        Label the elements as in a header, footer or content area.
+        
+        Args:
+            header_threshold: Elements above this y are in the header
+            footer_threshold: Elements below this y (and not in the
+                header) are in the footer
+            
+        Returns:
+            List of 'header', 'footer' or 'content', in element order
+        """
+        labels = ['content'] * len(self.elements)
+        header_band = self._band(header_threshold)
+        footer_band = self._band(footer_threshold)
+        for bands in self._pages.values():
+            for band, indexes in bands.items():
+                if band < header_band:
+                    for index in indexes:
+                        labels[index] = 'header'
+                elif band == header_band or band == footer_band:
+                    for index in indexes:
+                        y = self.elements[index]['y']
+                        if y < header_threshold:
+                            labels[index] = 'header'
+                        elif y > footer_threshold:
+                            labels[index] = 'footer'
+                elif band > footer_band:
+                    for index in indexes:
+                        labels[index] = 'footer'
+        return labels
+    
+    def ordered(self):
+        """Return the elements of all pages sorted by (y, x), ties in element order."""
+        rows = {}
+        for bands in self._pages.values():
+            for band, indexes in bands.items():
+                rows.setdefault(band, []).extend(indexes)
+        elements = self.elements
+        result = []
+        for band in sorted(rows):
+            row = [elements[index] for index in sorted(rows[band])]
+            row.sort(key=lambda e: (e['y'], e['x']))
+            result.extend(row)
+        return result
+
+
+def identify_sections(elements, page_height, index=None):
     """
     Identify header, footer, and content sections from elements.
     
     Args:
         elements: List of text elements
         page_height: Height of the PDF page
+        index: PageIndex of the elements (built if not given)
         
     Returns:
         Dictionary with header, footer, and sections
     """
-    # Thresholds for header/footer detection (in points)
-    header_threshold = 80  # Top 80 points is header
-    footer_threshold = page_height - 120  # Bottom 120 points is footer
-    
-    header_elements = []
-    footer_elements = []
-    content_elements = []
-    
-    for elem in elements:
-        if elem['y'] < header_threshold:
-            header_elements.append(elem)
-        elif elem['y'] > footer_threshold:
-            footer_elements.append(elem)
-        else:
-            content_elements.append(elem)
+    header_threshold = HEADER_HEIGHT
+    footer_threshold = page_height - FOOTER_HEIGHT
     
-    return {
-        'header': header_elements,
-        'footer': footer_elements,
-        'content': content_elements
-    }
+    if index is None:
+        index = PageIndex(elements)
+    areas = {'header': [], 'footer': [], 'content': []}
+    for elem, label in zip(elements, index.classify(header_threshold, footer_threshold)):
+        areas[label].append(elem)
+    
+    return areas
 
 
-def group_into_logical_sections(content_elements):
+def group_into_logical_sections(content_elements, matcher=None):
     """
     Group content elements into logical sections based on their layout.
     
     Args:
         content_elements: List of content text elements
+        matcher: HeaderMatcher of the section headers (default:
+            SECTION_HEADERS)
         
     Returns:
         List of section dictionaries
     """
     # Sort by Y position
-    sorted_elements = sorted(content_elements, key=lambda e: (e['y'], e['x']))
+    sorted_elements = PageIndex(content_elements).ordered()
     
     sections = []
     current_section = None
     
-    # Common section headers in the template
-    section_headers = [
-        '测试结果信息', '测试图片', '测试条件', '测试结论',
-        '产品信息', '测试目的', '测试标准', '测试设备',
-        'Test Results', 'Test Images', 'Test Conditions'
-    ]
-    
     for elem in sorted_elements:
         text = elem['text'].strip()
         
         # Check if this is a section header
-        is_header = any(header in text for header in section_headers)
+        is_header = is_section_header(text, matcher)
         
         if is_header or current_section is None:
             if current_section is not None:
@@ -237,85 +554,331 @@ def group_into_logical_sections(content_elements):
     return sections
 
 
-def parse_pdf(pdf_path, output_path):
+def _parse_page_range(pdf_path, start, stop):
+    """
+    Extract the elements of a range of pages (worker process entry point).
+    
+    The worker opens the PDF itself and releases each page's cached objects
+    after extraction.
+    
+    Returns:
+        List with one list of element tuples (ELEMENT_FIELDS order) per page
+    """
+    pages = []
+    with pdfplumber.open(pdf_path, pages=list(range(start + 1, stop + 1))) as pdf:
+        for page_num, page in zip(range(start, stop), pdf.pages):
+            elements = extract_text_elements(page, page_num)
+            pages.append([tuple(element[key] for key in ELEMENT_FIELDS) for element in elements])
+            page.close()
+    return pages
+
+
+def _page_ranges(page_count, workers, max_pages=None):
+    """Split pages into contiguous (start, stop) ranges for the workers."""
+    chunks = min(page_count, workers * RANGES_PER_WORKER)
+    if max_pages:
+        chunks = max(chunks, -(-page_count // max_pages))
+    bounds = [page_count * index // chunks for index in range(chunks + 1)]
+    return [(bounds[index], bounds[index + 1]) for index in range(chunks)]
+
+
+def _iter_serial(pdf_path, page_count, batch_pages=None):
+    batch_pages = batch_pages or page_count
+    for start in range(0, page_count, batch_pages):
+        stop = min(start + batch_pages, page_count)
+        with pdfplumber.open(pdf_path, pages=list(range(start + 1, stop + 1))) as pdf:
+            for page_num, page in zip(range(start, stop), pdf.pages):
+                yield extract_text_elements(page, page_num)
+                # Drop the page's cached chars and objects once extracted
+                page.close()
+
+
+def _iter_parallel(pdf_path, page_count, workers, batch_pages=None):
+    ranges = _page_ranges(page_count, workers, batch_pages)
+    with ProcessPoolExecutor(max_workers=min(workers, len(ranges))) as executor:
+        # map() yields in submission order, so pages stay in order
+        for range_pages in executor.map(_parse_page_range, [pdf_path] * len(ranges),
+                                        *zip(*ranges)):
+            for page in range_pages:
+                yield [dict(zip(ELEMENT_FIELDS, values)) for values in page]
+
+
+def iter_pages(pdf_path, workers=1, batch_pages=None):
+    """
+    Extract the text elements of every page lazily, in page order.
+    
+    Args:
+        pdf_path: Path to the PDF file
+        workers: Number of worker processes; 1 parses in this process
+        batch_pages: Reopen the PDF after this many pages to bound memory
+            (default: read the whole document from one opened file)
+        
+    Returns:
+        Tuple of (page size dictionary, page count, iterator over the
+        element list of each page)
+    """
+    with pdfplumber.open(pdf_path) as pdf:
+        first = pdf.pages[0]
+        page_info = {
+            'width': round(first.width, 2),
+            'height': round(first.height, 2)
+        }
+        page_count = len(pdf.pages)
+    if workers <= 1 or page_count < 2:
+        return page_info, page_count, _iter_serial(pdf_path, page_count, batch_pages)
+    return page_info, page_count, _iter_parallel(pdf_path, page_count, workers, batch_pages)
+
+
+def extract_pages(pdf_path, workers=1):
+    """
+    Extract the text elements of every page, in page order.
+    
+    Args:
+        pdf_path: Path to the PDF file
+        workers: Number of worker processes; 1 parses in this process
+        
+    Returns:
+        Tuple of (page size dictionary, list of element lists per page)
+    """
+    page_info, _, pages = iter_pages(pdf_path, workers)
+    return page_info, list(pages)
+
+
+def parse_pdf(pdf_path, output_path, workers=1, headers=None):
     """
     Parse a PDF file and extract template data.
     
     Args:
         pdf_path: Path to the PDF file
         output_path: Path to save the JSON output
+        workers: Number of worker processes parsing page ranges; the output
+            is the same as with 1 (serial)
+        headers: Section header vocabulary (default: SECTION_HEADERS)
     """
     print(f"Parsing PDF: {pdf_path}")
     
-    with pdfplumber.open(pdf_path) as pdf:
-        all_elements = []
-        page_info = None
+    page_info, pages = extract_pages(pdf_path, workers)
+    all_elements = []
+    for page_num, elements in enumerate(pages):
+        all_elements.extend(elements)
+        print(f"  Page {page_num + 1}: Found {len(elements)} text elements")
+    
+    # Identify sections
+    sections_data = identify_sections(all_elements, page_info['height'])
+    
+    # Group content into logical sections
+    matcher = HeaderMatcher(headers) if headers is not None else None
+    logical_sections = group_into_logical_sections(sections_data['content'], matcher)
+    
+    # Build output structure
+    output = {
+        'pageSize': page_info,
+        'totalPages': len(pages),
+        'header': {
+            'elements': sections_data['header'],
+            'height': HEADER_HEIGHT
+        },
+        'footer': {
+            'elements': sections_data['footer'],
+            'height': FOOTER_HEIGHT
+        },
+        'sections': logical_sections,
+        'allElements': all_elements
+    }
+    
+    # Analyze font sizes for header/footer
+    if sections_data['header']:
+        header_sizes = [e['fontSize'] for e in sections_data['header']]
+        output['header']['defaultFontSize'] = max(header_sizes) if header_sizes else 14
+    
+    if sections_data['footer']:
+        footer_sizes = [e['fontSize'] for e in sections_data['footer']]
+        output['footer']['defaultFontSize'] = max(footer_sizes) if footer_sizes else 10
+    
+    # Create output directory if needed
+    if os.path.dirname(output_path):
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    
+    # Save to JSON
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(output, f, ensure_ascii=False, indent=2)
+    
+    editable_count = sum(1 for e in all_elements if e['editable'])
+    _print_summary(output_path, len(all_elements), len(sections_data['header']),
+                   len(sections_data['footer']), len(logical_sections), editable_count)
+    
+    return output
+
+
+def _print_summary(output_path, total, header_count, footer_count, section_count, editable_count):
+    print(f"\nTemplate data saved to: {output_path}")
+    print(f"Total elements: {total}")
+    print(f"  - Header elements: {header_count}")
+    print(f"  - Footer elements: {footer_count}")
+    print(f"  - Content sections: {section_count}")
+    
+    # Print summary of editable vs fixed fields
+    print(f"  - Editable fields (blue): {editable_count}")
+    print(f"  - Fixed fields (black): {total - editable_count}")
+
+
+class _LazyList:
+    """A JSON array written item by item from an iterable by _write_json."""
+    
+    def __init__(self, items):
+        self.items = items
+
+
+def _write_json(f, value, level=0):
+    """Write value exactly like json.dump(value, f, ensure_ascii=False, indent=2)."""
+    pad = '\n' + '  ' * (level + 1)
+    if isinstance(value, dict):
+        if not value:
+            f.write('{}')
+            return
+        separator = '{'
+        for key, item in value.items():
+            f.write(f'{separator}{pad}{json.dumps(key, ensure_ascii=False)}: ')
+            _write_json(f, item, level + 1)
+            separator = ','
+        f.write('\n' + '  ' * level + '}')
+    elif isinstance(value, (list, _LazyList)):
+        separator = '['
+        for item in value.items if isinstance(value, _LazyList) else value:
+            f.write(separator + pad)
+            _write_json(f, item, level + 1)
+            separator = ','
+        f.write('[]' if separator == '[' else '\n' + '  ' * level + ']')
+    else:
+        f.write(json.dumps(value, ensure_ascii=False))
+
+
+def _spooled_elements(spool_path, offsets):
+    """Read elements back from the JSON Lines spool at the given byte offsets."""
+    with open(spool_path, 'rb') as f:
+        for offset in offsets:
+            f.seek(offset)
+            yield json.loads(f.readline())
+
+
+def parse_pdf_stream(pdf_path, output_path, workers=1, headers=None, keep_elements=False):
+    """
+    Parse a PDF file with memory bounded by the largest page.
+    
+    Elements are appended to a temporary JSON Lines file as each page is
+    extracted; pages are released right away and the PDF is reopened every
+    STREAM_PAGE_BATCH pages. A second pass over that file collects only byte
+    offsets and sort keys, then writes the template JSON incrementally; it
+    is identical to the output of parse_pdf. The temporary file is removed
+    afterwards unless keep_elements is set.
+    
+    Args:
+        pdf_path: Path to the PDF file
+        output_path: Path to save the JSON output
+        workers: Number of worker processes parsing page ranges
+        headers: Section header vocabulary (default: SECTION_HEADERS)
+        keep_elements: Keep the elements as <output>.elements.jsonl
         
-        for page_num, page in enumerate(pdf.pages):
-            # Get page dimensions
-            if page_info is None:
-                page_info = {
-                    'width': round(page.width, 2),
-                    'height': round(page.height, 2)
-                }
-            
-            # Extract text elements
-            elements = extract_text_elements(page, page_num)
-            all_elements.extend(elements)
-            
-            print(f"  Page {page_num + 1}: Found {len(elements)} text elements")
+    Returns:
+        Summary dictionary (pageSize, totalPages, elements, elementsPath
+        (None unless kept), sample of the first 10 elements)
+    """
+    print(f"Parsing PDF: {pdf_path}")
+    
+    if os.path.dirname(output_path):
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    if keep_elements:
+        spool_path = str(Path(output_path).with_suffix('.elements.jsonl'))
+    else:
+        fd, spool_path = tempfile.mkstemp(prefix='parse_pdf-', suffix='.elements.jsonl')
+        os.close(fd)
+    
+    try:
+        # Pass 1: stream the elements of each page to JSON Lines
+        page_info, page_count, pages = iter_pages(pdf_path, workers, STREAM_PAGE_BATCH)
+        with open(spool_path, 'w', encoding='utf-8') as spool:
+            for page_num, elements in enumerate(pages):
+                for element in elements:
+                    spool.write(json.dumps(element, ensure_ascii=False, separators=(',', ':')) + '\n')
+                print(f"  Page {page_num + 1}: Found {len(elements)} text elements")
         
-        # Identify sections
-        sections_data = identify_sections(all_elements, page_info['height'])
+        # Pass 2: classify elements by offset; only compact keys stay in memory
+        matcher = HeaderMatcher(headers) if headers is not None else None
+        header_threshold = HEADER_HEIGHT
+        footer_threshold = page_info['height'] - FOOTER_HEIGHT
+        header_offsets, footer_offsets, content = [], [], []
+        header_size = footer_size = None
+        total = editable_count = 0
+        sample = []
+        with open(spool_path, 'rb') as f:
+            offset = 0
+            for line in f:
+                elem = json.loads(line)
+                total += 1
+                editable_count += elem['editable']
+                if len(sample) < 10:
+                    sample.append(elem)
+                if elem['y'] < header_threshold:
+                    header_offsets.append(offset)
+                    header_size = elem['fontSize'] if header_size is None else max(header_size, elem['fontSize'])
+                elif elem['y'] > footer_threshold:
+                    footer_offsets.append(offset)
+                    footer_size = elem['fontSize'] if footer_size is None else max(footer_size, elem['fontSize'])
+                else:
+                    content.append((elem['y'], elem['x'], offset, is_section_header(elem['text'].strip(), matcher)))
+                offset += len(line)
         
-        # Group content into logical sections
-        logical_sections = group_into_logical_sections(sections_data['content'])
+        # Same order as group_into_logical_sections (the sort is stable)
+        content.sort(key=itemgetter(0, 1))
+        starts = [index for index, key in enumerate(content) if key[3] or index == 0]
+        bounds = list(zip(starts, starts[1:] + [len(content)]))
         
-        # Build output structure
+        def sections():
+            for start, stop in bounds:
+                first = next(_spooled_elements(spool_path, [content[start][2]]))
+                yield {
+                    'name': first['text'].strip() if content[start][3] else 'General',
+                    'fields': _LazyList(_spooled_elements(spool_path, [key[2] for key in content[start:stop]])),
+                    'startY': first['y']
+                }
+        
+        def all_elements():
+            with open(spool_path, 'rb') as f:
+                for line in f:
+                    yield json.loads(line)
+        
+        header = {'elements': _LazyList(_spooled_elements(spool_path, header_offsets)), 'height': HEADER_HEIGHT}
+        if header_offsets:
+            header['defaultFontSize'] = header_size
+        footer = {'elements': _LazyList(_spooled_elements(spool_path, footer_offsets)), 'height': FOOTER_HEIGHT}
+        if footer_offsets:
+            footer['defaultFontSize'] = footer_size
         output = {
             'pageSize': page_info,
-            'totalPages': len(pdf.pages),
-            'header': {
-                'elements': sections_data['header'],
-                'height': 80
-            },
-            'footer': {
-                'elements': sections_data['footer'],
-                'height': 120
-            },
-            'sections': logical_sections,
-            'allElements': all_elements
+            'totalPages': page_count,
+            'header': header,
+            'footer': footer,
+            'sections': _LazyList(sections()),
+            'allElements': _LazyList(all_elements())
         }
-        
-        # Analyze font sizes for header/footer
-        if sections_data['header']:
-            header_sizes = [e['fontSize'] for e in sections_data['header']]
-            output['header']['defaultFontSize'] = max(header_sizes) if header_sizes else 14
-        
-        if sections_data['footer']:
-            footer_sizes = [e['fontSize'] for e in sections_data['footer']]
-            output['footer']['defaultFontSize'] = max(footer_sizes) if footer_sizes else 10
-        
-        # Create output directory if needed
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        
-        # Save to JSON
         with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(output, f, ensure_ascii=False, indent=2)
-        
-        print(f"\nTemplate data saved to: {output_path}")
-        print(f"Total elements: {len(all_elements)}")
-        print(f"  - Header elements: {len(sections_data['header'])}")
-        print(f"  - Footer elements: {len(sections_data['footer'])}")
-        print(f"  - Content sections: {len(logical_sections)}")
-        
-        # Print summary of editable vs fixed fields
-        editable_count = sum(1 for e in all_elements if e['editable'])
-        fixed_count = len(all_elements) - editable_count
-        print(f"  - Editable fields (blue): {editable_count}")
-        print(f"  - Fixed fields (black): {fixed_count}")
-        
-        return output
+            _write_json(f, output)
+    finally:
+        if not keep_elements:
+            os.unlink(spool_path)
+    
+    _print_summary(output_path, total, len(header_offsets), len(footer_offsets), len(bounds),
+                   editable_count)
+    if keep_elements:
+        print(f"Elements streamed to: {spool_path}")
+    
+    return {
+        'pageSize': page_info,
+        'totalPages': page_count,
+        'elements': total,
+        'elementsPath': spool_path if keep_elements else None,
+        'sample': sample
+    }
 
 
 def main():
@@ -324,22 +887,49 @@ def main():
     script_dir = Path(__file__).parent
     project_root = script_dir.parent
     
-    # Input PDF path
-    pdf_path = project_root / "Reference document" / "通用.pdf"
-    
-    # Output JSON path
-    output_path = project_root / "src" / "templates" / "general_template.json"
+    parser = argparse.ArgumentParser(description='Extract a report template from a reference PDF')
+    parser.add_argument('pdf', nargs='?',
+                        default=str(project_root / "Reference document" / "通用.pdf"),
+                        help='Input PDF (default: Reference document/通用.pdf)')
+    parser.add_argument('--output', '-o',
+                        default=str(project_root / "src" / "templates" / "general_template.json"),
+                        help='Output JSON (default: src/templates/general_template.json)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Worker processes parsing page ranges in parallel (default: 1)')
+    parser.add_argument('--stream', action='store_true',
+                        help='Bounded memory: stream elements to a temporary JSON Lines file, then '
+                             'write the template JSON from it')
+    parser.add_argument('--keep-elements', action='store_true',
+                        help='With --stream, keep that file as <output>.elements.jsonl')
+    parser.add_argument('--template-type', choices=sorted(SECTION_VOCABULARIES), default='general',
+                        help='Section header vocabulary to use (default: general)')
+    parser.add_argument('--section-headers', metavar='FILE',
+                        help='Read the section headers from a file, one per line, instead')
+    args = parser.parse_args()
     
+    pdf_path = Path(args.pdf)
     if not pdf_path.exists():
         print(f"Error: PDF file not found: {pdf_path}")
         return
     
+    headers = SECTION_VOCABULARIES[args.template_type]
+    if args.section_headers:
+        with open(args.section_headers, 'r', encoding='utf-8') as f:
+            headers = [line.strip() for line in f if line.strip()]
+    
     # Parse the PDF
-    template_data = parse_pdf(str(pdf_path), str(output_path))
+    if args.stream:
+        template_data = parse_pdf_stream(str(pdf_path), args.output, workers=args.workers,
+                                         headers=headers, keep_elements=args.keep_elements)
+        sample = template_data['sample']
+    else:
+        template_data = parse_pdf(str(pdf_path), args.output, workers=args.workers,
+                                  headers=headers)
+        sample = template_data['allElements'][:10]
     
     # Also print a sample of the extracted data
     print("\n--- Sample of extracted elements ---")
-    for i, elem in enumerate(template_data['allElements'][:10]):
+    for i, elem in enumerate(sample):
         color_indicator = "[EDITABLE]" if elem['editable'] else "[FIXED]"
         print(f"{color_indicator} {elem['text'][:50]}... (x={elem['x']}, y={elem['y']}, size={elem['fontSize']})")
 
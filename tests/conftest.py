@@ -0,0 +1,40 @@
+"""Shared fixtures; backend/ and scripts/ are importable as when the app and scripts run."""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+for directory in (ROOT / 'backend', ROOT / 'scripts'):
+    if str(directory) not in sys.path:
+        sys.path.insert(0, str(directory))
+
+REFERENCE_DIR = ROOT / 'Reference document'
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """An app on its own DATA_DIR whose autosaves are only flushed on demand."""
+    monkeypatch.setenv('DATA_DIR', str(tmp_path / 'data'))
+    monkeypatch.setenv('AUTOSAVE_FLUSH_INTERVAL', '60')
+    from app import create_app
+
+    app = create_app()
+    app.config['TESTING'] = True
+    yield app
+    app.extensions['autosave_writer'].close()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def reference_pdf():
+    """The general template's reference document."""
+    path = REFERENCE_DIR / '通用.pdf'
+    if not path.exists():
+        pytest.skip('Reference document not available')
+    return str(path)
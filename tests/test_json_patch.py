@@ -0,0 +1,168 @@
+"""JSON Patch application and the PATCH /api/report/drafts/<id> endpoint."""
+
+import copy
+
+import pytest
+
+from services.json_patch import JsonPatchError, apply_patch, parse_pointer
+
+
+@pytest.fixture
+def draft():
+    return {
+        'title': 'Report',
+        'content': {
+            'fields': {'sampleName': 'A', 'a/b': 1, 'm~n': 2},
+            'testResultRows': [{'id': 1, 'result': 'OK'}, {'id': 2, 'result': 'NG'}],
+            'testImageRows': [{'id': 1, 'before': []}]
+        }
+    }
+
+
+def test_parse_pointer_unescapes_tokens():
+    assert parse_pointer('') == []
+    assert parse_pointer('/content/a~1b/m~0n') == ['content', 'a/b', 'm~n']
+    with pytest.raises(JsonPatchError):
+        parse_pointer('content')
+
+
+@pytest.mark.parametrize('operation, check', [
+    ({'op': 'add', 'path': '/content/fields/tester', 'value': 'B'},
+     lambda d: d['content']['fields']['tester'] == 'B'),
+    ({'op': 'add', 'path': '/content/testResultRows/-', 'value': {'id': 3}},
+     lambda d: d['content']['testResultRows'][-1] == {'id': 3}),
+    ({'op': 'add', 'path': '/content/testResultRows/0', 'value': {'id': 0}},
+     lambda d: [row['id'] for row in d['content']['testResultRows']] == [0, 1, 2]),
+    ({'op': 'remove', 'path': '/content/testResultRows/0'},
+     lambda d: [row['id'] for row in d['content']['testResultRows']] == [2]),
+    ({'op': 'replace', 'path': '/content/testResultRows/1/result', 'value': 'OK'},
+     lambda d: d['content']['testResultRows'][1]['result'] == 'OK'),
+    ({'op': 'replace', 'path': '/content/fields/a~1b', 'value': 3},
+     lambda d: d['content']['fields']['a/b'] == 3),
+    ({'op': 'move', 'from': '/content/fields/sampleName', 'path': '/title'},
+     lambda d: d['title'] == 'A' and 'sampleName' not in d['content']['fields']),
+    ({'op': 'copy', 'from': '/content/testResultRows/0', 'path': '/content/testResultRows/-'},
+     lambda d: d['content']['testResultRows'][-1] == {'id': 1, 'result': 'OK'}),
+    ({'op': 'test', 'path': '/content/fields/m~0n', 'value': 2},
+     lambda d: d['content']['fields']['m~n'] == 2),
+])
+def test_operations(draft, operation, check):
+    assert check(apply_patch(draft, [operation]))
+
+
+def test_source_document_is_not_modified(draft):
+    original = copy.deepcopy(draft)
+    apply_patch(draft, [
+        {'op': 'replace', 'path': '/content/testResultRows/0/result', 'value': 'NG'},
+        {'op': 'remove', 'path': '/content/fields/sampleName'},
+        {'op': 'add', 'path': '/content/testImageRows/0/before/-', 'value': {'filename': 'x.jpg'}}
+    ])
+    assert draft == original
+
+
+def test_untouched_subtrees_are_shared(draft):
+    patched = apply_patch(draft, [
+        {'op': 'replace', 'path': '/content/testResultRows/0/result', 'value': 'NG'}
+    ])
+    # Path copying: only the containers along the modified path are new
+    assert patched['content'] is not draft['content']
+    assert patched['content']['testResultRows'][0] is not draft['content']['testResultRows'][0]
+    assert patched['content']['testResultRows'][1] is draft['content']['testResultRows'][1]
+    assert patched['content']['fields'] is draft['content']['fields']
+
+
+@pytest.mark.parametrize('operations', [
+    [{'op': 'test', 'path': '/title', 'value': 'Other'}],
+    [{'op': 'replace', 'path': '/content/missing', 'value': 1}],
+    [{'op': 'remove', 'path': '/content/testResultRows/5'}],
+    [{'op': 'move', 'from': '/content', 'path': '/content/fields/inner'}],
+    [{'op': 'add', 'path': '/title'}],
+    [{'op': 'rename', 'path': '/title', 'value': 'x'}],
+    {'op': 'add', 'path': '/title', 'value': 'x'},
+])
+def test_invalid_patches_raise(draft, operations):
+    with pytest.raises(JsonPatchError):
+        apply_patch(draft, operations)
+
+
+def test_failed_patch_applies_nothing(draft):
+    original = copy.deepcopy(draft)
+    with pytest.raises(JsonPatchError):
+        apply_patch(draft, [
+            {'op': 'replace', 'path': '/title', 'value': 'Changed'},
+            {'op': 'test', 'path': '/title', 'value': 'Report'}
+        ])
+    assert draft == original
+
+
+def _create_draft(client):
+    response = client.post('/api/report/drafts', json={
+        'title': 'Report',
+        'templateType': 'general',
+        'content': {'testResultRows': [{'id': 1, 'result': 'OK'}]}
+    })
+    assert response.status_code == 201
+    return response.get_json()['id']
+
+
+def _get_draft(client, draft_id):
+    response = client.get(f'/api/report/drafts/{draft_id}')
+    assert response.status_code == 200
+    body = response.get_json()
+    return body.get('draft', body)
+
+
+def test_patch_endpoint_applies_operations_and_bumps_the_version(app, client):
+    draft_id = _create_draft(client)
+    version = _get_draft(client, draft_id).get('version', 0)
+
+    response = client.patch(f'/api/report/drafts/{draft_id}', json={
+        'version': version,
+        'operations': [
+            {'op': 'replace', 'path': '/content/testResultRows/0/result', 'value': 'NG'},
+            {'op': 'replace', 'path': '/title', 'value': 'Patched'}
+        ]
+    })
+    assert response.status_code == 200
+    assert response.get_json()['version'] == version + 1
+
+    # Served from memory before the flush, and from disk after it
+    for _ in range(2):
+        draft = _get_draft(client, draft_id)
+        assert draft['title'] == 'Patched'
+        assert draft['content']['testResultRows'][0]['result'] == 'NG'
+        assert draft['version'] == version + 1
+        app.extensions['autosave_writer'].flush()
+        app.extensions['autosave_writer'].discard(draft_id)
+
+
+def test_patch_endpoint_rejects_stale_versions(client):
+    draft_id = _create_draft(client)
+    version = _get_draft(client, draft_id).get('version', 0)
+    operations = [{'op': 'replace', 'path': '/title', 'value': 'First'}]
+    assert client.patch(f'/api/report/drafts/{draft_id}',
+                        json={'version': version, 'operations': operations}).status_code == 200
+
+    response = client.patch(f'/api/report/drafts/{draft_id}',
+                            json={'version': version, 'operations': operations})
+    assert response.status_code == 409
+    assert response.get_json()['version'] == version + 1
+
+
+@pytest.mark.parametrize('operations, status', [
+    ([{'op': 'replace', 'path': '/version', 'value': 99}], 400),
+    ([{'op': 'replace', 'path': '/id', 'value': 'other'}], 400),
+    ([{'op': 'test', 'path': '/title', 'value': 'Other'}], 422),
+    ('not a list', 400),
+])
+def test_patch_endpoint_rejects_invalid_operations(client, operations, status):
+    draft_id = _create_draft(client)
+    version = _get_draft(client, draft_id).get('version', 0)
+    response = client.patch(f'/api/report/drafts/{draft_id}',
+                            json={'version': version, 'operations': operations})
+    assert response.status_code == status
+
+
+def test_patch_endpoint_unknown_draft(client):
+    response = client.patch('/api/report/drafts/missing', json={'version': 0, 'operations': []})
+    assert response.status_code == 404
@@ -0,0 +1,59 @@
+"""Splitting report HTML into pages and merging the page PDFs back together."""
+
+import pytest
+
+from services.page_preview import can_merge, merge_pdfs, split_pages
+
+HEAD = '<!DOCTYPE html><html><head><style>.page { width: 210mm; }</style></head><body><div class="report">'
+TAIL = '</div></body></html>'
+
+
+def _page(number, extra=''):
+    return (f'<div class="page{extra}"><h2>Page {number}</h2><div><img src="a.png"><br>'
+            f'<p>{number} &lt; 3</p></div></div>')
+
+
+def test_split_pages_keeps_the_skeleton_around_each_page():
+    pages = [_page(1), _page(2, ' landscape')]
+    html = HEAD + pages[0] + '<div style="page-break-after: always"></div>' + pages[1] + TAIL
+    assert split_pages(html) == [HEAD + page + TAIL for page in pages]
+
+
+def test_split_pages_accepts_a4_page_containers():
+    html = HEAD + '<section class="a4-page">1</section><section class="a4-page">2</section>' + TAIL
+    assert len(split_pages(html)) == 2
+
+
+@pytest.mark.parametrize('html', [
+    HEAD + _page(1) + TAIL,
+    HEAD + '<p>No pages</p>' + TAIL,
+    HEAD + '<div class="page"><div class="page">1</div><div class="page">2</div></div>' + TAIL,
+    HEAD + _page(1) + '<div class="page"><div>never closed',
+    '',
+])
+def test_split_pages_falls_back_to_the_whole_document(html):
+    assert split_pages(html) is None
+
+
+pypdf = pytest.importorskip('pypdf')
+
+
+def _blank_pdf(path, width):
+    writer = pypdf.PdfWriter()
+    writer.add_blank_page(width=width, height=842)
+    with open(path, 'wb') as f:
+        writer.write(f)
+    return str(path)
+
+
+def test_merge_pdfs_from_paths_and_files(tmp_path):
+    assert can_merge()
+    first = _blank_pdf(tmp_path / 'first.pdf', 595)
+    second = _blank_pdf(tmp_path / 'second.pdf', 842)
+    output = tmp_path / 'merged.pdf'
+
+    with open(second, 'rb') as second_file:
+        merge_pdfs([first, second_file], str(output))
+
+    widths = [round(float(page.mediabox.width)) for page in pypdf.PdfReader(str(output)).pages]
+    assert widths == [595, 842]
@@ -0,0 +1,58 @@
+"""parse_pdf gives the same template whichever way the characters are grouped and pages parsed."""
+
+import pytest
+
+pdfplumber = pytest.importorskip('pdfplumber')
+pytest.importorskip('numpy')
+
+import parse_pdf  # noqa: E402
+
+
+def test_vectorized_grouping_matches_loop(reference_pdf):
+    with pdfplumber.open(reference_pdf) as pdf:
+        for page in pdf.pages:
+            chars = page.chars
+            assert parse_pdf.group_chars_vectorized(chars) == parse_pdf.group_chars(chars)
+
+
+def test_grouping_without_chars():
+    assert parse_pdf.group_chars([]) == parse_pdf.group_chars_vectorized([]) == []
+
+
+@pytest.fixture
+def loop_output(reference_pdf, tmp_path, monkeypatch):
+    """Template bytes parsed serially with the pure Python grouping."""
+    with monkeypatch.context() as patch:
+        patch.setattr(parse_pdf, 'np', None)
+        output = tmp_path / 'loop.json'
+        parse_pdf.parse_pdf(reference_pdf, str(output), workers=1)
+    return output.read_bytes()
+
+
+@pytest.mark.parametrize('mode', ['vectorized', 'workers', 'stream', 'stream-workers'])
+def test_parse_modes_write_identical_templates(reference_pdf, tmp_path, loop_output, mode):
+    output = tmp_path / f'{mode}.json'
+    workers = 2 if mode.endswith('workers') else 1
+    if mode.startswith('stream'):
+        summary = parse_pdf.parse_pdf_stream(reference_pdf, str(output), workers=workers)
+        assert summary['elementsPath'] is None
+    else:
+        parse_pdf.parse_pdf(reference_pdf, str(output), workers=workers)
+    assert output.read_bytes() == loop_output
+
+
+@pytest.mark.parametrize('text', [
+    '', '测试', '测试项目', '样品信息及测试结果', 'Test Results', 'results', '1. 测试依据 GB/T 2423',
+    'Sample Information', 'sample information',
+])
+def test_header_matcher_matches_substring_search(text):
+    for headers in parse_pdf.SECTION_VOCABULARIES.values():
+        matcher = parse_pdf.HeaderMatcher(headers)
+        assert matcher.matches(text) == any(header in text for header in headers)
+
+
+def test_header_matcher_overlapping_headers():
+    matcher = parse_pdf.HeaderMatcher(['abcd', 'bc', 'cde'])
+    assert matcher.matches('xabcx')
+    assert matcher.matches('abcde')
+    assert not matcher.matches('abdce')
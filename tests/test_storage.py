@@ -0,0 +1,144 @@
+"""Storage formats, their migration and the draft catalog built from the stored files."""
+
+import json
+
+import pytest
+
+from services import storage
+from services.catalog import DraftCatalog
+
+DOCUMENT = {
+    'id': 'draft-1',
+    'title': '可靠性测试报告',
+    'content': {'rows': [{'id': i, 'result': 'OK'} for i in range(20)], 'note': None}
+}
+
+FORMATS = [
+    pytest.param(fmt, marks=pytest.mark.skipif(
+        fmt == 'zstd' and storage.zstandard is None, reason='zstandard not installed'))
+    for fmt in storage.STORAGE_FORMATS
+]
+
+
+@pytest.mark.parametrize('fmt', FORMATS)
+def test_round_trip(fmt):
+    raw = storage.dumps_document(DOCUMENT, fmt)
+    assert storage.detect_format(raw) == ('json' if fmt == 'json-pretty' else fmt)
+    assert storage.loads_document(raw) == DOCUMENT
+
+
+@pytest.mark.parametrize('fmt', FORMATS)
+def test_write_and_read_document(tmp_path, fmt):
+    path = tmp_path / 'draft-1.json'
+    storage.write_document(str(path), DOCUMENT, fmt)
+    assert storage.read_document(str(path)) == DOCUMENT
+    # Only the document is left behind, no temporary file
+    assert [p.name for p in tmp_path.iterdir()] == ['draft-1.json']
+
+
+def test_json_formats():
+    assert storage.dumps_document(DOCUMENT, 'json-pretty') == (
+        json.dumps(DOCUMENT, ensure_ascii=False, indent=2).encode('utf-8'))
+    assert b' ' not in storage.dumps_document({'a': [1, 2]}, 'json')
+    # Deterministic, so unchanged documents are not rewritten by a migration
+    assert storage.dumps_document(DOCUMENT, 'gzip') == storage.dumps_document(DOCUMENT, 'gzip')
+
+
+def test_unknown_format():
+    with pytest.raises(ValueError):
+        storage.dumps_document(DOCUMENT, 'bson')
+
+
+def test_zstd_without_zstandard(monkeypatch):
+    monkeypatch.setattr(storage, 'zstandard', None)
+    with pytest.raises(RuntimeError):
+        storage.dumps_document(DOCUMENT, 'zstd')
+    with pytest.raises(RuntimeError):
+        storage.loads_document(storage.ZSTD_MAGIC + b'\x00')
+
+
+def test_migrate_directory(tmp_path):
+    for i in range(3):
+        storage.write_document(str(tmp_path / f'{i}.json'), dict(DOCUMENT, id=str(i)), 'json-pretty')
+    (tmp_path / 'broken.json').write_bytes(b'{not json')
+    (tmp_path / 'notes.txt').write_text('ignored')
+
+    dry_run = storage.migrate_directory(str(tmp_path), 'gzip', dry_run=True)
+    assert (dry_run['files'], dry_run['converted'], dry_run['errors']) == (3, 0, 1)
+    assert dry_run['bytesAfter'] < dry_run['bytesBefore']
+    assert storage.detect_format((tmp_path / '0.json').read_bytes()) == 'json'
+
+    stats = storage.migrate_directory(str(tmp_path), 'gzip')
+    assert (stats['files'], stats['converted'], stats['errors']) == (3, 3, 1)
+    for i in range(3):
+        raw = (tmp_path / f'{i}.json').read_bytes()
+        assert storage.detect_format(raw) == 'gzip'
+        assert storage.loads_document(raw) == dict(DOCUMENT, id=str(i))
+
+    # Already in the target format: nothing to rewrite
+    assert storage.migrate_directory(str(tmp_path), 'gzip')['converted'] == 0
+
+
+def test_migrate_missing_directory(tmp_path):
+    assert storage.migrate_directory(str(tmp_path / 'missing'), 'json')['files'] == 0
+
+
+def _draft(draft_id, updated_at, title=None):
+    return {
+        'id': draft_id,
+        'title': title or draft_id,
+        'templateType': 'general',
+        'createdAt': '2024-01-01T00:00:00',
+        'updatedAt': updated_at
+    }
+
+
+@pytest.fixture
+def drafts_dir(tmp_path):
+    directory = tmp_path / 'drafts'
+    directory.mkdir()
+    storage.write_document(str(directory / 'a.json'), _draft('a', '2024-01-02T00:00:00'), 'json')
+    storage.write_document(str(directory / 'b.json'), _draft('b', '2024-01-03T00:00:00'), 'gzip')
+    return directory
+
+
+def test_catalog_indexes_every_format_newest_first(tmp_path, drafts_dir):
+    catalog = DraftCatalog(str(tmp_path / 'catalog.db'), str(drafts_dir))
+    assert [d['id'] for d in catalog.list()] == ['b', 'a']
+    assert catalog.get('a') == {'createdAt': '2024-01-01T00:00:00', 'version': 0}
+    assert catalog.get('missing') is None
+
+
+def test_catalog_rebuild_picks_up_changes_on_disk(tmp_path, drafts_dir):
+    catalog = DraftCatalog(str(tmp_path / 'catalog.db'), str(drafts_dir))
+    assert len(catalog.list()) == 2
+
+    storage.write_document(str(drafts_dir / 'c.json'), _draft('c', '2024-01-01T00:00:00'), 'json')
+    (drafts_dir / 'a.json').unlink()
+    (drafts_dir / 'broken.json').write_bytes(b'{not json')
+    assert [d['id'] for d in catalog.list()] == ['b', 'a']
+
+    assert catalog.rebuild() == 2
+    assert [d['id'] for d in catalog.list()] == ['b', 'c']
+
+    # A new catalog on the same database reuses the index
+    assert [d['id'] for d in DraftCatalog(str(tmp_path / 'catalog.db'), str(drafts_dir)).list()] == ['b', 'c']
+
+
+def test_catalog_upsert_and_remove(tmp_path, drafts_dir):
+    catalog = DraftCatalog(str(tmp_path / 'catalog.db'), str(drafts_dir))
+    catalog.upsert(_draft('a', '2024-01-04T00:00:00', title='Renamed'))
+    catalog.remove('b')
+    assert [(d['id'], d['title']) for d in catalog.list()] == [('a', 'Renamed')]
+
+
+def test_catalog_lists_unsaved_drafts(tmp_path, drafts_dir):
+    catalog = DraftCatalog(str(tmp_path / 'catalog.db'), str(drafts_dir))
+    unsaved = {
+        'a': _draft('a', '2024-01-05T00:00:00', title='Edited'),
+        'new': _draft('new', '2024-01-04T00:00:00')
+    }
+    assert [(d['id'], d['title']) for d in catalog.list(unsaved)] == [
+        ('a', 'Edited'), ('new', 'new'), ('b', 'b')]
+    # The index itself is unchanged
+    assert [d['id'] for d in catalog.list()] == ['b', 'a']